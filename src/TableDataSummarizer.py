@@ -1,35 +1,49 @@
 import logging
+import threading
 import pandas as pd
+from concurrent.futures import ThreadPoolExecutor
 
 class TableDataSummarizer:
     """
     Este agente construye un resumen con datos de ejemplo
-    de cada tabla, para que el LLM tenga contexto real 
+    de cada tabla, para que el LLM tenga contexto real
     y entienda mejor el significado de columnas y posibles valores.
+    Las muestras se leen en paralelo y se guardan por tabla mientras
+    su huella (esquema + UPDATE_TIME) no cambie.
     """
-    def __init__(self, schema_agent, get_connection, max_rows=5):
+    def __init__(self, schema_agent, get_connection, max_rows=5, max_workers=4, retriever=None):
         """
         :param schema_agent: Instancia de DatabaseSchemaAgent
         :param get_connection: Función que retorna una conexión a la BD
         :param max_rows: Número máximo de filas de ejemplo por tabla
+        :param max_workers: Tablas que se muestrean a la vez
+        :param retriever: SchemaRetriever opcional para resumir solo las tablas de una pregunta
         """
         self.schema_agent = schema_agent
         self.get_connection = get_connection
         self.max_rows = max_rows
+        self.max_workers = max_workers
+        self.retriever = retriever
+        self._samples = {}  # tabla -> (huella, DataFrame)
+        self._lock = threading.Lock()
         self.logger = logging.getLogger("TableDataSummarizer")
 
-    def get_all_tables_summary(self):
+    def get_all_tables_summary(self, tables=None):
         """
         Retorna un string que describe, para cada tabla:
           - Nombre de la tabla
           - Columnas
           - Ejemplos de datos (hasta max_rows filas)
+        Con `tables` solo se describen (y muestrean) esas tablas.
         """
         schema_dict = self.schema_agent.get_schema_dict()
+        names = [t for t in (tables if tables is not None else schema_dict) if t in schema_dict]
+        samples = self.fetch_samples(names)
         summary_lines = []
 
         # Para cada tabla en el esquema
-        for table_name, details in schema_dict.items():
+        for table_name in names:
+            details = schema_dict[table_name]
             summary_lines.append(f"=== Tabla: {table_name} ===")
 
             # Columnas
@@ -40,7 +54,7 @@ class TableDataSummarizer:
             summary_lines.append(f"Columnas: {cols_str}")
 
             # Muestras de datos
-            sample_data_df = self._fetch_sample_data(table_name)
+            sample_data_df = samples.get(table_name)
             if sample_data_df is not None and not sample_data_df.empty:
                 summary_lines.append(f"Ejemplo de {self.max_rows} filas:")
                 summary_lines.append(sample_data_df.to_string(index=False))
@@ -51,13 +65,60 @@ class TableDataSummarizer:
 
         return "\n".join(summary_lines)
 
+    def get_question_summary(self, question):
+        """Resumen solo de las tablas relevantes a la pregunta (requiere retriever)."""
+        if not self.retriever:
+            return self.get_all_tables_summary()
+        return self.get_all_tables_summary(self.retriever.select_tables(question))
+
+    def fetch_samples(self, tables):
+        """
+        Retorna {tabla: DataFrame} con las muestras de las tablas indicadas.
+        Solo se leen las que no están en caché o cuya huella cambió, en paralelo.
+        """
+        fingerprints = {t: self._fingerprint(t) for t in tables}
+        samples, missing = {}, []
+        with self._lock:
+            for table in tables:
+                cached = self._samples.get(table)
+                if cached is not None and cached[0] == fingerprints[table]:
+                    samples[table] = cached[1]
+                else:
+                    missing.append(table)
+
+        if missing:
+            workers = max(1, min(self.max_workers, len(missing)))
+            with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="sampler") as executor:
+                fetched = list(executor.map(self._fetch_sample_data, missing))
+            with self._lock:
+                for table, df in zip(missing, fetched):
+                    samples[table] = df
+                    if df is not None:
+                        self._samples[table] = (fingerprints[table], df)
+        return samples
+
+    def memory_bytes(self):
+        """Memoria aproximada de las muestras en caché."""
+        with self._lock:
+            frames = [df for _, df in self._samples.values()]
+        return int(sum(df.memory_usage(index=False, deep=True).sum() for df in frames))
+
+    def _fingerprint(self, table_name):
+        # Cambia si cambia el DDL de la tabla, sus datos (UPDATE_TIME) o el tamaño de la muestra
+        return (
+            self.schema_agent.table_fingerprints.get(table_name),
+            self.schema_agent.table_update_times.get(table_name),
+            self.max_rows
+        )
+
     def _fetch_sample_data(self, table_name):
         """
         Retorna un DataFrame con hasta 'max_rows' filas de la tabla indicada.
         """
+        conn = None
         try:
             conn = self.get_connection()
-            query = f"SELECT * FROM {table_name} LIMIT {self.max_rows};"
+            query = f"SELECT * FROM `{table_name}` LIMIT {int(self.max_rows)};"
             df = pd.read_sql(query, conn)
             return df
         except Exception as e:
@@ -1,9 +1,11 @@
+import os
 import streamlit as st
 import pandas as pd
 from describe import *
 #from interpretation *
 
 from backend5 import SQLBot  # Asegúrate de que backend_modular.py está en el mismo directorio
+from resultstore import ResultStore
 import json
 
 # Configuración de la página
@@ -37,15 +39,29 @@ st.markdown("""
 </style>
 """, unsafe_allow_html=True)
 
-# Inicialización del bot con manejo de errores
+# Contextos de base de datos (pool, esquema y cachés) compartidos por todas las sesiones
 @st.cache_resource
+def get_registry():
+    return SQLBot.create_registry()
+
+# Métricas por etapa y caché de respuestas del LLM: una sola instancia por proceso
+@st.cache_resource
+def get_tracer():
+    return SQLBot.create_tracer()
+
+@st.cache_resource
+def get_llm_cache():
+    return SQLBot.create_llm_cache()
+
+# Un bot por sesión: cambiar de base de datos en una sesión no afecta a las demás
 def get_bot():
-    try:
-        bot = SQLBot()
-        return bot
-    except Exception as e:
-        st.error(f"Error al inicializar el bot: {str(e)}")
-        return None
+    if "bot" not in st.session_state:
+        try:
+            st.session_state.bot = SQLBot(registry=get_registry(), tracer=get_tracer(), llm_cache=get_llm_cache())
+        except Exception as e:
+            st.error(f"Error al inicializar el bot: {str(e)}")
+            return None
+    return st.session_state.bot
 
 # Inicializar el bot
 bot = get_bot()
@@ -97,21 +113,73 @@ st.markdown("### Tu asistente inteligente para consultas de base de datos")
 if "messages" not in st.session_state:
     st.session_state.messages = []
 
+# Los resultados del historial se guardan fuera de la sesión (vista previa + archivo en disco)
+if "result_store" not in st.session_state:
+    st.session_state.result_store = ResultStore(
+        directory=os.getenv("RESULT_SPILL_DIR") or None,
+        preview_rows=int(os.getenv("RESULT_PREVIEW_ROWS", "10")),
+        page_rows=int(os.getenv("RESULT_PAGE_ROWS", "100"))
+    )
+result_store = st.session_state.result_store
+
+
+def show_result_table(handle):
+    """
+    Muestra la vista previa de un resultado; el resultado completo solo se lee
+    del disco (una página a la vez) cuando el usuario lo abre.
+    """
+    preview = handle["preview"]
+    if not handle["spilled"]:
+        st.dataframe(preview)
+        if handle["rows"] > len(preview):
+            st.caption(f"Vista previa: {len(preview)} de {handle['rows']} filas.")
+        return
+
+    key = handle["id"]
+    if not st.toggle(f"Ver los {handle['rows']} resultados", key=f"full_{key}"):
+        st.dataframe(preview)
+        st.caption(f"Vista previa: {len(preview)} de {handle['rows']} filas.")
+        return
+
+    page = 1
+    if handle["pages"] > 1:
+        page = st.number_input("Página", min_value=1, max_value=handle["pages"], value=1, key=f"page_{key}")
+    data = result_store.load_page(handle, page - 1)
+    if data is None:
+        st.warning("El resultado completo ya no está disponible; se muestra la vista previa.")
+        st.dataframe(preview)
+    else:
+        st.dataframe(data)
+
+
+def show_result(content):
+    """Muestra un resultado guardado en el historial."""
+    if "sql_query" in content:
+        st.code(content["sql_query"], language="sql")
+    if "result" in content:
+        show_result_table(content["result"])
+    if "message" in content:
+        st.write(content["message"])
+    if "answer" in content:
+        st.markdown(content["answer"])
+
+
 # Mostrar historial de mensajes
 for message in st.session_state.messages:
     with st.chat_message(message["role"]):
         if isinstance(message["content"], dict):
             # Si el contenido es un diccionario (para resultados de consultas)
-            if "sql_query" in message["content"]:
-                st.code(message["content"]["sql_query"], language="sql")
-            if "data" in message["content"] and isinstance(message["content"]["data"], pd.DataFrame) and not message["content"]["data"].empty:
-                st.dataframe(message["content"]["data"])
-            if "message" in message["content"]:
-                st.write(message["content"]["message"])
+            show_result(message["content"])
         else:
             # Si es un mensaje simple
             st.markdown(message["content"])
 
+# Respuesta en lenguaje natural tras el resultado (una llamada más al LLM)
+natural_answer = st.sidebar.checkbox(
+    "Responder en lenguaje natural",
+    value=os.getenv("SQLBOT_STREAM_ANSWER", "false").lower() == "true"
+)
+
 # Input del usuario
 if prompt := st.chat_input("Hazme una pregunta sobre la base de datos..."):
     # Validar que el bot esté inicializado
@@ -126,43 +194,69 @@ if prompt := st.chat_input("Hazme una pregunta sobre la base de datos..."):
 
     # Procesar la consulta paso a paso
     try:
-        with st.spinner("Interpretando tu consulta..."):
-            # Paso 1: Interpretación
-            query_structure = bot.interpret_user_query(prompt)
-            st.write("**Estructura de la consulta interpretada:**", query_structure)
-
-        with st.spinner("Generando consulta SQL..."):
-            # Paso 2: Generar SQL
-            sql_query = bot.generate_sql(query_structure)
-            st.code(sql_query, language="sql")
-
-        with st.spinner("Ejecutando consulta..."):
-            # Paso 3: Ejecutar consulta
-            response = bot.execute_query(sql_query)
-
-            # Mostrar resultados
+        # Todo el recorrido queda en una traza (ver panel de latencias en el sidebar)
+        with bot.tracer.span("app_query"):
             with st.chat_message("assistant"):
+                # La salida del LLM se muestra a medida que llega; el SQL se ejecuta
+                # en cuanto está completo, sin esperar al resto de la respuesta
+                stage_titles = {
+                    "interpret": "Interpretando tu consulta...",
+                    "interpret_and_generate": "Interpretando tu consulta y generando SQL...",
+                    "generate_sql": "Generando consulta SQL...",
+                }
+                llm_output = st.empty()
+                sql_output = st.empty()
+                rows_output = st.empty()
+                answer_output = st.empty()
+                stage, text, answer = None, "", ""
+                response = {"success": False, "error": "La consulta no devolvió respuesta."}
+                for event in bot.stream_query(prompt, answer=natural_answer):
+                    if event["event"] == "token":
+                        if event["stage"] == "answer":
+                            answer += event["text"]
+                            answer_output.markdown(answer + "▌")
+                            continue
+                        if event["stage"] != stage:
+                            stage, text = event["stage"], ""
+                        text += event["text"]
+                        llm_output.caption(f"{stage_titles.get(stage, stage)}\n\n{text}")
+                    elif event["event"] == "sql":
+                        sql_output.code(event["sql"], language="sql")
+                    elif event["event"] == "rows":
+                        rows_output.dataframe(event["data"])
+                    elif event["event"] == "reset":
+                        # El SQL adelantado no era el definitivo: se retira su vista previa
+                        sql_output.empty()
+                        rows_output.empty()
+                    elif event["event"] == "response":
+                        response = event["response"]
+                # Al terminar, el resultado se muestra igual que en el historial
+                for placeholder in (llm_output, sql_output, rows_output, answer_output):
+                    placeholder.empty()
+
                 if response["success"]:
                     response_content = {}
-                    
+
                     if "sql_query" in response:
                         response_content["sql_query"] = response["sql_query"]
-                        st.code(response["sql_query"], language="sql")
-                    
+
+                    # En el historial queda solo el handle: vista previa + archivo en disco
                     if "data" in response and isinstance(response["data"], pd.DataFrame) and not response["data"].empty:
-                        response_content["data"] = response["data"]
-                        st.dataframe(response["data"])
-                    
+                        response_content["result"] = result_store.put(response["data"])
+
                     if "message" in response:
                         response_content["message"] = response["message"]
-                        st.write(response["message"])
-                    
+
+                    if response.get("answer"):
+                        response_content["answer"] = response["answer"]
+
+                    show_result(response_content)
                     st.session_state.messages.append({
                         "role": "assistant",
                         "content": response_content
                     })
                 else:
-                    error_message = f"Error: {response['error']}"
+                    error_message = f"Error: {response.get('error') or response.get('message')}"
                     st.error(error_message)
                     st.session_state.messages.append({
                         "role": "assistant",
@@ -180,13 +274,33 @@ if prompt := st.chat_input("Hazme una pregunta sobre la base de datos..."):
 st.sidebar.markdown("### 🛠️ Herramientas")
 if st.sidebar.button("Limpiar Historial"):
     st.session_state.messages = []
+    result_store.clear()
     st.experimental_rerun()
 
+# Panel opcional de latencias por etapa (p50/p95 de la ventana móvil)
+if bot and st.sidebar.checkbox("Ver latencias por etapa"):
+    stage_stats = bot.get_stage_stats()
+    if stage_stats:
+        st.sidebar.dataframe(pd.DataFrame([
+            {
+                "etapa": stage,
+                "n": data["count"],
+                "p50 (ms)": round(data["p50"] * 1000, 1),
+                "p95 (ms)": round(data["p95"] * 1000, 1),
+                "tokens": data["prompt_tokens"] + data["completion_tokens"],
+                "caché": f'{data["cache_hits"]}/{data["cache_hits"] + data["cache_misses"]}',
+            }
+            for stage, data in stage_stats.items()
+        ]))
+    else:
+        st.sidebar.info("Aún no hay consultas medidas.")
+
 # Mostrar el esquema actual
 if bot:
     try:
         with st.sidebar.expander("Ver esquema actual"):
-            schema = bot.get_schema()
+            # En cada rerun: el texto ya generado, sin revalidar contra la BD
+            schema = bot.get_schema(revalidate=False)
             if schema:
                 st.code(schema)
             else:
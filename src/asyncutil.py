@@ -0,0 +1,26 @@
+import asyncio
+import weakref
+import threading
+
+
+class LoopSemaphore:
+    """
+    Límite de concurrencia para código asíncrono compartido entre hilos.
+    asyncio.Semaphore queda ligado al event loop donde se usa, y Streamlit
+    ejecuta cada sesión en su propio hilo (y loop), así que guardamos un
+    semáforo por loop con el mismo límite.
+    """
+    def __init__(self, limit):
+        self.limit = limit
+        self._semaphores = weakref.WeakKeyDictionary()
+        self._lock = threading.Lock()
+
+    def get(self):
+        """Retorna el semáforo del loop actual (usar con `async with`)."""
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            semaphore = self._semaphores.get(loop)
+            if semaphore is None:
+                semaphore = asyncio.Semaphore(self.limit)
+                self._semaphores[loop] = semaphore
+            return semaphore
@@ -1,5 +1,13 @@
 import os
 import re
+import time
+import hashlib
+import queue
+import asyncio
+import logging
+import threading
+import contextvars
+from concurrent.futures import Future
 import pymysql
 import pandas as pd
 from dotenv import load_dotenv
@@ -11,42 +19,221 @@ from conection import *
 from semanticmap import *
 from interpretation import *
 from describe import * 
+from pool import ConnectionPool
+from TableDataSummarizer import TableDataSummarizer
+from profiler import ColumnProfiler
+from valueindex import ValueIndex
+from schemaindex import SchemaRetriever
+from llmcache import LLMResponseCache, normalize_question
+from sqlcompiler import DeterministicSQLCompiler
+from asyncutil import LoopSemaphore
+from resultcache import QueryResultCache, referenced_tables
+from costguard import QueryCostGuard, is_read_only
+from templatecache import QueryTemplateCache
+from snapshot import SchemaSnapshotStore
+from streaming import stream_chain, SQLStatementDetector
+from context import DatabaseContext, ContextRegistry
+from tracing import Tracer, TokenUsageHandler, span
 
 load_dotenv()
 
 # =========================================================
 # AGENTE 5: Ejecución de la consulta
 # =========================================================
+class QueryStream:
+    """
+    Resultado de un SELECT leído por bloques con un cursor del lado del servidor
+    (SSCursor): se itera como una secuencia de DataFrames y nunca se guardan
+    más de `max_rows` filas ni más de `max_bytes` bytes. Tras iterar,
+    `truncated`, `rows` y `bytes` describen lo que se leyó.
+    """
+    def __init__(self, get_connection, sql_query, params=None, chunk_rows=5000,
+                 max_rows=100000, max_bytes=256 * 1024 * 1024):
+        self.get_connection = get_connection
+        self.sql_query = sql_query
+        self.params = params
+        self.chunk_rows = chunk_rows
+        self.max_rows = max_rows
+        self.max_bytes = max_bytes
+
+        self.columns = []
+        self.rows = 0
+        self.bytes = 0
+        self.truncated = False
+
+    def __iter__(self):
+        with span("connect"):
+            conn = self.get_connection()
+        cursor = None
+        unread = False  # Hay filas pendientes en el socket
+        try:
+            cursor = conn.cursor(pymysql.cursors.SSCursor)
+            cursor.execute(self.sql_query, self.params)
+            unread = True
+            self.columns = [desc[0] for desc in cursor.description or []]
+            while True:
+                remaining = self.max_rows - self.rows
+                if remaining <= 0:
+                    # Límite de filas alcanzado: ¿quedaban más?
+                    self.truncated = cursor.fetchone() is not None
+                    unread = self.truncated
+                    break
+                rows = cursor.fetchmany(min(self.chunk_rows, remaining))
+                if not rows:
+                    unread = False
+                    break
+
+                chunk = self._to_frame(rows)
+                del rows
+                chunk_bytes = self._frame_bytes(chunk)
+                if self.bytes + chunk_bytes > self.max_bytes:
+                    keep = int(len(chunk) * (self.max_bytes - self.bytes) / chunk_bytes)
+                    chunk = chunk.iloc[:max(keep, 0)]
+                    chunk_bytes = self._frame_bytes(chunk)
+                    self.truncated = True
+                self.rows += len(chunk)
+                self.bytes += chunk_bytes
+                if len(chunk):
+                    yield chunk
+                if self.truncated:
+                    break
+        finally:
+            if unread and hasattr(conn, "invalidate"):
+                # Quedan filas sin leer en el socket: cerrar el cursor las drenaría
+                # todas, así que descartamos la conexión en lugar de reutilizarla
+                conn.invalidate()
+            elif cursor is not None:
+                try:
+                    cursor.close()
+                except Exception:
+                    pass
+            conn.close()
+
+    def to_frame(self, on_chunk=None):
+        """
+        Lee todo el resultado (dentro de los límites) en un único DataFrame.
+        :param on_chunk: Función opcional que recibe cada bloque en cuanto se lee
+        """
+        chunks = []
+        for chunk in self:
+            if on_chunk is not None:
+                on_chunk(chunk)
+            chunks.append(chunk)
+        if not chunks:
+            return pd.DataFrame(columns=self.columns)
+        if len(chunks) == 1:
+            return chunks[0]
+        return pd.concat(chunks, ignore_index=True)
+
+    def _to_frame(self, rows):
+        # Construir cada columna directamente (una Series por columna) a partir del bloque
+        frame = pd.DataFrame({i: values for i, values in enumerate(zip(*rows))})
+        frame.columns = self.columns
+        return frame
+
+    @staticmethod
+    def _frame_bytes(frame):
+        return int(frame.memory_usage(deep=True, index=False).sum())
+
+
 class QueryExecutionAgent:
     """
     Ejecuta la consulta SQL en la base de datos y retorna los resultados.
     """
-    def __init__(self, get_connection):
+    def __init__(self, get_connection, max_rows=None, max_bytes=None, chunk_rows=5000, max_concurrency=10,
+                 result_cache=None, get_update_times=None, update_check_interval=5):
+        """
+        :param get_connection: Función que retorna una conexión a la BD
+        :param max_rows: Máximo de filas que se leen de un SELECT
+        :param max_bytes: Máximo de bytes en memoria del resultado de un SELECT
+        :param chunk_rows: Filas por bloque al leer del servidor
+        :param max_concurrency: Consultas simultáneas desde la API async
+        :param result_cache: QueryResultCache opcional para los SELECT repetidos
+        :param get_update_times: Función que retorna {tabla: UPDATE_TIME} para invalidar el caché
+        :param update_check_interval: Segundos entre comprobaciones de UPDATE_TIME
+        """
         self.get_connection = get_connection
+        self.max_rows = max_rows or int(os.getenv("SQLBOT_MAX_ROWS", "100000"))
+        self.max_bytes = max_bytes or int(os.getenv("SQLBOT_MAX_BYTES", str(256 * 1024 * 1024)))
+        self.chunk_rows = chunk_rows
+        self.limit = LoopSemaphore(max_concurrency)
+        self.result_cache = result_cache
+        self.get_update_times = get_update_times
+        self.update_check_interval = update_check_interval
+        self._update_times = {}
+        self._update_checked_at = None
+        self._update_lock = threading.Lock()
+
+    def execute_query_stream(self, sql_query, params=None, max_rows=None, max_bytes=None):
+        """
+        Retorna un QueryStream que entrega el resultado del SELECT por bloques
+        (DataFrames) sin cargarlo completo en memoria.
+        """
+        return QueryStream(
+            self.get_connection, sql_query, params,
+            chunk_rows=self.chunk_rows,
+            max_rows=max_rows or self.max_rows,
+            max_bytes=max_bytes or self.max_bytes
+        )
 
-    def execute_query(self, sql_query):
+    async def aexecute_query(self, sql_query, params=None):
         """
-        Ejecuta la sentencia SQL y retorna un dict con la info:
+        Variante asíncrona de execute_query: pymysql es bloqueante, así que la
+        consulta corre en un hilo, con un máximo de consultas simultáneas.
+        """
+        async with self.limit.get():
+            return await asyncio.to_thread(self.execute_query, sql_query, params)
+
+    def execute_query(self, sql_query, params=None, on_chunk=None):
+        """
+        Ejecuta la sentencia SQL (con `params` opcionales para los %s)
+        y retorna un dict con la info (`on_chunk` recibe cada bloque de filas
+        de un SELECT en cuanto se lee, o el resultado entero si sale del caché):
         {
           "success": bool,
           "data": pd.DataFrame (o None),
-          "message": str
+          "message": str,
+          "truncated": bool  (solo SELECT: se alcanzó el límite de filas/bytes)
         }
         """
+        # Si es SELECT, leemos las filas por bloques y con límites
+        if sql_query.strip().upper().startswith("SELECT"):
+            update_times = None
+            if self.result_cache:
+                update_times = self._check_update_times()
+                cached = self.result_cache.get(sql_query, params)
+                if cached is not None:
+                    if on_chunk is not None and cached["data"] is not None:
+                        on_chunk(cached["data"])
+                    return {**cached, "cached": True}
+
+            try:
+                stream = self.execute_query_stream(sql_query, params)
+                df = stream.to_frame(on_chunk)
+            except Exception as e:
+                return {"success": False, "data": None, "message": str(e)}
+            message = ""
+            if stream.truncated:
+                message = f"Resultado truncado a {stream.rows} filas por los límites de lectura."
+            result = {
+                "success": True,
+                "data": df,
+                "message": message,
+                "truncated": stream.truncated,
+                "row_count": stream.rows,
+                "bytes": stream.bytes
+            }
+            if self.result_cache:
+                self.result_cache.set(sql_query, params, result, update_times)
+            return result
+
         try:
             conn = self.get_connection()
             cursor = conn.cursor()
-            cursor.execute(sql_query)
-            # Si es SELECT, retornamos las filas
-            if sql_query.strip().upper().startswith("SELECT"):
-                rows = cursor.fetchall()
-                columns = [desc[0] for desc in cursor.description]
-                df = pd.DataFrame(rows, columns=columns)
-                return {"success": True, "data": df, "message": ""}
-            else:
-                # Para INSERT, UPDATE, DELETE, etc.
-                conn.commit()
-                return {"success": True, "data": None, "message": "Operación ejecutada correctamente"}
+            cursor.execute(sql_query, params)
+            # Para INSERT, UPDATE, DELETE, etc.
+            conn.commit()
+            return {"success": True, "data": None, "message": "Operación ejecutada correctamente"}
         except Exception as e:
             return {"success": False, "data": None, "message": str(e)}
         finally:
@@ -55,6 +242,42 @@ class QueryExecutionAgent:
                 conn.close()
             except:
                 pass
+            # Una escritura (aunque falle a medias) invalida los resultados de sus tablas;
+            # si no se sabe cuáles toca, los de todas
+            if self.result_cache:
+                tables = referenced_tables(sql_query)
+                if tables:
+                    self.result_cache.invalidate_tables(tables)
+                else:
+                    self.result_cache.clear()
+
+    def _check_update_times(self):
+        """
+        Como mucho cada `update_check_interval` segundos, lee UPDATE_TIME de las
+        tablas e invalida los resultados cuyas tablas cambiaron.
+        Retorna los últimos UPDATE_TIME conocidos.
+        """
+        if not self.get_update_times:
+            return None
+        with self._update_lock:
+            now = time.monotonic()
+            if self._update_checked_at is not None and now - self._update_checked_at < self.update_check_interval:
+                return self._update_times
+            try:
+                self._update_times = {t.lower(): ut for t, ut in self.get_update_times().items()}
+            except Exception as e:
+                # Sin información fiable de cambios no se puede servir desde el caché
+                logging.getLogger("QueryExecutionAgent").warning(f"No se pudo leer UPDATE_TIME: {e}")
+                self.result_cache.clear()
+                return None
+            self._update_checked_at = now
+            self.result_cache.check_update_times(self._update_times)
+            return self._update_times
+
+
+def _normalize_sql(sql_query):
+    # Para comparar sentencias sin tener en cuenta espacios ni el ';' final
+    return " ".join(sql_query.strip().rstrip(";").split())
 
 
 # =========================================================
@@ -65,7 +288,16 @@ class SQLBot:
     Clase principal que inicializa y coordina todos los agentes
     para convertir las preguntas en consultas SQL y ejecutar resultados.
     """
-    def __init__(self):
+    def __init__(self, llm=None, connect=None, registry=None, tracer=None, llm_cache=None):
+        """
+        :param llm: LLM a usar (por defecto OpenAI con la API key del entorno)
+        :param connect: Función que abre una conexión a la BD (por defecto pymysql
+                        con las credenciales del entorno); útil para pruebas y benchmarks
+        :param registry: ContextRegistry compartido entre bots (ej. uno por sesión de la UI);
+                         por defecto el bot tiene el suyo
+        :param tracer: Tracer compartido entre bots (métricas del proceso); por defecto uno propio
+        :param llm_cache: LLMResponseCache compartida entre bots; por defecto una propia
+        """
         # Leer variables de entorno
         self.openai_api_key = os.getenv("OPENAI_API_KEY")
         self.db_name = os.getenv("DB_NAME")
@@ -74,28 +306,37 @@ class SQLBot:
         self.db_host = os.getenv("DB_HOST", "localhost")
         self.db_port = os.getenv("DB_PORT", "3306")
 
+        # Modo de una sola llamada al LLM (interpretación + SQL en un prompt)
+        self.fused_mode = os.getenv("SQLBOT_FUSED_MODE", "false").lower() in ("1", "true", "yes")
+
+        # Trazas por etapa (latencia, tokens, filas, caché)
+        self.tracer = tracer if tracer is not None else self.create_tracer()
+        self.token_usage = TokenUsageHandler()
+
         # Inicializar LLM
-        self.llm = OpenAI(api_key=self.openai_api_key, temperature=0)
-
-        # Función de conexión
-        def get_connection():
-            return pymysql.connect(
-                host=self.db_host,
-                port=int(self.db_port),
-                user=self.db_user,
-                password=self.db_password,
-                db=self.db_name,
-                cursorclass=pymysql.cursors.Cursor
-            )
+        self.llm = self._instrument_llm(
+            llm if llm is not None else OpenAI(api_key=self.openai_api_key, temperature=0)
+        )
+        # Máximo de llamadas concurrentes al LLM desde la API async
+        self.llm_limit = LoopSemaphore(int(os.getenv("SQLBOT_LLM_CONCURRENCY", "8")))
+        self._custom_connect = connect
+
+        # Caché de respuestas del LLM (memoria + disco)
+        self.llm_cache = llm_cache if llm_cache is not None else self.create_llm_cache()
+
+        # Arranque en frío: instantánea del esquema en disco y calentamiento en segundo plano
+        snapshot_path = os.getenv("SCHEMA_SNAPSHOT_PATH", ".cache/schema_snapshot.sqlite")
+        self.snapshot_store = SchemaSnapshotStore(snapshot_path) if snapshot_path else None
+        self.warm_up_on_start = os.getenv("SQLBOT_WARMUP", "true").lower() in ("1", "true", "yes")
+        self.warm_up_tables = int(os.getenv("WARMUP_TABLES", "50"))
+
+        # Contextos por conexión (pool, esquema y cachés derivadas), reutilizables al cambiar de BD
+        self.registry = registry if registry is not None else self.create_registry()
+        self.context = None
 
         # Inicializar Agentes
-        self.schema_agent = DatabaseSchemaAgent(get_connection, self.db_name)
-        self.semantic_agent = SemanticMappingAgent(self.schema_agent)
-        self.user_query_agent = UserQueryAgent(self.llm, self.schema_agent)
-        self.sql_generation_agent = SQLGenerationAgent(llm=self.llm,  # Add LLM parameter
-    schema_agent=self.schema_agent)
-        self.execution_agent = QueryExecutionAgent(get_connection)
-         
+        self._init_agents()
+
 
     # --------------------------------------------
     # Métodos de configuración
@@ -105,7 +346,7 @@ class SQLBot:
         """Actualiza las credenciales de la base de datos y/o LLM."""
         if api_key:
             self.openai_api_key = api_key
-            self.llm = OpenAI(api_key=self.openai_api_key, temperature=0)
+            self.llm = self._instrument_llm(OpenAI(api_key=self.openai_api_key, temperature=0))
 
         if db_name: self.db_name = db_name
         if db_user: self.db_user = db_user
@@ -113,45 +354,359 @@ class SQLBot:
         if db_host: self.db_host = db_host
         if db_port: self.db_port = db_port
 
-        # Reinicializar Agentes con las nuevas credenciales
-        def get_connection():
-            return pymysql.connect(
-                host=self.db_host,
-                port=int(self.db_port),
-                user=self.db_user,
-                password=self.db_password,
-                db=self.db_name,
-                cursorclass=pymysql.cursors.Cursor
+        # El contexto de la BD anterior queda en el registro: volver a ella no la reintrospecta
+        self._init_agents()
+
+    @staticmethod
+    def create_registry():
+        """Registro de contextos con los límites del entorno (para compartirlo entre sesiones)."""
+        return ContextRegistry(
+            max_entries=int(os.getenv("CONTEXT_MAX_ENTRIES", "4")),
+            max_bytes=int(os.getenv("CONTEXT_MAX_BYTES", str(256 * 1024 * 1024)))
+        )
+
+    @staticmethod
+    def create_tracer():
+        """Tracer con la ventana del entorno (para compartirlo entre sesiones)."""
+        return Tracer(window=int(os.getenv("TRACE_WINDOW", "1000")))
+
+    @staticmethod
+    def create_llm_cache():
+        """Caché de respuestas del LLM con la configuración del entorno (para compartirla entre sesiones)."""
+        return LLMResponseCache(
+            path=os.getenv("LLM_CACHE_PATH", ".cache/llm_cache.sqlite") or None,
+            max_memory_entries=int(os.getenv("LLM_CACHE_MEMORY_ENTRIES", "512")),
+            max_disk_entries=int(os.getenv("LLM_CACHE_DISK_ENTRIES", "10000")),
+            max_age=float(os.getenv("LLM_CACHE_MAX_AGE", str(7 * 24 * 3600)))
+        )
+
+    def _instrument_llm(self, llm):
+        """Registra el callback que anota los tokens de cada llamada en el span activo."""
+        callbacks = list(getattr(llm, "callbacks", None) or [])
+        if self.token_usage not in callbacks:
+            try:
+                llm.callbacks = callbacks + [self.token_usage]
+            except Exception as e:
+                logging.getLogger("SQLBot").warning(f"No se pudo instrumentar el LLM: {e}")
+        return llm
+
+    def _connect_function(self):
+        """
+        Función que abre conexiones nuevas (solo la usa el pool). Las credenciales
+        se fijan al crearla: el pool de un contexto sigue conectando a su BD
+        aunque el bot cambie después a otra.
+        """
+        if self._custom_connect is not None:
+            return self._custom_connect
+        params = {
+            "host": self.db_host,
+            "port": int(self.db_port),
+            "user": self.db_user,
+            "password": self.db_password,
+            "db": self.db_name,
+            "cursorclass": pymysql.cursors.Cursor,
+        }
+        return lambda: pymysql.connect(**params)
+
+    def _create_pool(self, connect):
+        return ConnectionPool(
+            connect,
+            max_size=int(os.getenv("DB_POOL_SIZE", "10")),
+            max_idle=float(os.getenv("DB_POOL_MAX_IDLE", "300")),
+            timeout=float(os.getenv("DB_POOL_TIMEOUT", "30"))
+        )
+
+    def _context_key(self):
+        # La contraseña entra resumida: otras credenciales no reutilizan un pool ya autenticado
+        secret = hashlib.sha256(str(self.db_password or "").encode("utf-8")).hexdigest()[:16]
+        return (self.db_host, str(self.db_port), self.db_name, self.db_user, secret)
+
+    def _init_agents(self):
+        # Pool, esquema y cachés: del contexto de la conexión actual (nuevo o ya abierto)
+        context = self.registry.acquire(self._context_key(), self._build_context, owner=self)
+        self.context = context
+        self.pool = context.pool
+        self.schema_agent = context.schema_agent
+        self.semantic_agent = context.semantic_agent
+        self.value_index = context.value_index
+        self.sql_compiler = context.sql_compiler
+        self.retriever = context.retriever
+        self.summarizer = context.summarizer
+        self.profiler = context.profiler
+        self.template_cache = context.template_cache
+        self.result_cache = context.result_cache
+        self.execution_agent = context.execution_agent
+
+        # Agentes que usan el LLM de este bot; su caché se invalida solo con los cambios de esta BD
+        profile_budget = int(os.getenv("COLUMN_PROFILE_BUDGET", "400"))
+        llm_cache = self.llm_cache.scoped(self._snapshot_key(context))
+        self.user_query_agent = UserQueryAgent(
+            self.llm, self.schema_agent, retriever=self.retriever, cache=llm_cache,
+            profiler=self.profiler, profile_budget=profile_budget, value_index=self.value_index
+        )
+        self.sql_generation_agent = SQLGenerationAgent(
+            llm=self.llm, schema_agent=self.schema_agent, retriever=self.retriever, cache=llm_cache
+        )
+        self.fused_agent = FusedQueryAgent(
+            self.llm, self.schema_agent, retriever=self.retriever, cache=llm_cache,
+            profiler=self.profiler, profile_budget=profile_budget, value_index=self.value_index
+        )
+        self.response_agent = NaturalLanguageResponseAgent(
+            self.llm, token_budget=int(os.getenv("RESPONSE_DIGEST_TOKENS", "800"))
+        )
+        self.cost_guard = QueryCostGuard(
+            self.pool.get_connection,
+            max_rows_examined=int(os.getenv("SQLBOT_MAX_ROWS_EXAMINED", "1000000")),
+            policy=os.getenv("SQLBOT_COST_POLICY", "limit").strip().lower(),
+            default_limit=int(os.getenv("SQLBOT_COST_LIMIT", "1000")),
+            rewrite=self.sql_generation_agent.rewrite_sql
+        )
+
+    def _build_context(self, key):
+        """Crea el pool y los agentes del esquema para una conexión (lo llama el registro)."""
+        pool = self._create_pool(self._connect_function())
+        get_connection = pool.get_connection
+        schema_agent = DatabaseSchemaAgent(get_connection, self.db_name)
+        semantic_agent = SemanticMappingAgent(schema_agent)
+        value_index = ValueIndex(
+            schema_agent,
+            get_connection,
+            path=os.getenv("VALUE_INDEX_PATH", ".cache/value_index.sqlite") or None,
+            max_distinct=int(os.getenv("VALUE_INDEX_MAX_DISTINCT", "200")),
+            max_workers=int(os.getenv("SUMMARY_WORKERS", "4")),
+            refresh_interval=float(os.getenv("VALUE_INDEX_REFRESH_INTERVAL", "300")),
+            db_key=self._storage_key(key)
+        )
+        retriever = SchemaRetriever(
+            schema_agent,
+            semantic_agent,
+            top_k=int(os.getenv("SCHEMA_TOP_K", "8")),
+            token_budget=int(os.getenv("SCHEMA_TOKEN_BUDGET", "2000"))
+        )
+        max_templates = int(os.getenv("TEMPLATE_CACHE_MAX_ENTRIES", "512"))
+        result_cache = QueryResultCache(
+            max_entries=int(os.getenv("RESULT_CACHE_MAX_ENTRIES", "256")),
+            max_bytes=int(os.getenv("RESULT_CACHE_MAX_BYTES", str(64 * 1024 * 1024))),
+            ttl=float(os.getenv("RESULT_CACHE_TTL", "300"))
+        )
+        context = DatabaseContext(
+            key,
+            pool,
+            schema_agent=schema_agent,
+            semantic_agent=semantic_agent,
+            value_index=value_index,
+            sql_compiler=DeterministicSQLCompiler(
+                schema_agent, value_index=value_index,
+                enabled=os.getenv("SQLBOT_COMPILER", "true").lower() == "true"
+            ),
+            retriever=retriever,
+            summarizer=TableDataSummarizer(
+                schema_agent,
+                get_connection,
+                max_workers=int(os.getenv("SUMMARY_WORKERS", "4")),
+                retriever=retriever
+            ),
+            profiler=ColumnProfiler(
+                schema_agent,
+                get_connection,
+                path=os.getenv("COLUMN_PROFILE_PATH", ".cache/column_profiles.sqlite") or None,
+                sample_rows=int(os.getenv("COLUMN_PROFILE_SAMPLE_ROWS", "1000")),
+                max_workers=int(os.getenv("SUMMARY_WORKERS", "4")),
+                db_key=self._storage_key(key)
+            ),
+            template_cache=QueryTemplateCache(
+                schema_agent, value_index=value_index, max_entries=max_templates
+            ) if max_templates > 0 else None,
+            result_cache=result_cache,
+            execution_agent=QueryExecutionAgent(
+                get_connection,
+                max_concurrency=pool.max_size,
+                result_cache=result_cache,
+                get_update_times=schema_agent.get_update_times,
+                update_check_interval=float(os.getenv("RESULT_CACHE_CHECK_INTERVAL", "5"))
             )
+        )
+
+        # Lo guardado en la instantánea se usa de inmediato; el calentamiento lo revalida después
+        self.restore_snapshot(context)
+        if self.warm_up_on_start:
+            self._start_warm_up(context)
+        return context
+
+    # --------------------------------------------
+    # Arranque en frío
+    # --------------------------------------------
+    @staticmethod
+    def _storage_key(key):
+        # Identidad de la BD en los almacenes en disco compartidos (sin la contraseña).
+        # Incluye al usuario: otro usuario puede ver otras tablas y columnas
+        host, port, db_name, user = key[:4]
+        return f"{user}@{host}:{port}/{db_name}"
+
+    @classmethod
+    def _snapshot_key(cls, context):
+        return cls._storage_key(context.key)
+
+    def restore_snapshot(self, context=None):
+        """
+        Carga la instantánea de la BD del contexto (esquema y mapa semántico) sin
+        consultar la BD. Retorna True si había una instantánea válida.
+        """
+        context = context or self.context
+        if self.snapshot_store is None or not context.key[2]:
+            return False
+        start = time.perf_counter()
+        payload = self.snapshot_store.load(self._snapshot_key(context))
+        if not payload or not context.schema_agent.restore_snapshot(payload.get("schema")):
+            return False
+        context.semantic_agent.restore(payload.get("semantic_map"))
+        logging.getLogger("SQLBot").info(
+            f"Instantánea cargada en {(time.perf_counter() - start) * 1000:.1f} ms "
+            f"({len(payload['schema']['schema'])} tablas)."
+        )
+        return True
+
+    def save_snapshot(self, context=None):
+        """
+        Guarda el esquema y el mapa semántico actuales para el próximo arranque.
+        Las filas de datos no se guardan: ningún prompt las usa y quedarían en claro en el disco.
+        """
+        context = context or self.context
+        if self.snapshot_store is None or not context.key[2]:
+            return False
+        schema = context.schema_agent.export_snapshot()
+        if schema is None:
+            return False
+        return self.snapshot_store.save(self._snapshot_key(context), {
+            "schema": schema,
+            "semantic_map": context.semantic_agent.map_cache,
+        })
+
+    def warm_up(self, background=True):
+        """
+        Prepara lo que la primera pregunta tendría que construir: revalida el esquema
+        (si vino de la instantánea, solo relee las tablas cambiadas), el mapa semántico,
+        el índice del retriever, los textos del esquema y los valores y perfiles de las
+        tablas principales; al terminar guarda una instantánea nueva.
+        Con background=True corre en un hilo aparte y retorna ese hilo.
+        """
+        if not self.db_name:
+            return None
+        if not background:
+            self._warm_up(self.context)
+            return None
+        return self._start_warm_up(self.context)
 
-        self.schema_agent = DatabaseSchemaAgent(get_connection, self.db_name)
-        self.semantic_agent = SemanticMappingAgent(self.schema_agent)
-        self.user_query_agent = UserQueryAgent(self.llm, self.schema_agent)
-        self.sql_generation_agent = SQLGenerationAgent(llm=self.llm, schema_agent=self.schema_agent)
-        self.execution_agent = QueryExecutionAgent(get_connection)
+    def wait_warm_up(self, timeout=None):
+        """Espera al calentamiento en segundo plano; retorna True si ya terminó."""
+        thread = self.context.warm_up_thread
+        if thread is not None:
+            thread.join(timeout)
+        return thread is None or not thread.is_alive()
+
+    def _start_warm_up(self, context):
+        if not context.key[2]:
+            return None
+        thread = threading.Thread(target=self._warm_up, args=(context,), name="sqlbot-warmup", daemon=True)
+        context.warm_up_thread = thread
+        thread.start()
+        return thread
+
+    def _warm_up(self, context):
+        schema_agent = context.schema_agent
+        with self.tracer.span("warm_up") as stage:
+            try:
+                def build_local():
+                    # Solo memoria: con la instantánea cargada no necesita la BD
+                    context.semantic_agent.build_semantic_map()
+                    context.retriever.score("")
+                    context.value_index.resolve("", refresh=False)
+                    schema_agent.get_schema_text()
+                    schema_agent.get_prompt_schema()
+
+                # Primero lo derivado del esquema en caché, para que una pregunta
+                # temprana no lo construya; luego la revalidación contra la BD
+                built_version = None
+                if schema_agent.cached_schema is not None:
+                    build_local()
+                    built_version = schema_agent.schema_version
+                schema_agent.refresh()
+                if schema_agent.schema_version != built_version:
+                    build_local()
+                schema_dict = schema_agent.get_schema_dict()
+
+                tables = schema_agent._by_priority(schema_dict)[:self.warm_up_tables]
+                context.value_index.refresh(tables)
+                context.profiler.get_profiles(tables)
+                stage.set(tables=len(schema_dict), warmed=len(tables))
+
+                self.save_snapshot(context)
+            except Exception as e:
+                stage.set(error=type(e).__name__)
+                logging.getLogger("SQLBot").warning(f"Calentamiento incompleto: {e}")
 
     # --------------------------------------------
     # Métodos de utilería
     # --------------------------------------------
-    def get_schema(self):
-        """Retorna el esquema en texto (para debug o mostrar en UI)."""
+    def get_schema(self, revalidate=True):
+        """
+        Retorna el esquema en texto (para debug o mostrar en UI).
+        Con revalidate=False usa el texto ya generado si existe, sin consultar la BD.
+        """
+        if not revalidate:
+            text = self.schema_agent.peek_schema_text()
+            if text is not None:
+                return text
         return self.schema_agent.get_schema_text()
 
+    def get_pool_stats(self):
+        """Retorna las métricas del pool de conexiones (préstamos, esperas, tamaño)."""
+        return self.pool.stats()
+
+    def get_context_stats(self):
+        """Retorna las métricas del registro de contextos (aciertos, expulsiones, memoria por BD)."""
+        return self.registry.stats()
+
+    def get_llm_cache_stats(self):
+        """Retorna aciertos, fallos y tamaño del caché de respuestas del LLM."""
+        return self.llm_cache.stats()
+
+    def get_result_cache_stats(self):
+        """Retorna aciertos, invalidaciones y tamaño del caché de resultados."""
+        return self.result_cache.stats()
+
+    def get_sql_compiler_stats(self):
+        """Retorna cuántas consultas se resolvieron sin LLM (fast path) y cuántas no."""
+        return self.sql_compiler.stats()
+
+    def get_value_index_stats(self):
+        """Retorna tablas y valores indexados y cuántas preguntas tuvieron literales resueltos."""
+        return self.value_index.stats()
+
+    def get_template_cache_stats(self):
+        """Retorna aciertos, fallos y plantillas guardadas del caché de preguntas con la misma forma."""
+        return self.template_cache.stats() if self.template_cache else {}
+
+    def get_cost_guard_stats(self):
+        """Retorna las decisiones del control de costo y las consultas costosas recientes."""
+        return self.cost_guard.stats()
+
+    def get_stage_stats(self):
+        """Retorna p50/p95/p99, tokens, filas, bytes y aciertos de caché por etapa."""
+        return self.tracer.snapshot()
+
+    def export_metrics(self, fmt="prometheus"):
+        """Métricas por etapa en texto de Prometheus (`fmt="prometheus"`) o JSON (`fmt="json"`)."""
+        if fmt == "json":
+            return self.tracer.export_json()
+        return self.tracer.export_prometheus()
+
     def initialize_database(self):
         """
         Crea tablas de ejemplo si no existen (opcional),
         útil para pruebas o bases de datos vacías.
         """
-        def get_connection():
-            return pymysql.connect(
-                host=self.db_host,
-                port=int(self.db_port),
-                user=self.db_user,
-                password=self.db_password,
-                db=self.db_name,
-                cursorclass=pymysql.cursors.Cursor
-            )
-        conn = get_connection()
+        conn = self.pool.get_connection()
         cursor = conn.cursor()
         try:
             cursor.execute("""
@@ -179,49 +734,489 @@ class SQLBot:
     # --------------------------------------------
     # PIPELINE PRINCIPAL
     # --------------------------------------------
-    def process_query(self, question: str):
+    def process_query(self, question: str, fused=None):
         """
         Pipeline completo: 
         1) Interpreta la pregunta
         2) Genera SQL
         3) Ejecuta la consulta
         4) Retorna el resultado
+        Con `fused=True` (o SQLBOT_FUSED_MODE) los pasos 1 y 2 se hacen en una sola llamada al LLM.
         """
-        # 1) Interpretación
-        interpreted = self.user_query_agent.interpret(question)
+        if fused is None:
+            fused = self.fused_mode
 
-        # Verificar si la intención está relacionada con la BD
-        if not interpreted.get("tabla"):
-            return {
-                "success": True, 
-                "message": "Lo siento, solo respondo consultas de base de datos.", 
-                "is_query": False
-            }
+        with self.tracer.span("process_query", fused=fused):
+            # 0) Plantilla de una pregunta con la misma forma: sin llamadas al LLM
+            template = self._lookup_template(question)
+            if template and template["sql"] is not None:
+                sql_query, params = template["sql"], template["params"]
+            else:
+                # 1) Interpretación (y SQL, en modo de una sola llamada)
+                sql_query = None
+                if fused:
+                    with self.tracer.span("interpret_and_generate"):
+                        interpreted, sql_query = self.fused_agent.interpret_and_generate(question)
+                else:
+                    with self.tracer.span("interpret"):
+                        interpreted = self.user_query_agent.interpret(question)
 
-        # 2) Generar SQL
-        sql_query = self.sql_generation_agent.generate_sql(interpreted)
+                # Verificar si la intención está relacionada con la BD
+                if not interpreted.get("tabla"):
+                    return self._not_a_query("Lo siento, solo respondo consultas de base de datos.")
 
-        if sql_query.startswith("Lo siento"):
-            return {
-                "success": True,
-                "message": sql_query,
-                "is_query": False
+                # 2) Generar SQL: primero el compilador de reglas, luego el LLM
+                params = None
+                if not fused:
+                    with self.tracer.span("compile") as stage:
+                        compiled = self.sql_compiler.compile(interpreted)
+                        stage.set(fast_path=bool(compiled))
+                    if compiled:
+                        sql_query, params = compiled["sql"], compiled["params"]
+                    else:
+                        with self.tracer.span("generate_sql"):
+                            sql_query = self.sql_generation_agent.generate_sql(interpreted)
+                elif not sql_query:
+                    sql_query = "Lo siento, no se pudo generar la consulta SQL."
+
+                if sql_query.startswith("Lo siento"):
+                    return self._not_a_query(sql_query)
+            generated = (sql_query, params)
+
+            # 3) Control de costo (EXPLAIN) antes de ejecutar
+            with self.tracer.span("cost_guard") as stage:
+                check = self.cost_guard.check(sql_query, params, label=question)
+                self._annotate_check(stage, check)
+            if not check["allowed"]:
+                return self._rejected(check)
+            sql_query, params = check["sql"], check["params"]
+
+            # 4) Ejecutar la consulta
+            with self.tracer.span("execute") as stage:
+                result = self.execution_agent.execute_query(sql_query, params)
+                self._annotate_result(stage, result)
+            self._store_template(template, generated, result)
+            return self._build_response(sql_query, params, result, check)
+
+    async def aprocess_query(self, question: str, fused=None):
+        """
+        Variante asíncrona de process_query: las llamadas al LLM usan su API
+        async y la BD se ejecuta en un hilo aparte, ambas con concurrencia
+        acotada, para que preguntas independientes se solapen.
+        """
+        return await self._aprocess_query(question, fused)
+
+    async def _aprocess_query(self, question, fused=None, executions=None):
+        # `executions`: dict compartido en un lote para ejecutar una sola vez cada (SQL, params)
+        if fused is None:
+            fused = self.fused_mode
+
+        with self.tracer.span("process_query", fused=fused):
+            template = await asyncio.to_thread(self._lookup_template, question)
+            if template and template["sql"] is not None:
+                sql_query, params = template["sql"], template["params"]
+            else:
+                sql_query = None
+                async with self.llm_limit.get():
+                    if fused:
+                        with self.tracer.span("interpret_and_generate"):
+                            interpreted, sql_query = await self.fused_agent.ainterpret_and_generate(question)
+                    else:
+                        with self.tracer.span("interpret"):
+                            interpreted = await self.user_query_agent.ainterpret(question)
+
+                if not interpreted.get("tabla"):
+                    return self._not_a_query("Lo siento, solo respondo consultas de base de datos.")
+
+                params = None
+                if not fused:
+                    with self.tracer.span("compile") as stage:
+                        compiled = self.sql_compiler.compile(interpreted)
+                        stage.set(fast_path=bool(compiled))
+                    if compiled:
+                        sql_query, params = compiled["sql"], compiled["params"]
+                    else:
+                        async with self.llm_limit.get():
+                            with self.tracer.span("generate_sql"):
+                                sql_query = await self.sql_generation_agent.agenerate_sql(interpreted)
+                elif not sql_query:
+                    sql_query = "Lo siento, no se pudo generar la consulta SQL."
+
+                if sql_query.startswith("Lo siento"):
+                    return self._not_a_query(sql_query)
+            generated = (sql_query, params)
+
+            with self.tracer.span("cost_guard") as stage:
+                check = await asyncio.to_thread(self.cost_guard.check, sql_query, params, question)
+                self._annotate_check(stage, check)
+            if not check["allowed"]:
+                return self._rejected(check)
+            sql_query, params = check["sql"], check["params"]
+
+            with self.tracer.span("execute") as stage:
+                if executions is None:
+                    result = await self.execution_agent.aexecute_query(sql_query, params)
+                else:
+                    key = (sql_query, json.dumps(params, default=str))
+                    stage.set(shared=key in executions)
+                    if key not in executions:
+                        executions[key] = asyncio.ensure_future(
+                            self.execution_agent.aexecute_query(sql_query, params)
+                        )
+                    result = await executions[key]
+                self._annotate_result(stage, result)
+            self._store_template(template, generated, result)
+            return self._build_response(sql_query, params, result, check)
+
+    def process_batch(self, questions, parallelism=None, fused=None):
+        """
+        Procesa una lista de preguntas de forma concurrente (ver aprocess_batch).
+        No se puede llamar desde un event loop en marcha: ahí usar aprocess_batch.
+        """
+        return asyncio.run(self.aprocess_batch(questions, parallelism=parallelism, fused=fused))
+
+    async def aprocess_batch(self, questions, parallelism=None, fused=None):
+        """
+        Procesa un lote de preguntas:
+        - Las preguntas idénticas (tras normalizar) se procesan una sola vez.
+        - Hasta `parallelism` preguntas avanzan a la vez por el pipeline async.
+        - Las consultas SQL idénticas del lote se ejecutan una sola vez en el pool.
+        Retorna {"results": [...], "timing": {...}}, con un resultado por pregunta
+        en el mismo orden de entrada.
+        """
+        if parallelism is None:
+            parallelism = int(os.getenv("SQLBOT_BATCH_PARALLELISM", "8"))
+        semaphore = asyncio.Semaphore(parallelism)
+        executions = {}
+
+        unique = {}
+        for question in questions:
+            unique.setdefault(normalize_question(question), question)
+
+        async def run_one(question):
+            async with semaphore:
+                start = time.perf_counter()
+                try:
+                    result = await self._aprocess_query(question, fused, executions)
+                except Exception as e:
+                    result = {"success": False, "error": str(e)}
+                return result, time.perf_counter() - start
+
+        batch_start = time.perf_counter()
+        outcomes = await asyncio.gather(*(run_one(q) for q in unique.values()))
+        total = time.perf_counter() - batch_start
+        by_key = dict(zip(unique.keys(), outcomes))
+
+        results, seen = [], set()
+        for question in questions:
+            key = normalize_question(question)
+            result, elapsed = by_key[key]
+            results.append({
+                "question": question,
+                "result": result,
+                "elapsed": elapsed,
+                "deduplicated": key in seen
+            })
+            seen.add(key)
+
+        elapsed_values = [elapsed for _, elapsed in outcomes]
+        return {
+            "results": results,
+            "timing": {
+                "total": total,
+                "sum_of_questions": sum(elapsed_values),
+                "slowest": max(elapsed_values, default=0.0),
+                "mean": sum(elapsed_values) / len(elapsed_values) if elapsed_values else 0.0,
+                "questions": len(questions),
+                "unique_questions": len(unique),
+                "unique_executions": len(executions),
+                "parallelism": parallelism
             }
+        }
+
+    # --------------------------------------------
+    # Streaming
+    # --------------------------------------------
+    def stream_query(self, question: str, fused=None, answer=False):
+        """
+        Variante de process_query que entrega eventos a medida que avanza, para
+        mostrar la salida del LLM token a token:
+          {"event": "token", "stage", "text"}   trozo de la respuesta del LLM
+          {"event": "sql", "sql", "params"}     SQL completo; ya se está validando y ejecutando
+          {"event": "rows", "data"}             primer bloque de filas del resultado
+          {"event": "reset"}                    el SQL y las filas ya enviados se descartaron
+                                                (la sentencia definitiva es otra); llega un "sql" nuevo
+          {"event": "response", "response"}     resultado final, como el de process_query
+        El SQL se valida y ejecuta en cuanto llega su ';', aunque el LLM siga
+        enviando texto. Con `answer=True` se añade una respuesta en lenguaje
+        natural (etapa "answer") en response["answer"].
+        Mide las etapas time_to_first_output y time_to_first_row.
+        """
+        events = queue.Queue()
+        cancelled = threading.Event()
+        # El pipeline corre en otro hilo con el contexto actual: sus spans quedan
+        # en la traza del llamador, como con process_query
+        context = contextvars.copy_context()
+        worker = threading.Thread(
+            target=context.run,
+            args=(self._stream_pipeline, question, fused, answer, events.put, cancelled),
+            name="sqlbot-stream",
+            daemon=True
+        )
+        worker.start()
+        try:
+            while True:
+                event = events.get()
+                if event is None:
+                    break
+                yield event
+        finally:
+            # Si el llamador deja de leer, el pipeline se detiene en el siguiente trozo
+            cancelled.set()
+
+    def _stream_pipeline(self, question, fused, answer, emit, cancelled):
+        if fused is None:
+            fused = self.fused_mode
+        start = time.perf_counter()
+        shown = threading.Event()
+
+        def show(event):
+            # La primera salida visible marca el time-to-first-output
+            if not shown.is_set():
+                shown.set()
+                self.tracer.record("time_to_first_output", time.perf_counter() - start)
+            emit(event)
+
+        try:
+            with self.tracer.span("process_query", fused=fused, streaming=True):
+                response = self._stream_steps(question, fused, answer, show, cancelled, start)
+            if response is not None:
+                emit({"event": "response", "response": response})
+        except Exception as e:
+            emit({"event": "response", "response": {"success": False, "error": str(e)}})
+        finally:
+            emit(None)
+
+    def _stream_steps(self, question, fused, answer, show, cancelled, start):
+        execution = None  # Ejecución en curso (ver _start_execution)
+        interpreted = {}
+        # Ordena los eventos de una ejecución descartada frente al "reset" que la retira de la UI
+        events_lock = threading.Lock()
+
+        def execute(sql_query, params):
+            show({"event": "sql", "sql": sql_query, "params": params})
+            return self._start_execution(sql_query, params, question, show, start, events_lock)
+
+        def early(statement):
+            # Solo lecturas puras: una escritura (incluido WITH ... UPDATE/DELETE)
+            # no se ejecuta antes de tener la respuesta completa
+            if statement and execution is None and is_read_only(statement):
+                return execute(statement, None)
+            return execution
+
+        # 0) Plantilla de una pregunta con la misma forma: sin llamadas al LLM
+        template = self._lookup_template(question)
+        if template and template["sql"] is not None:
+            sql_query, params = template["sql"], template["params"]
+            execution = execute(sql_query, params)
+        else:
+            # 1) Interpretación (y SQL, en modo de una sola llamada)
+            sql_query, params = None, None
+            if fused:
+                with self.tracer.span("interpret_and_generate"):
+                    cached, request = self.fused_agent._prepare(question)
+                    if cached is not None:
+                        interpreted, sql_query = cached
+                    else:
+                        detector = SQLStatementDetector(json_key=True)
+                        raw = []
+                        for text in self._stream_tokens(request, "interpret_and_generate", show, cancelled):
+                            raw.append(text)
+                            execution = early(detector.feed(text))
+                        if cancelled.is_set():
+                            return None
+                        interpreted, sql_query = self.fused_agent._parse("".join(raw).strip(), request)
+            else:
+                with self.tracer.span("interpret"):
+                    cached, request = self.user_query_agent._prepare(question)
+                    if cached is not None:
+                        interpreted = cached
+                    else:
+                        raw = "".join(self._stream_tokens(request, "interpret", show, cancelled))
+                        if cancelled.is_set():
+                            return None
+                        interpreted = self.user_query_agent._parse(raw.strip(), request)
+
+            # Verificar si la intención está relacionada con la BD
+            if not interpreted.get("tabla"):
+                return self._not_a_query("Lo siento, solo respondo consultas de base de datos.")
+
+            # 2) Generar SQL: primero el compilador de reglas, luego el LLM
+            if not fused:
+                with self.tracer.span("compile") as stage:
+                    compiled = self.sql_compiler.compile(interpreted)
+                    stage.set(fast_path=bool(compiled))
+                if compiled:
+                    sql_query, params = compiled["sql"], compiled["params"]
+                else:
+                    with self.tracer.span("generate_sql"):
+                        sql_query, request = self.sql_generation_agent._prepare(interpreted)
+                        if request is not None:
+                            detector = SQLStatementDetector()
+                            raw = []
+                            for text in self._stream_tokens(request, "generate_sql", show, cancelled):
+                                raw.append(text)
+                                execution = early(detector.feed(text))
+                            if cancelled.is_set():
+                                return None
+                            sql_query = self.sql_generation_agent._finish("".join(raw).strip(), request)
+            elif not sql_query:
+                sql_query = "Lo siento, no se pudo generar la consulta SQL."
+
+            if sql_query.startswith("Lo siento"):
+                return self._not_a_query(sql_query)
+
+            # Si la sentencia ejecutada antes de tiempo no es la definitiva, se descarta
+            if execution is not None and (execution["params"] != params or
+                                          _normalize_sql(execution["sql"]) != _normalize_sql(sql_query)):
+                with events_lock:
+                    execution["discarded"] = True
+                    show({"event": "reset"})
+                execution = None
+            if execution is None:
+                execution = execute(sql_query, params)
+        generated = (sql_query, params)
 
-        # 3) Ejecutar la consulta
-        result = self.execution_agent.execute_query(sql_query)
+        # 3) y 4) Control de costo y ejecución (ya en marcha en otro hilo)
+        response, result = execution["future"].result()
+        # Solo cuenta la primera fila de la ejecución cuyo resultado se entrega
+        if execution["first_row"] is not None:
+            self.tracer.record("time_to_first_row", execution["first_row"])
+        if result is not None:
+            self._store_template(template, generated, result)
 
+        # 5) Respuesta en lenguaje natural, también por tokens
+        if answer and response.get("success") and response.get("data") is not None:
+            with self.tracer.span("answer"):
+                structure = {"pregunta": question, **interpreted}
+                chunks = []
+                for text in self.response_agent.stream_response(structure, response["data"]):
+                    if cancelled.is_set():
+                        return None
+                    chunks.append(text)
+                    show({"event": "token", "stage": "answer", "text": text})
+                response["answer"] = "".join(chunks).strip()
+        return response
+
+    def _stream_tokens(self, request, stage, show, cancelled):
+        """Trozos del LLM para `request`, enviados a la UI; se corta si el llamador deja de leer."""
+        for text in stream_chain(request["chain"], request["inputs"]):
+            if cancelled.is_set():
+                return
+            show({"event": "token", "stage": stage, "text": text})
+            yield text
+
+    def _start_execution(self, sql_query, params, question, show, start, events_lock):
+        """
+        Control de costo y ejecución en un hilo aparte, para no esperar a que el
+        LLM termine de enviar texto. Retorna {"sql", "params", "future",
+        "first_row", "discarded"}: el Future da (respuesta, resultado o None) y
+        "first_row" los segundos hasta la primera fila. Una ejecución marcada
+        como descartada ya no envía filas a la UI.
+        """
+        future = Future()
+        context = contextvars.copy_context()
+        execution = {"sql": sql_query, "params": params, "future": future, "first_row": None, "discarded": False}
+
+        def first_rows(chunk):
+            with events_lock:
+                if execution["discarded"] or execution["first_row"] is not None:
+                    return
+                execution["first_row"] = time.perf_counter() - start
+                show({"event": "rows", "data": chunk.head(int(os.getenv("RESULT_PREVIEW_ROWS", "10")))})
+
+        def run():
+            try:
+                with self.tracer.span("cost_guard") as stage:
+                    check = self.cost_guard.check(sql_query, params, label=question)
+                    self._annotate_check(stage, check)
+                if not check["allowed"]:
+                    future.set_result((self._rejected(check), None))
+                    return
+                with self.tracer.span("execute") as stage:
+                    result = self.execution_agent.execute_query(check["sql"], check["params"], on_chunk=first_rows)
+                    self._annotate_result(stage, result)
+                future.set_result((self._build_response(check["sql"], check["params"], result, check), result))
+            except Exception as e:
+                future.set_exception(e)
+
+        threading.Thread(target=context.run, args=(run,), name="sqlbot-execute", daemon=True).start()
+        return execution
+
+    def _lookup_template(self, question):
+        """Busca una plantilla para la pregunta (None si el caché de plantillas está desactivado)."""
+        if self.template_cache is None:
+            return None
+        with self.tracer.span("template_cache") as stage:
+            template = self.template_cache.lookup(question)
+            stage.set(literals=len(template["literals"]))
+            if template["literals"]:
+                stage.set(cache_hit=template["sql"] is not None)
+        return template
+
+    def _store_template(self, template, generated, result):
+        # Solo se aprende de SQL recién generado que se ejecutó sin error
+        if template and template["sql"] is None and result.get("success"):
+            self.template_cache.store(template, *generated)
+
+    @staticmethod
+    def _not_a_query(message):
+        return {
+            "success": True,
+            "message": message,
+            "is_query": False
+        }
+
+    @staticmethod
+    def _annotate_check(stage, check):
+        stage.set(action=check["action"])
+        if check["cost"] and check["cost"]["estimated_rows"] is not None:
+            stage.set(estimated_rows=check["cost"]["estimated_rows"])
+
+    @staticmethod
+    def _annotate_result(stage, result):
+        if result.get("row_count") is not None:
+            stage.set(rows=result["row_count"], bytes=result.get("bytes") or 0)
+        if "cached" in result or result.get("row_count") is not None:
+            stage.set(cache_hit=bool(result.get("cached")))
+
+    @staticmethod
+    def _rejected(check):
+        return {
+            "success": False,
+            "error": check["message"],
+            "cost": check["cost"]
+        }
+
+    def _build_response(self, sql_query, params, result, check=None):
         # Estructurar la respuesta final
         if result["success"]:
             response = {
                 "success": True,
-                "sql_query": sql_query,
+                "sql_query": self.sql_compiler.render({"sql": sql_query, "params": params}) if params else sql_query,
                 "is_query": True
             }
             if result["data"] is not None and not result["data"].empty:
                 response["data"] = result["data"]
-            if result["message"]:
-                response["message"] = result["message"]
+            messages = [m for m in (check and check["message"], result["message"]) if m]
+            if messages:
+                response["message"] = " ".join(messages)
+            if check and check["cost"]:
+                response["cost"] = {**check["cost"], "action": check["action"]}
+            if result.get("truncated"):
+                response["truncated"] = True
+            if result.get("cached"):
+                response["cached"] = True
             return response
         else:
             return {
@@ -232,11 +1227,66 @@ class SQLBot:
     # --------------------------------------------
     # Métodos individuales para frontend (opcional)
     # --------------------------------------------
+    # Cada paso se mide como una etapa; si el llamador abre un span
+    # (ej. app.py con tracer.span("app_query")), quedan agrupados en esa traza.
     def interpret_user_query(self, question: str):
-        return self.user_query_agent.interpret(question)
+        with self.tracer.span("interpret"):
+            return self.user_query_agent.interpret(question)
 
     def generate_sql(self, query_structure: dict):
-        return self.sql_generation_agent.generate_sql(query_structure)
+        with self.tracer.span("compile") as stage:
+            compiled = self.sql_compiler.compile(query_structure)
+            stage.set(fast_path=bool(compiled))
+        if compiled:
+            return self.sql_compiler.render(compiled)
+        with self.tracer.span("generate_sql"):
+            return self.sql_generation_agent.generate_sql(query_structure)
+
+    def execute_query(self, sql_query: str, params=None):
+        with self.tracer.span("cost_guard") as stage:
+            check = self.cost_guard.check(sql_query, params)
+            self._annotate_check(stage, check)
+        if not check["allowed"]:
+            return {"success": False, "data": None, "message": check["message"], "cost": check["cost"]}
+        with self.tracer.span("execute") as stage:
+            result = self.execution_agent.execute_query(check["sql"], check["params"])
+            self._annotate_result(stage, result)
+        return self._with_cost(result, check)
+
+    async def ainterpret_user_query(self, question: str):
+        async with self.llm_limit.get():
+            with self.tracer.span("interpret"):
+                return await self.user_query_agent.ainterpret(question)
+
+    async def agenerate_sql(self, query_structure: dict):
+        with self.tracer.span("compile") as stage:
+            compiled = self.sql_compiler.compile(query_structure)
+            stage.set(fast_path=bool(compiled))
+        if compiled:
+            return self.sql_compiler.render(compiled)
+        async with self.llm_limit.get():
+            with self.tracer.span("generate_sql"):
+                return await self.sql_generation_agent.agenerate_sql(query_structure)
+
+    async def aexecute_query(self, sql_query: str, params=None):
+        with self.tracer.span("cost_guard") as stage:
+            check = await asyncio.to_thread(self.cost_guard.check, sql_query, params)
+            self._annotate_check(stage, check)
+        if not check["allowed"]:
+            return {"success": False, "data": None, "message": check["message"], "cost": check["cost"]}
+        with self.tracer.span("execute") as stage:
+            result = await self.execution_agent.aexecute_query(check["sql"], check["params"])
+            self._annotate_result(stage, result)
+        return self._with_cost(result, check)
 
-    def execute_query(self, sql_query: str):
-        return self.execution_agent.execute_query(sql_query)
+    @staticmethod
+    def _with_cost(result, check):
+        # Copia: el resultado puede venir del caché de resultados
+        result = dict(result)
+        if check["cost"]:
+            result["cost"] = {**check["cost"], "action": check["action"]}
+        if check["action"] in ("limited", "rewritten"):
+            result["sql_query"] = check["sql"]
+        if check["message"]:
+            result["message"] = " ".join(m for m in (check["message"], result.get("message")) if m)
+        return result
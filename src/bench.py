@@ -0,0 +1,351 @@
+"""
+Benchmark reproducible del pipeline completo sin servicios externos:
+LLM determinista (FakeLLM) con latencia configurable y una BD local
+(FakeDatabase) con 10/100/1000 tablas generadas.
+
+Mide, para cada tamaño de esquema:
+- Introspección en frío de DatabaseSchemaAgent (tiempo y viajes a la BD).
+- Resumen de datos de TableDataSummarizer en frío y con caché.
+- SQLBot.process_query sobre un conjunto de preguntas: throughput, p50/p95
+  por pregunta y por etapa (trazas del Tracer), viajes a la BD por pregunta,
+  llamadas y tokens del LLM.
+- SQLBot.stream_query sobre las mismas preguntas: tiempo hasta la primera
+  salida visible y hasta la primera fila, frente a la latencia completa.
+- Memoria pico de cada escenario (tracemalloc).
+
+Con --baseline se compara contra un resultado anterior (--json) y el proceso
+termina con código 1 si alguna métrica empeora más que --tolerance.
+
+Uso:
+    python bench.py [--tables 10 100 1000] [--questions 40] [--llm-latency 0.05]
+                    [--db-latency 0.0005] [--llm-token-interval 0.005] [--fused] [--json salida.json]
+                    [--baseline base.json --tolerance 0.25]
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import tempfile
+import statistics
+import tracemalloc
+
+# Sin cachés en disco: cada ejecución parte de cero y no ensucia el proyecto
+os.environ.setdefault("LLM_CACHE_PATH", "")
+os.environ.setdefault("COLUMN_PROFILE_PATH", "")
+os.environ.setdefault("VALUE_INDEX_PATH", "")
+os.environ.setdefault("SCHEMA_SNAPSHOT_PATH", "")
+# El calentamiento se lanza de forma explícita para no medirlo junto con las preguntas
+os.environ.setdefault("SQLBOT_WARMUP", "false")
+
+from fakedb import FakeDatabase, CIUDADES
+from fakellm import FakeLLM
+from conection import DatabaseSchemaAgent
+from TableDataSummarizer import TableDataSummarizer
+from backend5 import SQLBot
+
+# Métricas comparadas con --baseline: (ruta, True si mayor es mejor)
+TRACKED = [
+    (("schema", "seconds"), False),
+    (("schema", "round_trips"), False),
+    (("summary", "cold_seconds"), False),
+    (("pipeline", "throughput"), True),
+    (("pipeline", "p95"), False),
+    (("pipeline", "round_trips_per_question"), False),
+    (("pipeline", "peak_mb"), False),
+    (("cold_start", "snapshot_first_seconds"), False),
+    (("streaming", "first_output_p50"), False),
+]
+
+
+def percentile(values, q):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(0, int(round(q * len(ordered))) - 1))]
+
+
+def measured(fn):
+    """Ejecuta fn y retorna (resultado, segundos, MB pico de memoria)."""
+    tracemalloc.reset_peak()
+    start = time.perf_counter()
+    result = fn()
+    elapsed = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1] / (1024 * 1024)
+    return result, elapsed, peak
+
+
+def make_questions(n_tables, count):
+    questions = []
+    for i in range(count):
+        table = f"tabla_{(i * 7) % n_tables:04d}"
+        city = CIUDADES[i % len(CIUDADES)]
+        if i % 2:
+            questions.append(f"Lista los registros de {city} en {table}")
+        else:
+            questions.append(f"¿Cuántos registros de {city} hay en {table}?")
+    return questions
+
+
+def bench_schema(db):
+    agent = DatabaseSchemaAgent(db.connect, db.db_name)
+    db.reset_counters()
+    schema, elapsed, peak = measured(agent.get_schema_dict)
+    return {"seconds": elapsed, "round_trips": db.round_trips, "tables": len(schema), "peak_mb": peak}
+
+
+def bench_summary(db, sample_tables):
+    agent = DatabaseSchemaAgent(db.connect, db.db_name)
+    agent.get_schema_dict()
+    tables = list(agent.get_schema_dict())[:sample_tables]
+    summarizer = TableDataSummarizer(agent, db.connect)
+    db.reset_counters()
+    _, cold, peak = measured(lambda: summarizer.get_all_tables_summary(tables))
+    cold_trips = db.round_trips
+    db.reset_counters()
+    _, warm, _ = measured(lambda: summarizer.get_all_tables_summary(tables))
+    return {
+        "tables": len(tables),
+        "cold_seconds": cold,
+        "warm_seconds": warm,
+        "cold_round_trips": cold_trips,
+        "warm_round_trips": db.round_trips,
+        "peak_mb": peak,
+    }
+
+
+def bench_pipeline(db, llm, questions, fused):
+    bot = SQLBot(llm=llm, connect=db.connect)
+    bot.update_credentials(db_name=db.db_name)
+    bot.warm_up(background=False)  # Como en un servidor ya iniciado y calentado
+    bot.tracer.reset()
+    llm.reset_counters()
+    db.reset_counters()
+
+    latencies, failures = [], 0
+
+    def run():
+        nonlocal failures
+        for question in questions:
+            start = time.perf_counter()
+            response = bot.process_query(question, fused=fused)
+            latencies.append(time.perf_counter() - start)
+            failures += not response.get("success")
+
+    _, elapsed, peak = measured(run)
+    stages = {
+        name: {"count": data["count"], "p50": data["p50"], "p95": data["p95"]}
+        for name, data in bot.get_stage_stats().items()
+    }
+    bot.pool.close()
+    return {
+        "questions": len(questions),
+        "failures": failures,
+        "seconds": elapsed,
+        "throughput": len(questions) / elapsed if elapsed else 0.0,
+        "p50": statistics.median(latencies),
+        "p95": percentile(latencies, 0.95),
+        "round_trips_per_question": db.round_trips / len(questions),
+        "llm_calls": llm.calls,
+        "prompt_tokens": llm.prompt_tokens,
+        "completion_tokens": llm.completion_tokens,
+        "peak_mb": peak,
+        "stages": stages,
+    }
+
+
+def bench_cold_start(db, llm, question):
+    """
+    Primera pregunta de un proceso nuevo, hecha nada más arrancar (con el
+    calentamiento aún en segundo plano): sin instantánea y con la instantánea que
+    dejó el arranque anterior. Las cachés en disco van a un directorio temporal,
+    como las de un despliegue real.
+    """
+    directory = tempfile.mkdtemp(prefix="sqlbot-bench-")
+    keys = ("SCHEMA_SNAPSHOT_PATH", "COLUMN_PROFILE_PATH", "VALUE_INDEX_PATH", "SQLBOT_WARMUP")
+    previous = {key: os.environ.get(key) for key in keys}
+    for key in keys[:-1]:
+        os.environ[key] = os.path.join(directory, f"{key.lower()}.sqlite")
+    os.environ["SQLBOT_WARMUP"] = "true"
+    result = {}
+    try:
+        for label in ("cold", "snapshot"):
+            start = time.perf_counter()
+            bot = SQLBot(llm=llm, connect=db.connect)
+            bot.update_credentials(db_name=db.db_name)
+            result[f"{label}_init_seconds"] = time.perf_counter() - start
+            asked = time.perf_counter()
+            bot.process_query(question)
+            result[f"{label}_first_seconds"] = time.perf_counter() - asked
+            bot.wait_warm_up()  # Al terminar deja la instantánea para el siguiente arranque
+            result[f"{label}_ready_seconds"] = time.perf_counter() - start
+            bot.pool.close()
+    finally:
+        for key, value in previous.items():
+            if value is None:
+                os.environ.pop(key, None)
+            else:
+                os.environ[key] = value
+        shutil.rmtree(directory, ignore_errors=True)
+    return result
+
+
+def bench_streaming(db, llm, questions, fused):
+    """
+    Las mismas preguntas con process_query y con stream_query, cada una con un
+    bot nuevo (sin plantillas ni cachés compartidas): latencia completa frente
+    al tiempo hasta la primera salida visible y hasta la primera fila.
+    """
+    full = []
+    bot = SQLBot(llm=llm, connect=db.connect)
+    bot.update_credentials(db_name=db.db_name)
+    bot.warm_up(background=False)
+    for question in questions:
+        start = time.perf_counter()
+        bot.process_query(question, fused=fused)
+        full.append(time.perf_counter() - start)
+    bot.pool.close()
+
+    first_output, first_row, total = [], [], []
+    bot = SQLBot(llm=llm, connect=db.connect)
+    bot.update_credentials(db_name=db.db_name)
+    bot.warm_up(background=False)
+    for question in questions:
+        start = time.perf_counter()
+        output = row = None
+        for event in bot.stream_query(question, fused=fused):
+            now = time.perf_counter() - start
+            if output is None and event["event"] != "response":
+                output = now
+            if row is None and event["event"] == "rows":
+                row = now
+        total.append(time.perf_counter() - start)
+        first_output.append(output if output is not None else total[-1])
+        if row is not None:
+            first_row.append(row)
+    bot.pool.close()
+    return {
+        "full_p50": statistics.median(full),
+        "stream_p50": statistics.median(total),
+        "first_output_p50": statistics.median(first_output),
+        "first_row_p50": statistics.median(first_row) if first_row else None,
+    }
+
+
+def compare(results, baseline, tolerance):
+    """Retorna la lista de regresiones frente a la línea base."""
+    regressions = []
+    for n, current in results.items():
+        previous = baseline.get(str(n)) or baseline.get(n)
+        if not previous:
+            continue
+        for (section, metric), higher_is_better in TRACKED:
+            old = previous.get(section, {}).get(metric)
+            new = current.get(section, {}).get(metric)
+            if not old or new is None:
+                continue
+            change = (new - old) / old
+            if (higher_is_better and change < -tolerance) or (not higher_is_better and change > tolerance):
+                regressions.append(f"{n} tablas: {section}.{metric} {old:.4g} -> {new:.4g} ({change:+.0%})")
+    return regressions
+
+
+def print_report(n, result):
+    schema, summary, pipeline = result["schema"], result["summary"], result["pipeline"]
+    print(f"\n=== {n} tablas ===")
+    print(f"esquema:  {schema['seconds']:.3f} s, {schema['round_trips']} viajes, pico {schema['peak_mb']:.1f} MB")
+    print(
+        f"resumen:  {summary['tables']} tablas, frío {summary['cold_seconds']:.3f} s "
+        f"({summary['cold_round_trips']} viajes), caché {summary['warm_seconds']:.3f} s "
+        f"({summary['warm_round_trips']} viajes)"
+    )
+    print(
+        f"pipeline: {pipeline['throughput']:.1f} preguntas/s, p50 {pipeline['p50'] * 1000:.1f} ms, "
+        f"p95 {pipeline['p95'] * 1000:.1f} ms, {pipeline['round_trips_per_question']:.1f} viajes/pregunta, "
+        f"{pipeline['llm_calls']} llamadas LLM, {pipeline['prompt_tokens']} tokens de prompt, "
+        f"pico {pipeline['peak_mb']:.1f} MB, {pipeline['failures']} fallos"
+    )
+    cold = result.get("cold_start")
+    if cold:
+        print(
+            f"arranque: sin instantánea {cold['cold_init_seconds'] * 1000:.1f} ms + primera pregunta "
+            f"{cold['cold_first_seconds'] * 1000:.1f} ms; con instantánea {cold['snapshot_init_seconds'] * 1000:.1f} ms "
+            f"+ primera pregunta {cold['snapshot_first_seconds'] * 1000:.1f} ms "
+            f"(calentamiento completo a los {cold['snapshot_ready_seconds']:.2f} s)"
+        )
+    streaming = result.get("streaming")
+    if streaming:
+        first_row = streaming["first_row_p50"]
+        print(
+            f"streaming: primera salida p50 {streaming['first_output_p50'] * 1000:.1f} ms, primera fila p50 "
+            + (f"{first_row * 1000:.1f} ms" if first_row is not None else "-")
+            + f", completa p50 {streaming['stream_p50'] * 1000:.1f} ms "
+            f"(sin streaming {streaming['full_p50'] * 1000:.1f} ms)"
+        )
+    print(f"{'etapa':>24} | {'n':>5} | {'p50 (ms)':>9} | {'p95 (ms)':>9}")
+    for stage, data in pipeline["stages"].items():
+        print(f"{stage:>24} | {data['count']:>5} | {data['p50'] * 1000:>9.2f} | {data['p95'] * 1000:>9.2f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--tables", type=int, nargs="+", default=[10, 100, 1000])
+    parser.add_argument("--rows", type=int, default=50, help="Filas por tabla")
+    parser.add_argument("--questions", type=int, default=40)
+    parser.add_argument("--summary-tables", type=int, default=50, help="Tablas incluidas en el resumen de datos")
+    parser.add_argument("--llm-latency", type=float, default=0.05, help="Segundos fijos por llamada al LLM")
+    parser.add_argument("--llm-latency-per-token", type=float, default=0.0, help="Segundos por token de prompt")
+    parser.add_argument("--llm-token-interval", type=float, default=0.005,
+                        help="Segundos por token de la respuesta del LLM")
+    parser.add_argument("--db-latency", type=float, default=0.0005, help="Segundos por viaje a la BD")
+    parser.add_argument("--fused", action="store_true", help="Usar el modo de una sola llamada al LLM")
+    parser.add_argument("--json", help="Guardar los resultados en este archivo")
+    parser.add_argument("--baseline", help="Resultados anteriores (--json) con los que comparar")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="Empeoramiento relativo permitido")
+    args = parser.parse_args()
+
+    # Pasada previa sin medir: importaciones perezosas y cachés del intérprete
+    warm_db = FakeDatabase(n_tables=2, rows_per_table=5)
+    bench_summary(warm_db, 2)
+    bench_pipeline(warm_db, FakeLLM(), make_questions(2, 2), args.fused)
+
+    tracemalloc.start()
+    results = {}
+    for n in args.tables:
+        db = FakeDatabase(n_tables=n, rows_per_table=args.rows, latency=args.db_latency)
+        llm = FakeLLM(
+            latency=args.llm_latency,
+            latency_per_token=args.llm_latency_per_token,
+            token_interval=args.llm_token_interval
+        )
+        results[n] = {
+            "schema": bench_schema(db),
+            "summary": bench_summary(db, args.summary_tables),
+            "pipeline": bench_pipeline(db, llm, make_questions(n, args.questions), args.fused),
+        }
+        # El arranque en frío solo mide tiempos: sin tracemalloc, que lo distorsiona
+        tracemalloc.stop()
+        results[n]["cold_start"] = bench_cold_start(db, llm, make_questions(n, 1)[0])
+        results[n]["streaming"] = bench_streaming(db, llm, make_questions(n, 10), args.fused)
+        tracemalloc.start()
+        print_report(n, results[n])
+    tracemalloc.stop()
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        if regressions:
+            print("\nRegresiones frente a la línea base:")
+            for line in regressions:
+                print(f"  - {line}")
+            sys.exit(1)
+        print("\nSin regresiones frente a la línea base.")
+
+
+if __name__ == "__main__":
+    main()
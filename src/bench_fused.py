@@ -0,0 +1,81 @@
+"""
+Comparación de latencia y tokens entre el pipeline de dos llamadas
+(interpret + generate_sql) y el modo de una sola llamada de SQLBot.process_query.
+
+Uso:
+    python bench_fused.py [--tables 300] [--questions 20] [--latency 0.2] [--latency-per-token 0.0001]
+"""
+import os
+import time
+import argparse
+import statistics
+
+# Sin cachés en disco: cada ejecución parte de cero (como en bench.py)
+os.environ.setdefault("LLM_CACHE_PATH", "")  # Solo memoria: se vacía antes de cada pregunta
+os.environ.setdefault("COLUMN_PROFILE_PATH", "")
+os.environ.setdefault("VALUE_INDEX_PATH", "")
+os.environ.setdefault("SCHEMA_SNAPSHOT_PATH", "")
+os.environ.setdefault("SQLBOT_WARMUP", "false")
+# Sin el compilador de reglas: en el pipeline de dos llamadas el SQL también lo escribe el LLM
+os.environ["SQLBOT_COMPILER"] = "false"
+
+from fakedb import FakeDatabase, CIUDADES
+from fakellm import FakeLLM
+from backend5 import SQLBot
+
+
+def run(bot, llm, questions, fused):
+    llm.reset_counters()
+    latencies = []
+    for question in questions:
+        # Cada pregunta pasa por el LLM: sin respuestas, plantillas ni resultados guardados
+        bot.llm_cache.clear()
+        bot.template_cache.clear()
+        bot.result_cache.clear()
+        start = time.perf_counter()
+        response = bot.process_query(question, fused=fused)
+        latencies.append(time.perf_counter() - start)
+        assert response["success"], response
+    return {
+        "llm_calls": llm.calls,
+        "prompt_tokens": llm.prompt_tokens,
+        "completion_tokens": llm.completion_tokens,
+        "p50": statistics.median(latencies),
+        "mean": statistics.mean(latencies),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--tables", type=int, default=300)
+    parser.add_argument("--questions", type=int, default=20)
+    parser.add_argument("--latency", type=float, default=0.2, help="Segundos fijos por llamada al LLM")
+    parser.add_argument("--latency-per-token", type=float, default=0.0001, help="Segundos por token de prompt")
+    args = parser.parse_args()
+
+    db = FakeDatabase(n_tables=args.tables, rows_per_table=20)
+    llm = FakeLLM(latency=args.latency, latency_per_token=args.latency_per_token)
+    bot = SQLBot(llm=llm, connect=db.connect)
+    bot.update_credentials(db_name=db.db_name)
+
+    questions = [
+        f"¿Cuántos registros de {CIUDADES[i % len(CIUDADES)]} hay en tabla_{i % args.tables:04d}?"
+        for i in range(args.questions)
+    ]
+    two_stage = run(bot, llm, questions, fused=False)
+    fused = run(bot, llm, questions, fused=True)
+    # Si no, la comparación no mide nada (ej. una caché o el compilador evitó llamadas)
+    assert two_stage["llm_calls"] == 2 * len(questions), two_stage
+    assert fused["llm_calls"] == len(questions), fused
+
+    print(f"{args.questions} preguntas, {args.tables} tablas")
+    print(f"{'':>20} | {'dos llamadas':>13} | {'una llamada':>13}")
+    print("-" * 52)
+    for key in ("llm_calls", "prompt_tokens", "completion_tokens"):
+        print(f"{key:>20} | {two_stage[key]:>13} | {fused[key]:>13}")
+    for key in ("p50", "mean"):
+        print(f"{key + ' (s)':>20} | {two_stage[key]:>13.3f} | {fused[key]:>13.3f}")
+
+
+if __name__ == "__main__":
+    main()
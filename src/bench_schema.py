@@ -0,0 +1,88 @@
+"""
+Benchmark de introspección del esquema: viajes a la BD y tiempo
+frente al número de tablas, comparando la lectura por tabla (2N+1 consultas)
+con la lectura en bloque de DatabaseSchemaAgent.
+
+Uso:
+    python bench_schema.py [--latency 0.002] [--tables 10 100 500]
+"""
+import time
+import argparse
+from fakedb import FakeDatabase
+from conection import DatabaseSchemaAgent
+
+
+def legacy_get_schema_dict(get_connection, db_name):
+    """Lectura anterior: una consulta de tablas y dos más por cada tabla (referencia)."""
+    conn = get_connection()
+    cursor = conn.cursor()
+    schema_dict = {}
+    try:
+        cursor.execute("""
+            SELECT table_name
+            FROM information_schema.tables
+            WHERE table_schema = %s;
+        """, (db_name,))
+        for (table_name,) in cursor.fetchall():
+            cursor.execute("""
+                SELECT column_name, data_type, column_key
+                FROM information_schema.columns
+                WHERE table_schema = %s AND table_name = %s;
+            """, (db_name, table_name))
+            columns_data = cursor.fetchall()
+            cursor.execute("""
+                SELECT column_name, referenced_table_name, referenced_column_name
+                FROM information_schema.key_column_usage
+                WHERE table_schema = %s
+                  AND table_name = %s
+                  AND referenced_table_name IS NOT NULL;
+            """, (db_name, table_name))
+            relations = cursor.fetchall()
+            schema_dict[table_name] = {
+                "columns": {c[0]: {"type": c[1], "key": c[2]} for c in columns_data},
+                "relations": [
+                    {"column": r[0], "referenced_table": r[1], "referenced_column": r[2]}
+                    for r in relations
+                ]
+            }
+        return schema_dict
+    finally:
+        cursor.close()
+        conn.close()
+
+
+def measure(fn, db):
+    db.reset_counters()
+    start = time.perf_counter()
+    schema = fn()
+    elapsed = time.perf_counter() - start
+    return schema, db.round_trips, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--latency", type=float, default=0.002, help="Segundos por viaje a la BD")
+    parser.add_argument("--tables", type=int, nargs="+", default=[10, 100, 500])
+    args = parser.parse_args()
+
+    print(f"{'tablas':>7} | {'viajes antes':>12} | {'viajes ahora':>12} | {'t antes (s)':>11} | {'t ahora (s)':>11}")
+    print("-" * 66)
+    for n in args.tables:
+        db = FakeDatabase(n_tables=n, rows_per_table=1, latency=args.latency)
+        agent = DatabaseSchemaAgent(db.connect, db.db_name)
+
+        old_schema, old_trips, old_time = measure(
+            lambda: legacy_get_schema_dict(db.connect, db.db_name), db)
+        new_schema, new_trips, new_time = measure(agent.get_schema_dict, db)
+
+        # Ambas lecturas deben describir las mismas columnas y relaciones
+        assert old_schema.keys() == new_schema.keys()
+        for table, details in old_schema.items():
+            assert details["columns"].keys() == new_schema[table]["columns"].keys()
+            assert details["relations"] == new_schema[table]["relations"]
+
+        print(f"{n:>7} | {old_trips:>12} | {new_trips:>12} | {old_time:>11.3f} | {new_time:>11.3f}")
+
+
+if __name__ == "__main__":
+    main()
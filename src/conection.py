@@ -1,75 +1,312 @@
+import os
+import json
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+from decimal import Decimal
+from tokens import estimate_tokens
+
+# Abreviaturas de tipos del esquema compacto (la primera clave de cada abreviatura es la de la leyenda)
+TYPE_ABBREVIATIONS = {
+    "int": "i", "integer": "i", "mediumint": "i", "bigint": "bi", "smallint": "si", "tinyint": "ti",
+    "decimal": "dec", "numeric": "dec", "float": "f", "double": "f", "real": "f",
+    "varchar": "s", "char": "s", "text": "t", "tinytext": "t", "mediumtext": "t", "longtext": "t",
+    "date": "d", "datetime": "dt", "timestamp": "ts", "time": "tm", "year": "y",
+    "boolean": "b", "bool": "b", "bit": "bit", "json": "j", "enum": "e", "set": "set",
+    "binary": "bin", "varbinary": "bin", "blob": "bin", "longblob": "bin",
+}
+
+# Columnas no clave que se conservan al recortar una tabla por presupuesto
+REDUCED_COLUMNS = 4
+
+# Textos de subconjuntos de tablas (contexto del retriever) memoizados por versión
+SUBSET_CACHE_ENTRIES = 256
+
+
 class DatabaseSchemaAgent:
     
-    def __init__(self, get_connection, db_name):
+    def __init__(self, get_connection, db_name, cache_ttl=None, schema_format=None):
+        """
+        :param get_connection: Función que retorna una conexión a la BD
+        :param db_name: Nombre del esquema a leer
+        :param cache_ttl: Segundos durante los que el esquema en caché se usa sin revalidar
+        :param schema_format: Formato del esquema en los prompts: "compact" o "verbose"
+        """
         self.get_connection = get_connection
         self.db_name = db_name
+        if cache_ttl is None:
+            cache_ttl = float(os.getenv("SCHEMA_CACHE_TTL", "60"))
+        self.cache_ttl = cache_ttl
+        self.schema_format = schema_format or os.getenv("SCHEMA_FORMAT", "compact").strip().lower()
+
         self.cached_schema = None  # Cache para evitar múltiples lecturas
+        self.schema_version = 0  # Sube cada vez que cambia el contenido del esquema
+        self.schema_fingerprint = None  # Hash del contenido (estable entre reinicios)
+        self.table_fingerprints = {}  # tabla -> (CREATE_TIME, nº de columnas)
+        self.table_update_times = {}  # tabla -> UPDATE_TIME (cambia con los datos)
+        self._checked_at = 0.0
+        self._schema_text = (None, None)  # (versión, texto)
+        self._compact_text = (None, None)  # (versión, texto compacto completo)
+        self._subset_texts = OrderedDict()  # (versión, formato, tablas) -> texto
+        self._lock = threading.RLock()
 
     def get_schema_dict(self):
-        if self.cached_schema:
+        with self._lock:
+            if self.cached_schema is not None and time.monotonic() - self._checked_at < self.cache_ttl:
+                return self.cached_schema
+            self.refresh()
             return self.cached_schema
 
+    def refresh(self, force=False):
+        """
+        Revalida el esquema con una consulta barata de huellas por tabla
+        y vuelve a leer solo las tablas nuevas o modificadas.
+        Retorna True si el contenido del esquema cambió.
+        """
+        with self._lock:
+            fingerprints, update_times = self._fetch_fingerprints()
+
+            if self.cached_schema is None or force:
+                schema_dict = self._introspect()
+            else:
+                changed = [t for t, fp in fingerprints.items() if self.table_fingerprints.get(t) != fp]
+                removed = [t for t in self.cached_schema if t not in fingerprints]
+                schema_dict = self.cached_schema
+                if changed or removed:
+                    schema_dict = {t: d for t, d in self.cached_schema.items() if t not in removed}
+                    if changed:
+                        schema_dict.update(self._introspect(changed))
+
+            self.table_fingerprints = fingerprints
+            self.table_update_times = update_times
+            self._checked_at = time.monotonic()
+
+            new_fingerprint = self._hash_schema(schema_dict)
+            if self.cached_schema is not None and new_fingerprint == self.schema_fingerprint:
+                return False
+            self.cached_schema = schema_dict
+            self.schema_fingerprint = new_fingerprint
+            self.schema_version += 1
+            return True
+
+    def _fetch_fingerprints(self):
+        """
+        Una sola consulta: CREATE_TIME, UPDATE_TIME y número de columnas por tabla.
+        La huella de esquema usa CREATE_TIME y columnas (cambian con el DDL);
+        UPDATE_TIME se guarda aparte porque cambia con cada escritura de datos.
+        """
         conn = self.get_connection()
         cursor = conn.cursor()
+        try:
+            cursor.execute("""
+                SELECT t.table_name, t.create_time, t.update_time, COUNT(c.column_name)
+                FROM information_schema.tables t
+                LEFT JOIN information_schema.columns c
+                  ON c.table_schema = t.table_schema AND c.table_name = t.table_name
+                WHERE t.table_schema = %s
+                GROUP BY t.table_name, t.create_time, t.update_time;
+            """, (self.db_name,))
+            fingerprints, update_times = {}, {}
+            for table_name, create_time, update_time, column_count in cursor.fetchall():
+                fingerprints[table_name] = (str(create_time), int(column_count))
+                update_times[table_name] = str(update_time) if update_time is not None else None
+            return fingerprints, update_times
+        finally:
+            cursor.close()
+            conn.close()
 
-        schema_dict = {}
-
+    def get_update_times(self):
+        """
+        Lee UPDATE_TIME de todas las tablas en una sola consulta
+        (para cachés que dependen de los datos, no del esquema).
+        """
+        conn = self.get_connection()
+        cursor = conn.cursor()
         try:
-            # 1. Obtener las tablas en la base de datos
             cursor.execute("""
-                SELECT table_name 
-                FROM information_schema.tables 
+                SELECT table_name, update_time
+                FROM information_schema.tables
                 WHERE table_schema = %s;
             """, (self.db_name,))
-            tables = cursor.fetchall()
-
-            for (table_name,) in tables:
-                # 2. Obtener columnas y tipo de datos
-                cursor.execute("""
-                    SELECT column_name, data_type, column_key
-                    FROM information_schema.columns
-                    WHERE table_schema = %s AND table_name = %s;
-                """, (self.db_name, table_name))
-                columns_data = cursor.fetchall()
-
-                # 3. Obtener relaciones (FK)
-                cursor.execute("""
-                    SELECT column_name, referenced_table_name, referenced_column_name
-                    FROM information_schema.key_column_usage
-                    WHERE table_schema = %s 
-                      AND table_name = %s
-                      AND referenced_table_name IS NOT NULL;
-                """, (self.db_name, table_name))
-                relations = cursor.fetchall()
-
-                # Estructurar la info
+            return {
+                table_name: str(update_time) if update_time is not None else None
+                for table_name, update_time in cursor.fetchall()
+            }
+        finally:
+            cursor.close()
+            conn.close()
+
+    @staticmethod
+    def _hash_schema(schema_dict):
+        # La estimación de filas cambia con los datos: no forma parte de la huella
+        content = {
+            table: {k: v for k, v in details.items() if k != "row_estimate"}
+            for table, details in schema_dict.items()
+        }
+        raw = json.dumps(content, sort_keys=True, default=str)
+        return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+    def _introspect(self, tables=None):
+        """
+        Lee el esquema completo con un número constante de consultas
+        (tablas, columnas, FKs e índices de todo el esquema a la vez)
+        y agrupa los resultados en memoria por tabla.
+        Si se indica `tables`, solo lee esas tablas.
+        """
+        params = (self.db_name,)
+        table_filter = ""
+        if tables:
+            params += tuple(tables)
+            table_filter = "AND table_name IN (" + ", ".join(["%s"] * len(tables)) + ")"
+
+        conn = self.get_connection()
+        cursor = conn.cursor()
+
+        schema_dict = {}
+
+        try:
+            # 1. Tablas con su estimación de filas y comentario
+            cursor.execute(f"""
+                SELECT table_name, table_rows, table_comment
+                FROM information_schema.tables
+                WHERE table_schema = %s
+                {table_filter};
+            """, params)
+            for table_name, table_rows, table_comment in cursor.fetchall():
                 schema_dict[table_name] = {
-                    "columns": {
-                        col[0]: {
-                            "type": col[1],
-                            "key": col[2]  # 'PRI', 'MUL', etc.
-                        } for col in columns_data
-                    },
-                    "relations": [
-                        {
-                            "column": rel[0],
-                            "referenced_table": rel[1],
-                            "referenced_column": rel[2]
-                        }
-                        for rel in relations
-                    ]
+                    "columns": {},
+                    "relations": [],
+                    "indexes": [],
+                    "row_estimate": table_rows,
+                    "comment": table_comment or ""
                 }
 
-            self.cached_schema = schema_dict
+            # 2. Columnas de todas las tablas
+            cursor.execute(f"""
+                SELECT table_name, column_name, data_type, column_key,
+                       is_nullable, column_default, column_comment, extra
+                FROM information_schema.columns
+                WHERE table_schema = %s
+                {table_filter}
+                ORDER BY table_name, ordinal_position;
+            """, params)
+            for (table_name, column_name, data_type, column_key,
+                 is_nullable, column_default, column_comment, extra) in cursor.fetchall():
+                if table_name not in schema_dict:
+                    continue
+                schema_dict[table_name]["columns"][column_name] = {
+                    "type": data_type,
+                    "key": column_key,  # 'PRI', 'MUL', etc.
+                    "nullable": is_nullable == "YES",
+                    "default": column_default,
+                    "comment": column_comment or "",
+                    "extra": extra or ""
+                }
+
+            # 3. Relaciones (FK) de todas las tablas
+            cursor.execute(f"""
+                SELECT table_name, column_name, referenced_table_name, referenced_column_name
+                FROM information_schema.key_column_usage
+                WHERE table_schema = %s
+                  AND referenced_table_name IS NOT NULL
+                  {table_filter}
+                ORDER BY table_name, constraint_name, ordinal_position;
+            """, params)
+            for table_name, column_name, ref_table, ref_column in cursor.fetchall():
+                if table_name not in schema_dict:
+                    continue
+                schema_dict[table_name]["relations"].append({
+                    "column": column_name,
+                    "referenced_table": ref_table,
+                    "referenced_column": ref_column
+                })
+
+            # 4. Índices (una fila por columna indexada)
+            cursor.execute(f"""
+                SELECT table_name, index_name, non_unique, column_name
+                FROM information_schema.statistics
+                WHERE table_schema = %s
+                {table_filter}
+                ORDER BY table_name, index_name, seq_in_index;
+            """, params)
+            indexes = {}
+            for table_name, index_name, non_unique, column_name in cursor.fetchall():
+                if table_name not in schema_dict:
+                    continue
+                key = (table_name, index_name)
+                if key not in indexes:
+                    indexes[key] = {
+                        "name": index_name,
+                        "unique": not int(non_unique),
+                        "columns": []
+                    }
+                    schema_dict[table_name]["indexes"].append(indexes[key])
+                indexes[key]["columns"].append(column_name)
+
             return schema_dict
 
         finally:
             cursor.close()
             conn.close()
 
-    def get_schema_text(self):
-       
-        schema_dict = self.get_schema_dict()
+    # --------------------------------------------
+    # Instantánea (arranque en frío)
+    # --------------------------------------------
+    def export_snapshot(self):
+        """Estado serializable a JSON del esquema en caché (None si aún no se leyó)."""
+        with self._lock:
+            if self.cached_schema is None:
+                return None
+            return {
+                "schema": self.cached_schema,
+                "schema_fingerprint": self.schema_fingerprint,
+                "table_fingerprints": {t: list(fp) for t, fp in self.table_fingerprints.items()},
+                "table_update_times": dict(self.table_update_times),
+            }
+
+    def restore_snapshot(self, snapshot):
+        """
+        Carga un esquema guardado con export_snapshot() sin consultar la BD.
+        Se considera recién revalidado: la siguiente revalidación (refresh() o el
+        vencimiento del TTL) solo vuelve a leer las tablas que cambiaron desde entonces.
+        """
+        if not snapshot or not snapshot.get("schema"):
+            return False
+        with self._lock:
+            self.cached_schema = snapshot["schema"]
+            self.schema_fingerprint = snapshot["schema_fingerprint"]
+            self.table_fingerprints = {t: tuple(fp) for t, fp in snapshot["table_fingerprints"].items()}
+            self.table_update_times = dict(snapshot["table_update_times"])
+            self._checked_at = time.monotonic()
+            self.schema_version += 1
+        return True
+
+    def peek_schema_text(self):
+        """
+        Texto del esquema ya memoizado, sin revalidar ni esperar al lock
+        (para la UI mientras otro hilo revalida). None si aún no se generó.
+        """
+        version, text = self._schema_text
+        return text if version is not None and version == self.schema_version else None
+
+    def get_schema_text(self, tables=None):
+        """
+        Retorna el esquema en texto. Con `tables` solo describe esas tablas
+        (sin memoizar); sin ellas, el texto completo se memoiza por versión.
+        """
+        with self._lock:
+            schema_dict = self.get_schema_dict()
+            if tables is not None:
+                return self._render_schema_text({t: schema_dict[t] for t in tables if t in schema_dict})
+            version, text = self._schema_text
+            if version == self.schema_version:
+                return text
+            text = self._render_schema_text(schema_dict)
+            self._schema_text = (self.schema_version, text)
+            return text
+
+    def _render_schema_text(self, schema_dict):
         lines = []
         for table, details in schema_dict.items():
             lines.append(f"Tabla: {table}")
@@ -85,4 +322,217 @@ class DatabaseSchemaAgent:
                     f"FK en {table}.{rel['column']} -> {rel['referenced_table']}.{rel['referenced_column']}"
                 )
             lines.append("-" * 50)
-        return "\n".join(lines)
\ No newline at end of file
+        return "\n".join(lines)
+
+    # --------------------------------------------
+    # Esquema compacto (para prompts)
+    # --------------------------------------------
+    def get_prompt_schema(self, tables=None):
+        """
+        Esquema tal como se envía al LLM, en el formato configurado
+        (compacto por defecto). El texto completo y los subconjuntos
+        recientes se memoizan por versión.
+        """
+        if tables is not None:
+            return self._subset_prompt_schema(tables)
+        if self.schema_format == "verbose":
+            return self.get_schema_text()
+        with self._lock:
+            schema_dict = self.get_schema_dict()
+            version, text = self._compact_text
+            if version == self.schema_version:
+                return text
+            text = self._render_compact(schema_dict, list(schema_dict))["text"]
+            self._compact_text = (self.schema_version, text)
+            return text
+
+    def _subset_prompt_schema(self, tables):
+        """
+        Texto de un subconjunto de tablas. El retriever elige a menudo las mismas
+        tablas, así que los últimos textos se memoizan por versión del esquema.
+        """
+        with self._lock:
+            schema_dict = self.get_schema_dict()
+            names = tuple(t for t in tables if t in schema_dict)
+            key = (self.schema_version, self.schema_format, names)
+            text = self._subset_texts.get(key)
+            if text is not None:
+                self._subset_texts.move_to_end(key)
+                return text
+            if self.schema_format == "verbose":
+                text = self._render_schema_text({t: schema_dict[t] for t in names})
+            else:
+                text = self._render_compact(schema_dict, list(names))["text"]
+            # Las entradas de versiones anteriores ya no sirven
+            for stale in [k for k in self._subset_texts if k[0] != self.schema_version]:
+                del self._subset_texts[stale]
+            self._subset_texts[key] = text
+            while len(self._subset_texts) > SUBSET_CACHE_ENTRIES:
+                self._subset_texts.popitem(last=False)
+            return text
+
+    def prompt_tokens(self, table):
+        """Tokens estimados de la descripción de una tabla en el prompt (sin la leyenda)."""
+        details = self.get_schema_dict()[table]
+        if self.schema_format == "verbose":
+            return estimate_tokens(self._render_schema_text({table: details}))
+        return estimate_tokens(_compact_line(table, details)) + 1
+
+    def get_compact_schema(self, token_budget=None, tables=None):
+        """
+        Esquema compacto: una línea por tabla `tabla(col*:i,otra:s,ref_id:i>padre)`
+        con tipos abreviados, `*` para la PK y `>tabla[.columna]` para las FK.
+        Con `token_budget`, las tablas de menor prioridad se recortan (solo claves
+        y algunas columnas), luego quedan solo con su nombre y al final se omiten.
+        La prioridad es el orden de `tables`, o bien el número de relaciones.
+        Retorna un dict serializable en JSON con el texto, las tablas incluidas,
+        recortadas y omitidas, y la compresión frente a get_schema_text
+        (`verbose_tokens` / `tokens`, sobre las tablas incluidas).
+        """
+        with self._lock:
+            schema_dict = self.get_schema_dict()
+            names = list(schema_dict) if tables is None else [t for t in tables if t in schema_dict]
+            result = self._render_compact(schema_dict, names, token_budget, prioritize=tables is None)
+            # La compresión se mide frente al texto detallado de las mismas tablas incluidas
+            if len(result["tables"]) == len(schema_dict):
+                verbose = self.get_schema_text()
+            else:
+                verbose = self.get_schema_text(tables=result["tables"])
+        verbose_tokens = estimate_tokens(verbose)
+        result["verbose_tokens"] = verbose_tokens
+        result["compression_ratio"] = round(verbose_tokens / result["tokens"], 2) if result["tokens"] else None
+        return result
+
+    def get_first_rows(self, tables=None, max_rows=3, token_budget=1000, max_value_chars=40):
+        """
+        Primeras filas de cada tabla, acotadas: `max_rows` filas por tabla, valores
+        recortados a `max_value_chars` y tablas en orden de prioridad hasta `token_budget`.
+        Retorna {"tables": {tabla: {"columns": [...], "rows": [[...]]}}, "omitted": [...], "tokens": n},
+        serializable en JSON.
+        """
+        schema_dict = self.get_schema_dict()
+        names = [t for t in tables if t in schema_dict] if tables is not None else self._by_priority(schema_dict)
+        result, omitted, used = {}, [], 0
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        try:
+            for position, table in enumerate(names):
+                if used >= token_budget:
+                    omitted.extend(names[position:])
+                    break
+                cursor.execute(f"SELECT * FROM `{table}` LIMIT {int(max_rows)};")
+                columns = [d[0] for d in cursor.description or []]
+                rows = [[_json_value(v, max_value_chars) for v in row] for row in cursor.fetchall()]
+                entry = {"columns": columns, "rows": rows}
+                cost = estimate_tokens(json.dumps(entry, ensure_ascii=False))
+                if result and used + cost > token_budget:
+                    omitted.append(table)
+                    continue
+                result[table] = entry
+                used += cost
+        finally:
+            cursor.close()
+            conn.close()
+        return {"tables": result, "omitted": omitted, "tokens": used}
+
+    @staticmethod
+    def _by_priority(schema_dict):
+        # Más relaciones (salientes + entrantes) primero; a igualdad, más filas
+        degree = {t: len(d["relations"]) for t, d in schema_dict.items()}
+        for details in schema_dict.values():
+            for rel in details["relations"]:
+                if rel["referenced_table"] in degree:
+                    degree[rel["referenced_table"]] += 1
+        return sorted(
+            schema_dict,
+            key=lambda t: (-degree[t], -int(schema_dict[t].get("row_estimate") or 0))
+        )
+
+    def _render_compact(self, schema_dict, names, token_budget=None, prioritize=False):
+        order = self._by_priority({t: schema_dict[t] for t in names}) if prioritize and token_budget else names
+        chosen, truncated, omitted, used = {}, [], [], 0
+        for table in order:
+            details = schema_dict[table]
+            candidates = [_compact_line(table, details)]
+            if token_budget is not None:
+                candidates += [_compact_line(table, details, REDUCED_COLUMNS), f"{table}(…)"]
+            for level, line in enumerate(candidates):
+                cost = estimate_tokens(line) + 1
+                if token_budget is None or used + cost <= token_budget:
+                    chosen[table] = line
+                    used += cost
+                    if level:
+                        truncated.append(table)
+                    break
+            else:
+                omitted.append(table)
+
+        lines = [chosen[t] for t in names if t in chosen]
+        used_types = sorted({
+            _abbreviate(info["type"]) for t in chosen for info in schema_dict[t]["columns"].values()
+        })
+        legend = _compact_legend(used_types)
+        if omitted:
+            lines.append(f"(+{len(omitted)} tablas omitidas)")
+        text = "\n".join([legend] + lines) if lines else ""
+        return {
+            "format": "compact",
+            "text": text,
+            "tables": [t for t in names if t in chosen],
+            "truncated": truncated,
+            "omitted": omitted,
+            "tokens": estimate_tokens(text),
+        }
+
+
+def _abbreviate(data_type):
+    data_type = str(data_type).lower()
+    return TYPE_ABBREVIATIONS.get(data_type, data_type)
+
+
+def _compact_legend(used_types):
+    names = {}
+    for full, short in TYPE_ABBREVIATIONS.items():
+        names.setdefault(short, full)
+    types = ", ".join(f"{t}={names[t]}" for t in used_types if t in names and names[t] != t)
+    legend = "Formato: tabla(columna:tipo,...); *=PK; >tabla[.columna]=FK (sin columna = id)"
+    return legend + (f"; tipos: {types}" if types else "")
+
+
+def _compact_line(table, details, max_columns=None):
+    """Una tabla en una línea; con `max_columns` solo se conservan las claves y esa cantidad de columnas."""
+    fks = {}
+    for rel in details["relations"]:
+        target = rel["referenced_table"]
+        if rel["referenced_column"] != "id":
+            target += f".{rel['referenced_column']}"
+        fks[rel["column"]] = target
+
+    parts, others, hidden = [], 0, 0
+    for col, info in details["columns"].items():
+        is_key = info["key"] == "PRI" or col in fks
+        if max_columns is not None and not is_key:
+            if others >= max_columns:
+                hidden += 1
+                continue
+            others += 1
+        part = f"{col}{'*' if info['key'] == 'PRI' else ''}:{_abbreviate(info['type'])}"
+        if col in fks:
+            part += f">{fks[col]}"
+        parts.append(part)
+    if hidden:
+        parts.append(f"…+{hidden}")
+    return f"{table}({','.join(parts)})"
+
+
+def _json_value(value, max_chars):
+    """Convierte un valor de la BD a un tipo JSON, recortando textos largos."""
+    if value is None or isinstance(value, (bool, int, float)):
+        return value
+    if isinstance(value, Decimal):
+        return float(value)
+    if isinstance(value, (bytes, bytearray)):
+        return f"<{len(value)} bytes>"
+    text = str(value)
+    return text if len(text) <= max_chars else text[:max_chars - 1] + "…"
+
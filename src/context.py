@@ -0,0 +1,175 @@
+import time
+import json
+import logging
+import threading
+import weakref
+from collections import OrderedDict
+from concurrent.futures import Future
+
+
+class DatabaseContext:
+    """
+    Todo lo que depende de una conexión concreta (host, puerto, BD y usuario):
+    el pool, el esquema en caché y lo que se deriva de él (mapa semántico,
+    índices, muestras, perfiles, plantillas y resultados). Los agentes que usan
+    el LLM no forman parte del contexto: cada SQLBot tiene los suyos.
+    """
+    def __init__(self, key, pool, schema_agent, semantic_agent, value_index, sql_compiler,
+                 retriever, summarizer, profiler, template_cache, result_cache, execution_agent):
+        self.key = key
+        self.pool = pool
+        self.schema_agent = schema_agent
+        self.semantic_agent = semantic_agent
+        self.value_index = value_index
+        self.sql_compiler = sql_compiler
+        self.retriever = retriever
+        self.summarizer = summarizer
+        self.profiler = profiler
+        self.template_cache = template_cache
+        self.result_cache = result_cache
+        self.execution_agent = execution_agent
+
+        self.warm_up_thread = None
+        self.users = weakref.WeakSet()  # SQLBots (sesiones) que usan este contexto
+        self.created = time.time()
+        self._schema_bytes = (None, 0)  # (versión del esquema, bytes estimados)
+
+    def memory_bytes(self):
+        """
+        Memoria aproximada del contexto: esquema en caché (memoizado por versión),
+        muestras de datos y resultados en caché.
+        """
+        version = self.schema_agent.schema_version
+        if self._schema_bytes[0] != version:
+            schema = self.schema_agent.cached_schema
+            size = len(json.dumps(schema, default=str)) if schema else 0
+            self._schema_bytes = (version, size)
+        return (
+            self._schema_bytes[1]
+            + self.summarizer.memory_bytes()
+            + self.result_cache.stats()["bytes"]
+        )
+
+    def describe(self):
+        """Datos del contexto para mostrar (sin el resumen de la contraseña)."""
+        host, port, db_name, user = self.key[:4]
+        return {
+            "database": f"{user}@{host}:{port}/{db_name}",
+            "users": len(self.users),
+            "bytes": self.memory_bytes(),
+            "schema_version": self.schema_agent.schema_version,
+        }
+
+    def close(self):
+        # Las conexiones prestadas se cierran cuando se devuelvan
+        self.pool.close()
+
+
+class ContextRegistry:
+    """
+    Registro LRU de contextos de base de datos compartido por todas las sesiones.
+    Cambiar a una BD usada hace poco reutiliza su contexto (pool y cachés) en lugar
+    de volver a introspectarla. Pasado `max_entries` o `max_bytes`, se cierran los
+    contextos menos usados que ninguna sesión tenga abiertos; los que están en uso
+    nunca se expulsan.
+    """
+    def __init__(self, max_entries=4, max_bytes=256 * 1024 * 1024):
+        """
+        :param max_entries: Contextos abiertos como máximo
+        :param max_bytes: Memoria aproximada máxima de todos los contextos
+        """
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._contexts = OrderedDict()  # clave -> DatabaseContext
+        self._building = {}  # clave -> Future del contexto en creación
+        self._lock = threading.Lock()
+        self.metrics = {"hits": 0, "misses": 0, "evicted": 0}
+        self.logger = logging.getLogger("ContextRegistry")
+
+    def acquire(self, key, factory, owner=None):
+        """
+        Retorna el contexto de `key`, creándolo con factory(key) si no existe.
+        `owner` (el SQLBot de una sesión) queda registrado como usuario del
+        contexto y deja de serlo de cualquier otro.
+        La creación (pool e introspección) corre fuera del lock del registro:
+        solo esperan las sesiones que piden esa misma clave, y se crea una vez.
+        """
+        while True:
+            with self._lock:
+                context = self._contexts.get(key)
+                if context is not None:
+                    self.metrics["hits"] += 1
+                    self._contexts.move_to_end(key)
+                    self._attach(key, context, owner)
+                    return context
+                future = self._building.get(key)
+                building = future is None
+                if building:
+                    self.metrics["misses"] += 1
+                    future = self._building[key] = Future()
+            if not building:
+                # Otra sesión lo está creando; si falla, el error llega también aquí
+                future.result()
+                continue
+
+            try:
+                context = factory(key)
+            except BaseException as e:
+                with self._lock:
+                    del self._building[key]
+                future.set_exception(e)
+                raise
+            with self._lock:
+                del self._building[key]
+                self._contexts[key] = context
+                self._attach(key, context, owner)
+            future.set_result(context)
+            return context
+
+    def release(self, owner):
+        """La sesión deja de usar su contexto (sigue en el registro hasta que se expulse)."""
+        with self._lock:
+            for context in self._contexts.values():
+                context.users.discard(owner)
+
+    def close(self):
+        with self._lock:
+            for context in self._contexts.values():
+                context.close()
+            self._contexts.clear()
+
+    def stats(self):
+        with self._lock:
+            contexts = [context.describe() for context in self._contexts.values()]
+            return {
+                **self.metrics,
+                "entries": len(contexts),
+                "bytes": sum(c["bytes"] for c in contexts),
+                "contexts": contexts,
+            }
+
+    def _attach(self, key, context, owner):
+        # Se llama con el lock tomado
+        if owner is not None:
+            for other in self._contexts.values():
+                other.users.discard(owner)
+            context.users.add(owner)
+        self._evict(keep=key)
+
+    def _evict(self, keep):
+        # Se llama con el lock tomado; del menos usado al más usado
+        sizes = {key: context.memory_bytes() for key, context in self._contexts.items()}
+        total = sum(sizes.values())
+        for key in list(self._contexts):
+            if len(self._contexts) <= self.max_entries and total <= self.max_bytes:
+                return
+            context = self._contexts[key]
+            if key == keep or len(context.users):
+                continue
+            del self._contexts[key]
+            total -= sizes[key]
+            context.close()
+            self.metrics["evicted"] += 1
+            self.logger.info(f"Contexto {context.describe()['database']} expulsado.")
+        if len(self._contexts) > self.max_entries or total > self.max_bytes:
+            self.logger.warning("Todos los contextos restantes están en uso: se supera el límite.")
@@ -0,0 +1,271 @@
+import re
+import time
+import logging
+import threading
+from collections import OrderedDict, deque
+from pymysql.converters import escape_item
+from resultcache import normalize_sql
+
+# Políticas cuando el costo estimado supera el máximo
+POLICIES = ("reject", "limit", "rewrite", "off")
+
+# LIMIT final: "LIMIT n", "LIMIT n OFFSET m" o la forma de MySQL "LIMIT m, n" (desplazamiento primero)
+_LIMIT_CLAUSE = re.compile(
+    r"\bLIMIT\s+(?:(?P<offset>\d+)\s*,\s*(?P<count>\d+)|(?P<limit>\d+)(?:\s+OFFSET\s+(?P<skip>\d+))?)\s*;?\s*$",
+    re.I
+)
+# Textos, identificadores entre `...` y comentarios: se quitan antes de buscar palabras clave
+_LITERALS_AND_COMMENTS = re.compile(
+    r"""'(?:[^'\\]|\\.|'')*'|"(?:[^"\\]|\\.|"")*"|`[^`]*`|--[^\n]*|#[^\n]*|/\*.*?\*/""", re.S
+)
+# Palabras que convierten una consulta en escritura, bloqueo o volcado a archivo
+_WRITE_WORDS = {
+    "INSERT", "UPDATE", "DELETE", "REPLACE", "MERGE", "CREATE", "DROP", "ALTER", "TRUNCATE",
+    "RENAME", "GRANT", "REVOKE", "CALL", "LOAD", "HANDLER", "LOCK", "UNLOCK", "SET", "INTO",
+    "OUTFILE", "DUMPFILE", "SHARE",
+}
+# Consultas en las que un LIMIT no reduce las filas examinadas
+_AGGREGATE = re.compile(r"\b(?:COUNT|SUM|AVG|MIN|MAX|GROUP_CONCAT)\s*\(|\bGROUP\s+BY\b|\bDISTINCT\b", re.I)
+
+
+def is_read_only(sql):
+    """
+    True si `sql` es una única lectura pura: empieza por SELECT o WITH y no
+    contiene, fuera de textos y comentarios, palabras de escritura (un
+    WITH ... UPDATE/DELETE de MySQL 8), INTO OUTFILE ni bloqueos (FOR UPDATE).
+    Ante la duda retorna False.
+    """
+    code = _LITERALS_AND_COMMENTS.sub(" ", sql).strip().rstrip(";")
+    if ";" in code:
+        return False
+    words = re.findall(r"[A-Za-z_]+", code.upper())
+    if not words or words[0] not in ("SELECT", "WITH"):
+        return False
+    return not _WRITE_WORDS.intersection(words)
+
+
+class QueryCostGuard:
+    """
+    Control previo a la ejecución: corre EXPLAIN sobre cada SELECT generado,
+    estima las filas examinadas (producto acumulado de `rows * filtered` del plan,
+    como hace MySQL en los nested loops) y, si pasa de `max_rows_examined`, aplica
+    la política configurada:
+    - "reject":  no ejecuta la consulta.
+    - "limit":   añade o reduce el LIMIT. Una agregación (COUNT, SUM, GROUP BY,
+                 DISTINCT...) se ejecuta igualmente con un aviso: un LIMIT no
+                 reduce las filas que recorre y rechazarla dejaría sin respuesta
+                 preguntas como "¿cuántos ... hay?" sobre tablas grandes.
+    - "rewrite": pide al LLM una versión más barata y la vuelve a evaluar.
+    - "off":     solo registra el costo.
+    Si el motor no devuelve un plan con filas estimadas, la consulta se deja pasar.
+    """
+    def __init__(self, get_connection, max_rows_examined=1_000_000, policy="limit",
+                 default_limit=1000, rewrite=None, memo_ttl=60, memo_entries=256, history=20):
+        """
+        :param get_connection: Función que retorna una conexión a la BD
+        :param max_rows_examined: Filas examinadas estimadas a partir de las cuales se aplica la política
+        :param policy: Una de POLICIES
+        :param default_limit: LIMIT que se inyecta con la política "limit"
+        :param rewrite: Función (sql, costo) -> sql más barato, para la política "rewrite"
+        :param memo_ttl: Segundos que se reutiliza la estimación de una misma consulta
+        :param memo_entries: Estimaciones guardadas como máximo
+        :param history: Consultas costosas recientes que se conservan para stats()
+        """
+        if policy not in POLICIES:
+            raise ValueError(f"Política de costo desconocida: {policy}")
+        self.get_connection = get_connection
+        self.max_rows_examined = max_rows_examined
+        self.policy = policy
+        self.default_limit = default_limit
+        self.rewrite = rewrite
+        self.memo_ttl = memo_ttl
+        self.memo_entries = memo_entries
+
+        self._memo = OrderedDict()  # (sql normalizado, params) -> (expira, costo)
+        self._expensive = deque(maxlen=history)
+        self._lock = threading.Lock()
+        self.metrics = {"checked": 0, "unchecked": 0, "limited": 0, "rewritten": 0, "rejected": 0, "over_budget": 0}
+        self.logger = logging.getLogger("QueryCostGuard")
+
+    def check(self, sql, params=None, label=None):
+        """
+        Evalúa una consulta antes de ejecutarla.
+        Retorna {"allowed", "sql", "params", "action", "cost", "message"}; si se
+        permite, hay que ejecutar el "sql"/"params" retornados (pueden haber cambiado).
+        :param label: Texto para identificar la consulta en el historial (ej. la pregunta)
+        """
+        outcome = {"allowed": True, "sql": sql, "params": params, "action": "ok", "cost": None, "message": ""}
+        if not re.match(r"\s*(SELECT|WITH)\b", sql, re.I):
+            outcome["action"] = "skipped"
+            return outcome
+
+        cost = self.estimate(sql, params)
+        outcome["cost"] = cost
+        if cost["estimated_rows"] is None:
+            outcome["action"] = "unchecked"
+            self._count("unchecked")
+            return outcome
+        self._count("checked")
+        if cost["estimated_rows"] <= self.max_rows_examined:
+            return outcome
+
+        self._count("over_budget")
+        self._remember(label, sql, cost)
+        self.logger.warning(
+            f"Consulta costosa (~{cost['estimated_rows']} filas examinadas, política {self.policy}): {sql}"
+        )
+        if self.policy == "off":
+            outcome["action"] = "over_budget"
+        elif self.policy == "limit":
+            self._apply_limit(outcome)
+        elif self.policy == "rewrite" and self.rewrite is not None:
+            self._apply_rewrite(outcome)
+        else:
+            self._reject(outcome)
+        return outcome
+
+    def estimate(self, sql, params=None):
+        """
+        Corre EXPLAIN y retorna {"estimated_rows", "full_scans", "plan"}.
+        "estimated_rows" es None si no se pudo obtener un plan con filas.
+        """
+        key = (normalize_sql(sql), repr(params))
+        now = time.monotonic()
+        with self._lock:
+            memo = self._memo.get(key)
+            if memo is not None and memo[0] > now:
+                self._memo.move_to_end(key)
+                return memo[1]
+
+        cost = {"estimated_rows": None, "full_scans": [], "plan": []}
+        conn = None
+        try:
+            conn = self.get_connection()
+            cursor = conn.cursor()
+            try:
+                cursor.execute("EXPLAIN " + sql.strip().rstrip(";"), params or None)
+                fields = [d[0].lower() for d in cursor.description or []]
+                plan = [dict(zip(fields, row)) for row in cursor.fetchall()]
+            finally:
+                cursor.close()
+        except Exception as e:
+            self.logger.warning(f"No se pudo obtener el plan de la consulta: {e}")
+            return cost
+        finally:
+            if conn:
+                conn.close()
+
+        if plan and "rows" in plan[0]:
+            cost = self._cost_from_plan(plan)
+        with self._lock:
+            self._memo[key] = (now + self.memo_ttl, cost)
+            while len(self._memo) > self.memo_entries:
+                self._memo.popitem(last=False)
+        return cost
+
+    def stats(self):
+        with self._lock:
+            return {
+                **self.metrics,
+                "policy": self.policy,
+                "max_rows_examined": self.max_rows_examined,
+                "expensive": list(self._expensive),
+            }
+
+    # --------------------------------------------
+    # Plan y políticas
+    # --------------------------------------------
+    @staticmethod
+    def _cost_from_plan(plan):
+        # Cada paso del join se ejecuta una vez por cada fila que sale de los anteriores
+        examined, fanout, full_scans, steps = 0, 1.0, [], []
+        for row in plan:
+            rows = float(row.get("rows") or 0)
+            filtered = float(row.get("filtered") or 100.0)
+            examined += fanout * rows
+            fanout *= max(rows * filtered / 100.0, 1.0)
+            if str(row.get("type") or "").upper() == "ALL" and row.get("table"):
+                full_scans.append(str(row["table"]))
+            steps.append({
+                "table": row.get("table"),
+                "type": row.get("type"),
+                "key": row.get("key"),
+                "rows": int(rows),
+                "filtered": filtered,
+            })
+        return {"estimated_rows": int(examined), "full_scans": full_scans, "plan": steps}
+
+    def _apply_limit(self, outcome):
+        sql = outcome["sql"]
+        if _AGGREGATE.search(sql):
+            # Un LIMIT no evita recorrer las filas de una agregación: se ejecuta con aviso
+            outcome["action"] = "over_budget"
+            outcome["message"] = (
+                f"La consulta examinaría ~{outcome['cost']['estimated_rows']} filas; "
+                f"puede tardar en responder."
+            )
+            return
+        match = _LIMIT_CLAUSE.search(sql)
+        count, offset = None, None
+        if match:
+            count = int(match.group("count") or match.group("limit"))
+            offset = match.group("offset") or match.group("skip")
+        if count is not None and count <= self.default_limit:
+            outcome["action"] = "ok"
+            return
+        base = sql[:match.start()] if match else sql.strip().rstrip(";")
+        offset = f" OFFSET {offset}" if offset else ""
+        outcome["sql"] = f"{base.rstrip()} LIMIT {int(self.default_limit)}{offset};"
+        outcome["action"] = "limited"
+        outcome["message"] = (
+            f"La consulta examinaría ~{outcome['cost']['estimated_rows']} filas; "
+            f"se limitó a {self.default_limit} resultados."
+        )
+        self._count("limited")
+
+    def _apply_rewrite(self, outcome):
+        sql, params = outcome["sql"], outcome["params"]
+        if params:
+            sql = sql % tuple(escape_item(p, "utf8mb4") for p in params)
+        try:
+            rewritten = (self.rewrite(sql, outcome["cost"]) or "").strip()
+        except Exception as e:
+            self.logger.error(f"No se pudo reescribir la consulta: {e}")
+            rewritten = ""
+        if not rewritten or not re.match(r"\s*(SELECT|WITH)\b", rewritten, re.I):
+            return self._reject(outcome)
+
+        cost = self.estimate(rewritten)
+        if cost["estimated_rows"] is not None and cost["estimated_rows"] > self.max_rows_examined:
+            outcome["cost"] = cost
+            return self._reject(outcome)
+        outcome.update({
+            "sql": rewritten,
+            "params": None,
+            "action": "rewritten",
+            "cost": cost,
+            "message": "La consulta original era demasiado costosa; se ejecutó una versión reescrita.",
+        })
+        self._count("rewritten")
+
+    def _reject(self, outcome):
+        outcome["allowed"] = False
+        outcome["action"] = "rejected"
+        outcome["message"] = (
+            f"Consulta rechazada: examinaría ~{outcome['cost']['estimated_rows']} filas "
+            f"(máximo permitido {self.max_rows_examined}). Intenta una pregunta más específica."
+        )
+        self._count("rejected")
+
+    def _count(self, metric):
+        with self._lock:
+            self.metrics[metric] += 1
+
+    def _remember(self, label, sql, cost):
+        with self._lock:
+            self._expensive.append({
+                "label": label,
+                "sql": sql,
+                "estimated_rows": cost["estimated_rows"],
+                "full_scans": cost["full_scans"],
+            })
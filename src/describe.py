@@ -1,5 +1,6 @@
 import os
 import re
+import asyncio
 import pymysql
 import pandas as pd
 from dotenv import load_dotenv
@@ -7,70 +8,160 @@ from dotenv import load_dotenv
 from langchain.prompts import PromptTemplate
 from langchain.chains import LLMChain
 import json
+from tracing import annotate
+from interpretation import compile_chain
 
 class SQLGenerationAgent:
     """
     Genera sentencias SQL a partir de la estructura interpretada.
     Soporta generación de SQL mediante LLM.
     """
-    def __init__(self, llm, schema_agent):
+    # Prompt template para generación de SQL con LLM. Las instrucciones fijas y el
+    # esquema van primero para que el prefijo del prompt se repita entre llamadas
+    PROMPT_TEMPLATE = """
+        Genera una consulta SQL precisa considerando:
+        1. La intención específica
+        2. Nombres correctos de tablas y columnas
+        3. Filtrado apropiado
+        4. Limitar resultados a 25 si no se especifica lo contrario
+
+        Devuelve SOLO la consulta SQL, sin texto adicional.
+
+        Esquema de Base de Datos: {schema}
+
+        Información de la Consulta:
+        - Intención: {intention}
+        - Tabla: {table}
+        - Filtros: {filters}
+        """
+
+    # Prompt para pedir una versión más barata de una consulta costosa
+    REWRITE_TEMPLATE = """
+        La consulta SQL del final es demasiado costosa. Reescríbela para que devuelva
+        la misma información examinando muchas menos filas:
+        1. Filtra por columnas indexadas o claves cuando sea posible
+        2. Evita productos cartesianos y JOINs sin condición
+        3. Limita los resultados si la consulta no es una agregación
+
+        Devuelve SOLO la consulta SQL, sin texto adicional.
+
+        Esquema de Base de Datos: {schema}
+
+        Consulta (examinaría unas {rows} filas; recorridos completos en: {full_scans}):
+        {sql}
+        """
+
+    def __init__(self, llm, schema_agent, retriever=None, cache=None):
+        """
+        :param retriever: SchemaRetriever opcional; si se indica, el prompt
+                          solo incluye la tabla interpretada y las relacionadas
+        :param cache: LLMResponseCache opcional para reutilizar SQL ya generado
+        """
         self.llm = llm
         self.schema_agent = schema_agent
+        self.retriever = retriever
+        self.cache = cache
+        # Plantillas y cadenas compiladas una sola vez por agente
+        self.chain = compile_chain(llm, self.PROMPT_TEMPLATE)
+        self.rewrite_chain = compile_chain(llm, self.REWRITE_TEMPLATE)
 
     def generate_sql(self, query_structure):
         """
         Genera consulta SQL usando LLM o método tradicional.
         """
+        early, request = self._prepare(query_structure)
+        if early is not None:
+            return early
+
+        # Generar consulta SQL
+        try:
+            sql_query = request["chain"].run(**request["inputs"]).strip()
+        except Exception as e:
+            return f"Error al generar SQL: {str(e)}"
+        return self._finish(sql_query, request)
+
+    async def agenerate_sql(self, query_structure):
+        """Variante asíncrona de generate_sql: la llamada al LLM usa su API async."""
+        early, request = await asyncio.to_thread(self._prepare, query_structure)
+        if early is not None:
+            return early
+
+        try:
+            sql_query = (await request["chain"].arun(**request["inputs"])).strip()
+        except Exception as e:
+            return f"Error al generar SQL: {str(e)}"
+        return self._finish(sql_query, request)
+
+    def rewrite_sql(self, sql_query, cost):
+        """
+        Pide al LLM una versión más barata de `sql_query`.
+        :param cost: Estimación de QueryCostGuard (estimated_rows, full_scans, plan)
+        """
+        tables = [step["table"] for step in cost.get("plan", []) if step.get("table")]
+        schema_dict = self.schema_agent.get_schema_dict()
+        tables = [t for t in dict.fromkeys(tables) if t in schema_dict] or None
+        rewritten = self.rewrite_chain.run(
+            schema=self.schema_agent.get_prompt_schema(tables=tables),
+            rows=cost.get("estimated_rows"),
+            full_scans=", ".join(cost.get("full_scans") or []) or "ninguna",
+            sql=sql_query
+        ).strip()
+        if rewritten.startswith("```"):
+            rewritten = rewritten.strip("`").removeprefix("sql").strip()
+        if rewritten and not rewritten.endswith(";"):
+            rewritten += ";"
+        return rewritten
+
+    def _prepare(self, query_structure):
+        """Retorna (respuesta inmediata, None) o (None, datos para llamar al LLM)."""
         intent = query_structure.get("intencion", "").lower()
         table = query_structure.get("tabla", "")
         filters = query_structure.get("filtros", {})
 
         if not table:
-            return "Lo siento, no se identificó la tabla en la base de datos."
+            return "Lo siento, no se identificó la tabla en la base de datos.", None
 
-        # Prompt template para generación de SQL con LLM
-        prompt_template = """
-        Esquema de Base de Datos: {schema}
-        
-        Información de la Consulta:
-        - Intención: {intention}
-        - Tabla: {table}
-        - Filtros: {filters}
+        cache_key, fingerprint = None, None
+        if self.cache:
+            self.schema_agent.get_schema_dict()
+            fingerprint = getattr(self.schema_agent, "schema_fingerprint", None)
+            cache_text = json.dumps(
+                {"intencion": intent, "tabla": table, "filtros": filters}, sort_keys=True, default=str
+            )
+            # Los filtros son datos: sin normalizar, para no confundir "Lima" con "LIMA"
+            cache_key = self.cache.make_key(
+                "generate_sql", cache_text, self.PROMPT_TEMPLATE, self.llm, fingerprint, normalize=False
+            )
+            cached = self.cache.get(cache_key, fingerprint)
+            annotate(cache_hit=cached is not None)
+            if cached is not None:
+                return cached, None
 
-        Genera una consulta SQL precisa considerando:
-        1. La intención específica
-        2. Nombres correctos de tablas y columnas
-        3. Filtrado apropiado
-        4. Limitar resultados a 25 si no se especifica lo contrario
+        # Obtener esquema de la base de datos (solo lo relevante si hay índice)
+        if self.retriever:
+            filter_cols = [str(col) for col in filters] if isinstance(filters, dict) else []
+            search_text = " ".join([table, intent] + filter_cols)
+            schema_text = self.retriever.get_schema_context(search_text, required=[table])
+        else:
+            schema_text = self.schema_agent.get_prompt_schema()
 
-        Devuelve SOLO la consulta SQL, sin texto adicional.
-        """
+        return None, {
+            "chain": self.chain,
+            "inputs": {
+                "schema": schema_text,
+                "intention": intent,
+                "table": table,
+                "filters": json.dumps(filters)
+            },
+            "cache_key": cache_key,
+            "fingerprint": fingerprint
+        }
 
-        # Obtener esquema de la base de datos
-        schema_text = self.schema_agent.get_schema_text()
-
-        # Configurar prompt para LLM
-        prompt = PromptTemplate(
-            template=prompt_template,
-            input_variables=["schema", "intention", "table", "filters"]
-        )
-        
-        # Crear cadena con LLM
-        chain = LLMChain(llm=self.llm, prompt=prompt)
-        
-        # Generar consulta SQL
-        try:
-            sql_query = chain.run(
-                schema=schema_text,
-                intention=intent,
-                table=table,
-                filters=json.dumps(filters)
-            ).strip()
-
-            # Añadir punto y coma si no existe
-            if not sql_query.endswith(';'):
-                sql_query += ';'
-
-            return sql_query
-        except Exception as e:
-            return f"Error al generar SQL: {str(e)}"
\ No newline at end of file
+    def _finish(self, sql_query, request):
+        # Añadir punto y coma si no existe
+        if not sql_query.endswith(';'):
+            sql_query += ';'
+
+        if request["cache_key"]:
+            self.cache.set(request["cache_key"], sql_query, request["fingerprint"])
+        return sql_query
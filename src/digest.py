@@ -0,0 +1,254 @@
+from decimal import Decimal
+import numpy as np
+import pandas as pd
+from tokens import estimate_tokens
+
+
+class ResultDigester:
+    """
+    Resume un resultado SQL para el prompt de la respuesta en lenguaje natural
+    en lugar de enviarlo entero: número de filas, agregados por columna
+    (vectorizados con pandas), los grupos principales y una muestra
+    estratificada de filas. Todo cabe en `token_budget`, así que el prompt, y
+    con él el tiempo del LLM, no crece con el tamaño del resultado.
+    Si el resultado completo cabe en el presupuesto, se envía tal cual.
+    Los agregados numéricos son exactos; los de texto y los grupos se calculan
+    sobre `max_scan_rows` filas repartidas por el resultado, para que el tiempo
+    del resumen tampoco dependa del tamaño.
+    """
+    def __init__(self, token_budget=800, sample_rows=10, top_groups=5, max_columns=20, max_cell_chars=40,
+                 max_scan_rows=100000):
+        """
+        :param token_budget: Tokens máximos del resumen
+        :param sample_rows: Filas de ejemplo como máximo
+        :param top_groups: Grupos mostrados de la columna de agrupación
+        :param max_columns: Columnas con agregados como máximo
+        :param max_cell_chars: Caracteres máximos de cada valor mostrado
+        :param max_scan_rows: Filas recorridas para los agregados de texto y los grupos
+        """
+        self.token_budget = token_budget
+        self.sample_rows = sample_rows
+        self.top_groups = top_groups
+        self.max_columns = max_columns
+        self.max_cell_chars = max_cell_chars
+        self.max_scan_rows = max_scan_rows
+
+    def summarize(self, sql_result):
+        """Retorna el resumen en texto del resultado (DataFrame, lista de filas o valor suelto)."""
+        frame = to_frame(sql_result)
+        if frame is None:
+            return "Sin resultados." if sql_result is None else self._cell(sql_result)
+        if frame.empty:
+            return f"0 filas (columnas: {', '.join(map(str, frame.columns))})."
+
+        if frame.columns.has_duplicates:
+            # JOINs con columnas del mismo nombre: se numeran para poder agregarlas
+            seen = {}
+            names = []
+            for name in map(str, frame.columns):
+                seen[name] = seen.get(name, 0) + 1
+                names.append(name if seen[name] == 1 else f"{name}_{seen[name]}")
+            frame = frame.set_axis(names, axis=1)
+        frame = numeric_decimals(frame)
+
+        # Un resultado pequeño va completo: no hay nada que resumir
+        header = f"{len(frame)} filas, {len(frame.columns)} columnas."
+        if len(frame) <= self.token_budget // max(1, len(frame.columns)):
+            full = self._rows_text(frame)
+            if estimate_tokens(full) + estimate_tokens(header) <= self.token_budget:
+                return f"{header}\n{full}"
+
+        lines, used = [], 0
+
+        def add(line):
+            nonlocal used
+            cost = estimate_tokens(line) + 1
+            if used + cost > self.token_budget:
+                return False
+            lines.append(line)
+            used += cost
+            return True
+
+        scan = frame
+        if len(frame) > self.max_scan_rows:
+            scan = frame.iloc[np.linspace(0, len(frame) - 1, self.max_scan_rows).astype(int)]
+            header += f" Textos y grupos estimados sobre {len(scan)} filas repartidas por el resultado."
+
+        add(f"{header} Se muestra un resumen del resultado completo.")
+        add("Columnas:")
+        for line in self._column_lines(frame, scan):
+            if not add(line):
+                break
+        group_column = self._group_column(scan)
+        group_lines = self._group_lines(scan, group_column, len(frame)) if group_column is not None else []
+        if group_lines and add(group_lines[0]):
+            for line in group_lines[1:]:
+                if not add(line):
+                    break
+        sample = self._sample(scan, group_column)
+        sample_lines = self._rows_text(sample).split("\n")
+        if len(sample_lines) > 1 and add(f"Muestra de {len(sample)} filas:") and add(sample_lines[0]):
+            for line in sample_lines[1:]:
+                if not add(line):
+                    break
+        return "\n".join(lines)
+
+    # --------------------------------------------
+    # Agregados por columna
+    # --------------------------------------------
+    def _column_lines(self, frame, scan):
+        columns = list(frame.columns[:self.max_columns])
+        numeric = [c for c in columns if _is_numeric(frame[c])]
+        stats = frame[numeric].agg(["count", "min", "max", "mean", "sum"]) if numeric else None
+        # Nulos exactos en las numéricas; en el resto, estimados sobre las filas recorridas
+        scale = len(frame) / len(scan)
+        scan_nulls = scan[[c for c in columns if c not in numeric]].isna().sum()
+
+        lines = []
+        for column in columns:
+            series = scan[column]
+            if column in numeric:
+                col = stats[column]
+                line = (f"- {column} (numérica): mín {_number(col['min'])}, máx {_number(col['max'])}, "
+                        f"media {_number(col['mean'])}, suma {_number(col['sum'])}")
+            elif pd.api.types.is_datetime64_any_dtype(series):
+                line = f"- {column} (fecha): desde {frame[column].min()} hasta {frame[column].max()}"
+            else:
+                counts = series.value_counts(dropna=True)
+                # Porcentajes sobre los valores no nulos (los nulos se cuentan aparte)
+                present = counts.sum()
+                top = ", ".join(
+                    f"{self._cell(value)} ({count / present:.0%})"
+                    for value, count in counts.head(3).items()
+                )
+                line = f"- {column} (texto): {len(counts)} distintos" + (f"; frecuentes: {top}" if top else "")
+            if column in numeric:
+                nulls = f"{len(frame) - int(stats[column]['count'])}"
+            else:
+                nulls = f"{int(scan_nulls[column])}" if scale == 1 else f"~{int(round(scan_nulls[column] * scale))}"
+            if nulls.lstrip("~") != "0":
+                line += f", {nulls} nulos"
+            lines.append(line)
+        extra = len(frame.columns) - len(columns)
+        if extra > 0:
+            lines.append(f"- (+{extra} columnas más)")
+        return lines
+
+    # --------------------------------------------
+    # Grupos principales
+    # --------------------------------------------
+    def _group_column(self, frame):
+        # Primera columna no numérica con pocos valores distintos (ej. ciudad, estado)
+        for column in frame.columns[:self.max_columns]:
+            series = frame[column]
+            if _is_numeric(series):
+                continue
+            distinct = series.nunique(dropna=True)
+            if 1 < distinct <= 50 and distinct < len(frame):
+                return column
+        return None
+
+    def _group_lines(self, scan, column, total_rows):
+        # La medida es la primera columna numérica que no sea un identificador
+        measures = [c for c in scan.columns if c != column and _is_numeric(scan[c]) and not _is_identifier(c)]
+        grouped = scan.groupby(column, dropna=True, observed=True)
+        table = grouped.size().to_frame("size")
+        if measures:
+            table["mean"] = grouped[measures[0]].mean()
+        table = table.sort_values("size", ascending=False)
+
+        exact = len(scan) == total_rows
+        title = f"Grupos principales por {column} (filas" + (f", media de {measures[0]}" if measures else "") + "):"
+        rows = []
+        for key, row in table.head(self.top_groups).iterrows():
+            share = row["size"] / len(scan)
+            count = f"{int(row['size'])}" if exact else f"~{int(round(share * total_rows))}"
+            line = f"- {self._cell(key)}: {count} filas ({share:.0%})"
+            if measures:
+                line += f", {_number(row['mean'])}"
+            rows.append(line)
+        extra = len(table) - self.top_groups
+        if extra > 0:
+            rows.append(f"- (+{extra} grupos más)")
+        return [title] + rows
+
+    # --------------------------------------------
+    # Muestra de filas
+    # --------------------------------------------
+    def _sample(self, frame, group_column):
+        """
+        Muestra estratificada: con columna de agrupación, las primeras filas de
+        cada grupo por turnos (todos los grupos aparecen antes de repetir uno);
+        sin ella, filas espaciadas a lo largo del resultado.
+        """
+        k = min(self.sample_rows, len(frame))
+        if group_column is not None:
+            rank = frame.groupby(group_column, dropna=False, sort=False).cumcount().to_numpy()
+            positions = np.sort(np.argsort(rank, kind="stable")[:k])
+        else:
+            positions = np.unique(np.linspace(0, len(frame) - 1, k).astype(int))
+        return frame.iloc[positions]
+
+    def _rows_text(self, frame):
+        header = " | ".join(map(str, frame.columns))
+        cells = frame.astype(object).where(frame.notna(), None).to_numpy()
+        rows = [" | ".join(self._cell(value) for value in row) for row in cells]
+        return "\n".join([header] + rows)
+
+    def _cell(self, value):
+        if isinstance(value, float) and not value.is_integer():
+            value = round(value, 2)
+        text = "NULL" if value is None else str(value)
+        if len(text) > self.max_cell_chars:
+            text = text[:self.max_cell_chars - 1] + "…"
+        return text
+
+
+def to_frame(sql_result):
+    """DataFrame a partir de un resultado SQL (DataFrame, filas o dicts); None si es un valor suelto."""
+    if isinstance(sql_result, pd.DataFrame):
+        return sql_result
+    if isinstance(sql_result, (list, tuple)):
+        rows = list(sql_result)
+        if not rows:
+            return pd.DataFrame()
+        if isinstance(rows[0], dict):
+            return pd.DataFrame.from_records(rows)
+        if isinstance(rows[0], (list, tuple)):
+            frame = pd.DataFrame.from_records(rows)
+            frame.columns = [f"col{i + 1}" for i in range(len(frame.columns))]
+            return frame
+        return pd.DataFrame({"valor": rows})
+    return None
+
+
+def _is_numeric(series):
+    return pd.api.types.is_numeric_dtype(series) and not pd.api.types.is_bool_dtype(series)
+
+
+def _is_identifier(column):
+    name = str(column).lower()
+    return name == "id" or name.endswith("_id") or name.startswith("id_")
+
+
+def numeric_decimals(frame):
+    """Columnas de objetos Decimal (DECIMAL de pymysql) convertidas a numéricas."""
+    # pymysql devuelve DECIMAL como objetos Decimal: se agregan como números
+    converted = {}
+    for column in frame.columns:
+        series = frame[column]
+        if series.dtype == object:
+            # Primer valor no nulo de toda la columna: puede haber muchas filas NULL al principio
+            present = series.notna().to_numpy()
+            if present.any() and isinstance(series.iloc[present.argmax()], Decimal):
+                converted[column] = pd.to_numeric(series, errors="coerce")
+    return frame.assign(**converted) if converted else frame
+
+
+def _number(value):
+    if pd.isna(value):
+        return "NULL"
+    value = float(value)
+    if value.is_integer():
+        return f"{int(value):,}"
+    return f"{value:,.2f}"
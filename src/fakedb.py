@@ -0,0 +1,279 @@
+import re
+import time
+import random
+import sqlite3
+import itertools
+import threading
+
+# Valores de baja cardinalidad para que los datos de ejemplo se parezcan a los reales
+CIUDADES = ["Lima", "Arequipa", "Cusco", "Trujillo", "Piura", "Chiclayo", "Iquitos", "Tacna"]
+ESTADOS = ["activo", "inactivo", "pendiente"]
+
+_db_counter = itertools.count()
+
+
+class FakeDatabase:
+    """
+    Base de datos local que imita a MySQL para pruebas y benchmarks sin servidor.
+    - Los datos viven en un SQLite en memoria compartido entre conexiones.
+    - Las consultas a information_schema se responden con metadatos generados.
+    - EXPLAIN devuelve un plan al estilo MySQL a partir de los metadatos.
+    - Cada `execute` cuenta como un viaje de ida y vuelta y puede simular latencia.
+    """
+    def __init__(self, n_tables=10, rows_per_table=50, latency=0.0, db_name="fake", seed=0):
+        """
+        :param n_tables: Número de tablas a generar
+        :param rows_per_table: Filas de datos por tabla
+        :param latency: Segundos de espera por cada `execute` (simula la red)
+        :param db_name: Nombre del esquema que reporta information_schema
+        """
+        self.db_name = db_name
+        self.latency = latency
+        self.round_trips = 0
+        self.connections_opened = 0
+        self._lock = threading.Lock()
+        self._uri = f"file:fakedb_{next(_db_counter)}?mode=memory&cache=shared"
+        # Conexión maestra: mantiene viva la BD en memoria
+        self._master = sqlite3.connect(self._uri, uri=True, check_same_thread=False)
+        self.info = {"tables": [], "columns": [], "key_column_usage": [], "statistics": []}
+        self._generate(n_tables, rows_per_table, random.Random(seed))
+
+    # --------------------------------------------
+    # Generación del esquema
+    # --------------------------------------------
+    def _generate(self, n_tables, rows_per_table, rng):
+        for i in range(n_tables):
+            table = f"tabla_{i:04d}"
+            # (nombre, tipo MySQL, tipo SQLite, clave, nullable, comentario)
+            columns = [
+                ("id", "int", "INTEGER", "PRI", "NO", "Identificador"),
+                ("nombre", "varchar", "TEXT", "", "NO", f"Nombre del registro de {table}"),
+                ("ciudad", "varchar", "TEXT", "MUL", "YES", "Ciudad"),
+                ("estado", "varchar", "TEXT", "", "YES", ""),
+                ("edad", "int", "INTEGER", "", "YES", ""),
+                ("monto", "decimal", "REAL", "", "YES", "Monto en soles"),
+                ("fecha_registro", "datetime", "TEXT", "", "YES", ""),
+            ]
+            parent = f"tabla_{i - 1:04d}" if i > 0 else None
+            if parent:
+                columns.append((f"{parent}_id", "int", "INTEGER", "MUL", "YES", ""))
+
+            self.info["tables"].append({
+                "table_name": table,
+                "table_rows": rows_per_table,
+                "table_comment": f"Tabla de ejemplo {i}",
+                "create_time": "2024-01-01 00:00:00",
+                "update_time": None,
+            })
+            for pos, (col, dtype, _, key, nullable, comment) in enumerate(columns, start=1):
+                self.info["columns"].append({
+                    "table_name": table, "column_name": col, "data_type": dtype,
+                    "column_key": key, "is_nullable": nullable, "column_default": None,
+                    "column_comment": comment, "extra": "auto_increment" if key == "PRI" else "",
+                    "ordinal_position": pos,
+                })
+            self.info["statistics"].append({
+                "table_name": table, "index_name": "PRIMARY", "non_unique": 0,
+                "column_name": "id", "seq_in_index": 1,
+            })
+            self.info["statistics"].append({
+                "table_name": table, "index_name": "idx_ciudad", "non_unique": 1,
+                "column_name": "ciudad", "seq_in_index": 1,
+            })
+            if parent:
+                self.info["key_column_usage"].append({
+                    "table_name": table, "column_name": f"{parent}_id",
+                    "referenced_table_name": parent, "referenced_column_name": "id",
+                    "constraint_name": f"fk_{table}_{parent}", "ordinal_position": 1,
+                })
+
+            col_defs = ", ".join(
+                f"{col} {sqlite_type}{' PRIMARY KEY' if key == 'PRI' else ''}"
+                for col, _, sqlite_type, key, _, _ in columns
+            )
+            self._master.execute(f"CREATE TABLE {table} ({col_defs})")
+            rows = []
+            for r in range(1, rows_per_table + 1):
+                row = [
+                    r,
+                    f"Registro {r} de {table}",
+                    rng.choice(CIUDADES),
+                    rng.choice(ESTADOS),
+                    rng.randint(18, 80),
+                    round(rng.uniform(10, 5000), 2),
+                    f"2024-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d} 10:00:00",
+                ]
+                if parent:
+                    row.append(rng.randint(1, rows_per_table))
+                rows.append(row)
+            placeholders = ", ".join("?" for _ in columns)
+            self._master.executemany(f"INSERT INTO {table} VALUES ({placeholders})", rows)
+        self._master.commit()
+
+    # --------------------------------------------
+    # API de conexión
+    # --------------------------------------------
+    def connect(self):
+        """Equivalente a pymysql.connect: retorna una conexión nueva."""
+        with self._lock:
+            self.connections_opened += 1
+        return FakeConnection(self)
+
+    def add_column(self, table, column, data_type="varchar"):
+        """Simula un ALTER TABLE ... ADD COLUMN (cambia la huella de la tabla)."""
+        position = sum(1 for c in self.info["columns"] if c["table_name"] == table) + 1
+        self.info["columns"].append({
+            "table_name": table, "column_name": column, "data_type": data_type,
+            "column_key": "", "is_nullable": "YES", "column_default": None,
+            "column_comment": "", "extra": "", "ordinal_position": position,
+        })
+        self._master.execute(f"ALTER TABLE {table} ADD COLUMN {column} TEXT")
+        self._master.commit()
+
+    def touch(self, table):
+        """Simula una escritura: actualiza UPDATE_TIME de la tabla."""
+        for t in self.info["tables"]:
+            if t["table_name"] == table:
+                t["update_time"] = time.strftime("%Y-%m-%d %H:%M:%S")
+
+    def reset_counters(self):
+        with self._lock:
+            self.round_trips = 0
+            self.connections_opened = 0
+
+    def _count_round_trip(self):
+        with self._lock:
+            self.round_trips += 1
+        if self.latency:
+            time.sleep(self.latency)
+
+    def _query_information_schema(self, view, sql, params):
+        """Responde un SELECT sobre information_schema.<view> con los metadatos generados."""
+        select = re.search(r"SELECT\s+(.*?)\s+FROM", sql, re.S | re.I).group(1)
+        fields = [
+            "column_count" if "count(" in f.lower() else f.strip().split(".")[-1].split()[-1].lower()
+            for f in select.split(",")
+        ]
+        rows = self.info[view]
+        if "column_count" in fields:
+            counts = {}
+            for col in self.info["columns"]:
+                counts[col["table_name"]] = counts.get(col["table_name"], 0) + 1
+            rows = [dict(r, column_count=counts.get(r["table_name"], 0)) for r in rows]
+
+        params = list(params or [])
+        if params and params[0] != self.db_name:
+            return [], fields
+        names = params[1:]
+        if names and re.search(r"table_name\s+IN", sql, re.I):
+            wanted = set(names)
+            rows = [r for r in rows if r["table_name"] in wanted]
+        elif names:
+            rows = [r for r in rows if r["table_name"] == names[0]]
+        if re.search(r"referenced_table_name\s+IS\s+NOT\s+NULL", sql, re.I):
+            rows = [r for r in rows if r.get("referenced_table_name")]
+        return [tuple(r.get(f) for f in fields) for r in rows], fields
+
+
+    def _explain(self, sql):
+        """
+        Imita el EXPLAIN tabular de MySQL: una fila por tabla del FROM/JOIN,
+        con acceso por clave primaria si hay un filtro `id = ...` y recorrido completo si no.
+        """
+        fields = ["id", "select_type", "table", "type", "possible_keys", "key", "rows", "filtered", "Extra"]
+        table_rows = {t["table_name"]: t["table_rows"] for t in self.info["tables"]}
+        has_where = re.search(r"\bWHERE\b", sql, re.I) is not None
+        rows = []
+        for table in re.findall(r"\b(?:FROM|JOIN)\s+`?(\w+)`?", sql, re.I):
+            if table not in table_rows:
+                continue
+            by_key = re.search(rf"(?:`?{table}`?\.)?`?id`?\s*=", sql, re.I) and has_where
+            rows.append((
+                1, "SIMPLE", table,
+                "const" if by_key else "ALL",
+                "PRIMARY" if by_key else None,
+                "PRIMARY" if by_key else None,
+                1 if by_key else table_rows[table],
+                100.0 if by_key or not has_where else 10.0,
+                None if by_key else ("Using where" if has_where else None),
+            ))
+        return rows, fields
+
+
+class FakeConnection:
+    """Conexión compatible con lo que usan los agentes de pymysql (cursor, commit, ping...)."""
+    def __init__(self, db):
+        self.db = db
+        self._sqlite = sqlite3.connect(db._uri, uri=True, check_same_thread=False)
+        self.open = True
+
+    def cursor(self, cursorclass=None):
+        return FakeCursor(self)
+
+    def commit(self):
+        self._sqlite.commit()
+
+    def rollback(self):
+        self._sqlite.rollback()
+
+    def ping(self, reconnect=False):
+        if not self.open:
+            raise ConnectionError("Conexión cerrada")
+        self.db._count_round_trip()
+
+    def close(self):
+        self.open = False
+        self._sqlite.close()
+
+
+class FakeCursor:
+    def __init__(self, conn):
+        self.conn = conn
+        self.description = None
+        self.rowcount = -1
+        self._rows = []
+        self._pos = 0
+
+    def execute(self, sql, params=None):
+        db = self.conn.db
+        db._count_round_trip()
+        view = re.search(r"information_schema\.(\w+)", sql, re.I)
+        if re.match(r"\s*EXPLAIN\b", sql, re.I):
+            rows, fields = db._explain(sql)
+            self.description = [(f, None, None, None, None, None, None) for f in fields]
+        elif view:
+            rows, fields = db._query_information_schema(view.group(1).lower(), sql, params)
+            self.description = [(f, None, None, None, None, None, None) for f in fields]
+        else:
+            if params is not None:
+                # Como pymysql: con parámetros, %% es un % literal
+                sql = sql.replace("%s", "?").replace("%%", "%")
+            cur = self.conn._sqlite.execute(sql, tuple(params or ()))
+            rows = cur.fetchall()
+            self.description = cur.description
+            if cur.description is None:
+                self.rowcount = cur.rowcount
+        self._rows, self._pos = rows, 0
+        if self.description is not None:
+            self.rowcount = len(rows)
+        return self.rowcount
+
+    def fetchone(self):
+        if self._pos >= len(self._rows):
+            return None
+        row = self._rows[self._pos]
+        self._pos += 1
+        return row
+
+    def fetchmany(self, size=1):
+        rows = self._rows[self._pos:self._pos + size]
+        self._pos += len(rows)
+        return rows
+
+    def fetchall(self):
+        rows = self._rows[self._pos:]
+        self._pos = len(self._rows)
+        return rows
+
+    def close(self):
+        self._rows = []
@@ -0,0 +1,125 @@
+import re
+import json
+import time
+import threading
+from typing import Any, Iterator, List, Optional
+from langchain_core.language_models.llms import LLM
+from langchain_core.outputs import GenerationChunk
+from tokens import estimate_tokens
+
+
+class FakeLLM(LLM):
+    """
+    LLM determinista para pruebas y benchmarks, sin llamadas a OpenAI.
+    Reconoce los prompts de interpretación, generación de SQL, modo de una
+    sola llamada y reescritura de consultas costosas, y responde a partir
+    del esquema que viene en el prompt.
+    La latencia simulada es `latency + latency_per_token * tokens del prompt`
+    hasta el primer token, más `token_interval` por cada token de la respuesta;
+    con stream() la respuesta llega por trozos de un token.
+    """
+    latency: float = 0.0
+    latency_per_token: float = 0.0
+    token_interval: float = 0.0
+    calls: int = 0
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+    lock: Any = None
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.lock = threading.Lock()
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake-sqlbot"
+
+    @property
+    def _identifying_params(self):
+        return {"model_name": "fake-sqlbot", "temperature": 0}
+
+    def reset_counters(self):
+        with self.lock:
+            self.calls = 0
+            self.prompt_tokens = 0
+            self.completion_tokens = 0
+
+    def _call(self, prompt: str, stop: Optional[List[str]] = None, run_manager=None, **kwargs) -> str:
+        response = self._start(prompt)
+        if self.token_interval:
+            time.sleep(self.token_interval * estimate_tokens(response))
+        return response
+
+    def _stream(self, prompt: str, stop: Optional[List[str]] = None, run_manager=None,
+                **kwargs) -> Iterator[GenerationChunk]:
+        response = self._start(prompt)
+        for i in range(0, len(response), 4):
+            if self.token_interval:
+                time.sleep(self.token_interval)
+            chunk = GenerationChunk(text=response[i:i + 4])
+            if run_manager:
+                run_manager.on_llm_new_token(chunk.text, chunk=chunk)
+            yield chunk
+
+    def _start(self, prompt):
+        # Espera hasta el primer token y cuenta la llamada
+        prompt_tokens = estimate_tokens(prompt)
+        delay = self.latency + self.latency_per_token * prompt_tokens
+        if delay:
+            time.sleep(delay)
+        response = self._respond(prompt)
+        with self.lock:
+            self.calls += 1
+            self.prompt_tokens += prompt_tokens
+            self.completion_tokens += estimate_tokens(response)
+        return response
+
+    # --------------------------------------------
+    # Respuestas deterministas
+    # --------------------------------------------
+    def _respond(self, prompt):
+        if "Respuesta en Lenguaje Natural" in prompt:
+            rows = self._field(prompt, r"Resultados de la Consulta: (\d+) filas")
+            return f"La consulta devolvió {rows or 'algunas'} filas."
+        if "demasiado costosa" in prompt:
+            # Reescritura: la misma consulta con un LIMIT pequeño
+            sql = self._field(prompt, r"^\s*((?:SELECT|WITH)\b.*)$")
+            sql = re.sub(r"\s+LIMIT\s+\d+.*$", "", sql.rstrip(";"), flags=re.I)
+            return f"{sql} LIMIT 25;"
+        if "Genera una consulta SQL precisa" in prompt:
+            table = self._field(prompt, r"- Tabla: (.*)")
+            intent = self._field(prompt, r"- Intención: (.*)")
+            filters = json.loads(self._field(prompt, r"- Filtros: (.*)") or "{}")
+            return self._sql(intent, table, filters)
+
+        question = self._field(prompt, r"Pregunta: (.*)")
+        structure = self._interpret(prompt, question)
+        if '"sql"' in prompt:
+            sql = self._sql(structure["intencion"], structure["tabla"], structure["filtros"])
+            return json.dumps({**structure, "sql": sql}, ensure_ascii=False)
+        return json.dumps(structure, ensure_ascii=False)
+
+    def _interpret(self, prompt, question):
+        tables = re.findall(r"Tabla: (\w+)", prompt) or re.findall(r"^(\w+)\(", prompt, re.M)
+        lowered = question.lower()
+        table = next((t for t in tables if t.lower() in lowered), tables[0] if tables else None)
+        intent = "contar" if "cuánt" in lowered or "cuant" in lowered else "listar"
+        filters = {}
+        city = re.search(r"\bde ([A-ZÁÉÍÓÚ][a-záéíóú]+)", question)
+        if city:
+            filters["ciudad"] = city.group(1)
+        return {"intencion": intent, "tabla": table, "filtros": filters}
+
+    @staticmethod
+    def _sql(intent, table, filters):
+        where = ""
+        if filters:
+            where = " WHERE " + " AND ".join(f"{col} = '{val}'" for col, val in filters.items())
+        if intent == "contar":
+            return f"SELECT COUNT(*) FROM {table}{where};"
+        return f"SELECT * FROM {table}{where} LIMIT 25;"
+
+    @staticmethod
+    def _field(prompt, pattern):
+        match = re.search(pattern, prompt, re.M)
+        return match.group(1).strip() if match else ""
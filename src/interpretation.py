@@ -1,5 +1,6 @@
 import os
 import re
+import asyncio
 import pymysql
 import pandas as pd
 from dotenv import load_dotenv
@@ -8,42 +9,120 @@ from langchain.prompts import PromptTemplate
 from langchain.chains import LLMChain
 import json
 from conection import *
+from tracing import annotate, span
+from tokens import estimate_tokens
+from digest import ResultDigester
+from streaming import stream_chain
+
+def build_schema_context(schema_agent, question, retriever=None, profiler=None, profile_budget=400,
+                         value_index=None):
+    """
+    Retorna (esquema, contexto) para el prompt. El esquema son las tablas relevantes
+    (o todas, sin retriever) y sale memoizado por versión, así que es la parte estable
+    del prompt; el contexto depende de la pregunta: el perfil de valores de esas tablas
+    si hay profiler y, si hay índice de valores, las columnas donde aparecen sus literales.
+    """
+    tables = retriever.select_tables(question) if retriever else None
+    schema_text = schema_agent.get_prompt_schema(tables=tables)
+    sections = []
+    if profiler and profile_budget > 0:
+        profile_text = profiler.get_profile_text(tables, token_budget=profile_budget)
+        if profile_text:
+            sections.append("Perfil de los datos (valores frecuentes, rangos y nulos):\n" + profile_text)
+    if value_index:
+        hints = value_index.resolve(question, tables=tables)
+        annotate(value_hints=len(hints))
+        if hints:
+            sections.append(
+                "Valores de la pregunta encontrados en la base de datos "
+                "(usa estas columnas para filtrar):\n" + value_index.format_hints(hints)
+            )
+    context = "".join(f"\n{section}\n" for section in sections)
+    return schema_text, context
 
 class UserQueryAgent:
     """
     Este agente recibe la pregunta del usuario y la transforma
     en una estructura JSON/Dict con intención, entidad y posibles filtros.
     """
-    def __init__(self, llm, schema_agent):
+    # Instrucciones fijas primero y luego el esquema: el prefijo del prompt se repite
+    # entre preguntas (caché de prompts del proveedor); lo variable va al final
+    PROMPT_TEMPLATE = """
+        Interpreta la pregunta del usuario y describe su intención en formato JSON:
+        - "intencion": la acción (contar, listar, detallar, etc.)
+        - "tabla": la tabla principal
+        - "filtros": un objeto con columna: valor para filtrar (puede estar vacío)
+
+        Esquema de la base de datos:
+        {schema}
+        {context}
+        Pregunta: {question}
+        """
+
+    def __init__(self, llm, schema_agent, retriever=None, cache=None, profiler=None, profile_budget=400,
+                 value_index=None):
+        """
+        :param retriever: SchemaRetriever opcional; si se indica, el prompt
+                          solo incluye las tablas relevantes a la pregunta
+        :param cache: LLMResponseCache opcional para no repetir preguntas ya interpretadas
+        :param profiler: ColumnProfiler opcional; añade al esquema el perfil de
+                         valores de las tablas elegidas
+        :param profile_budget: Tokens máximos para ese perfil
+        :param value_index: ValueIndex opcional; añade las columnas donde aparecen
+                            los literales de la pregunta
+        """
         self.llm = llm
         self.schema_agent = schema_agent
+        self.retriever = retriever
+        self.cache = cache
+        self.profiler = profiler
+        self.profile_budget = profile_budget
+        self.value_index = value_index
+        self.chain = compile_chain(llm, self.PROMPT_TEMPLATE)
 
     def interpret(self, question):
         """
         Usa un LLM para analizar la intención del usuario
         y retorna un dict con la estructura de la consulta.
         """
-        prompt_template = """
-        Con base en el siguiente esquema de la base de datos:
-        {schema}
+        cached, request = self._prepare(question)
+        if cached is not None:
+            return cached
+        raw_response = request["chain"].run(**request["inputs"]).strip()
+        return self._parse(raw_response, request)
 
-        Interpreta la pregunta del usuario y describe su intención en formato JSON:
-        - "intencion": la acción (contar, listar, detallar, etc.)
-        - "tabla": la tabla principal
-        - "filtros": un objeto con columna: valor para filtrar (puede estar vacío)
+    async def ainterpret(self, question):
+        """Variante asíncrona de interpret: la llamada al LLM usa su API async."""
+        cached, request = await asyncio.to_thread(self._prepare, question)
+        if cached is not None:
+            return cached
+        raw_response = (await request["chain"].arun(**request["inputs"])).strip()
+        return self._parse(raw_response, request)
 
-        Pregunta: {question}
-        """
-        schema_text = self.schema_agent.get_schema_text()
+    def _prepare(self, question):
+        """Retorna (respuesta en caché, None) o (None, datos para llamar al LLM)."""
+        cache_key, fingerprint = None, None
+        if self.cache:
+            # Revalidar el esquema antes de leer su huella
+            self.schema_agent.get_schema_dict()
+            fingerprint = getattr(self.schema_agent, "schema_fingerprint", None)
+            cache_key = self.cache.make_key("interpret", question, self.PROMPT_TEMPLATE, self.llm, fingerprint)
+            cached = self.cache.get(cache_key, fingerprint)
+            annotate(cache_hit=cached is not None)
+            if cached is not None:
+                return cached, None
 
-        prompt = PromptTemplate(
-            template=prompt_template,
-            input_variables=["schema", "question"]
+        schema_text, context = build_schema_context(
+            self.schema_agent, question, self.retriever, self.profiler, self.profile_budget, self.value_index
         )
-        chain = LLMChain(llm=self.llm, prompt=prompt)
-
-        raw_response = chain.run(schema=schema_text, question=question).strip()
+        return None, {
+            "chain": self.chain,
+            "inputs": {"schema": schema_text, "context": context, "question": question},
+            "cache_key": cache_key,
+            "fingerprint": fingerprint
+        }
 
+    def _parse(self, raw_response, request):
         # Intentar parsear el raw_response como JSON
         try:
             query_structure = json.loads(raw_response)
@@ -54,9 +133,132 @@ class UserQueryAgent:
                 "tabla": None,
                 "filtros": {}
             }
+        else:
+            if request["cache_key"] and isinstance(query_structure, dict):
+                self.cache.set(request["cache_key"], query_structure, request["fingerprint"])
 
         return query_structure
 
+class FusedQueryAgent:
+    """
+    Modo de una sola llamada: un único prompt devuelve a la vez la
+    interpretación (intencion/tabla/filtros) y la consulta SQL, en lugar
+    de interpretar y luego volver a enviar el esquema para generar el SQL.
+    """
+    PROMPT_TEMPLATE = """
+        Interpreta la pregunta del usuario y genera la consulta SQL en una sola respuesta.
+        Devuelve SOLO un objeto JSON con estas claves:
+        - "intencion": la acción (contar, listar, detallar, etc.)
+        - "tabla": la tabla principal (null si la pregunta no es sobre la base de datos)
+        - "filtros": un objeto con columna: valor para filtrar (puede estar vacío)
+        - "sql": la consulta SQL con nombres correctos de tablas y columnas,
+          limitada a 25 resultados si no se especifica lo contrario
+
+        Esquema de la base de datos:
+        {schema}
+        {context}
+        Pregunta: {question}
+        """
+
+    def __init__(self, llm, schema_agent, retriever=None, cache=None, profiler=None, profile_budget=400,
+                 value_index=None):
+        self.llm = llm
+        self.schema_agent = schema_agent
+        self.retriever = retriever
+        self.cache = cache
+        self.profiler = profiler
+        self.profile_budget = profile_budget
+        self.value_index = value_index
+        self.chain = compile_chain(llm, self.PROMPT_TEMPLATE)
+
+    def interpret_and_generate(self, question):
+        """
+        Retorna (query_structure, sql_query). Si la pregunta no es sobre la BD
+        o la respuesta no se puede parsear, la tabla es None y el SQL vacío.
+        """
+        cached, request = self._prepare(question)
+        if cached is not None:
+            return cached
+        raw_response = request["chain"].run(**request["inputs"]).strip()
+        return self._parse(raw_response, request)
+
+    async def ainterpret_and_generate(self, question):
+        """Variante asíncrona de interpret_and_generate."""
+        cached, request = await asyncio.to_thread(self._prepare, question)
+        if cached is not None:
+            return cached
+        raw_response = (await request["chain"].arun(**request["inputs"])).strip()
+        return self._parse(raw_response, request)
+
+    def _prepare(self, question):
+        cache_key, fingerprint = None, None
+        if self.cache:
+            self.schema_agent.get_schema_dict()
+            fingerprint = getattr(self.schema_agent, "schema_fingerprint", None)
+            cache_key = self.cache.make_key("fused", question, self.PROMPT_TEMPLATE, self.llm, fingerprint)
+            cached = self.cache.get(cache_key, fingerprint)
+            annotate(cache_hit=cached is not None)
+            if cached is not None:
+                return (cached["query_structure"], cached["sql"]), None
+
+        schema_text, context = build_schema_context(
+            self.schema_agent, question, self.retriever, self.profiler, self.profile_budget, self.value_index
+        )
+        return None, {
+            "chain": self.chain,
+            "inputs": {"schema": schema_text, "context": context, "question": question},
+            "cache_key": cache_key,
+            "fingerprint": fingerprint
+        }
+
+    def _parse(self, raw_response, request):
+        parsed = parse_json_object(raw_response)
+        if not isinstance(parsed, dict):
+            return {"intencion": "desconocida", "tabla": None, "filtros": {}}, ""
+
+        sql_query = str(parsed.pop("sql", "") or "").strip()
+        if sql_query and not sql_query.endswith(";"):
+            sql_query += ";"
+        query_structure = {
+            "intencion": parsed.get("intencion", "desconocida"),
+            "tabla": parsed.get("tabla"),
+            "filtros": parsed.get("filtros") or {}
+        }
+        if request["cache_key"] and query_structure["tabla"] and sql_query:
+            self.cache.set(
+                request["cache_key"],
+                {"query_structure": query_structure, "sql": sql_query},
+                request["fingerprint"]
+            )
+        return query_structure, sql_query
+
+
+def compile_chain(llm, template):
+    """
+    PromptTemplate + LLMChain de una plantilla, para construirlos una sola vez
+    por agente en lugar de en cada llamada.
+    """
+    prompt = PromptTemplate.from_template(template)
+    return LLMChain(llm=llm, prompt=prompt)
+
+
+def parse_json_object(raw):
+    """
+    Parsea la respuesta del LLM como JSON; si viene envuelta en texto o en
+    un bloque ```json, extrae el primer objeto {...}. Retorna None si no hay JSON.
+    """
+    try:
+        return json.loads(raw)
+    except json.JSONDecodeError:
+        pass
+    match = re.search(r"\{.*\}", raw, re.S)
+    if match:
+        try:
+            return json.loads(match.group(0))
+        except json.JSONDecodeError:
+            pass
+    return None
+
 class SQLQueryGenerationAgent:
     """
     Agente que genera consultas SQL basadas en la estructura de consulta interpretada.
@@ -100,38 +302,47 @@ class SQLQueryGenerationAgent:
 class NaturalLanguageResponseAgent:
     """
     Agente que convierte resultados de consultas SQL en respuestas en lenguaje natural.
+    El LLM recibe un resumen acotado del resultado (ResultDigester), no el resultado entero.
     """
-    def __init__(self, llm):
-        self.llm = llm
-
-    def generate_response(self, query_structure, sql_result):
-        """
-        Genera una respuesta en lenguaje natural basada en los resultados de la consulta.
-        """
-        prompt_template = """
-        Basado en la estructura de consulta original y los resultados de la consulta SQL:
+    PROMPT_TEMPLATE = """
+        Basado en la estructura de consulta original y el resumen de los resultados de la consulta SQL:
 
         Estructura de Consulta: {query_structure}
         Resultados de la Consulta: {sql_result}
 
         Genera una respuesta en lenguaje natural concisa y clara que responda la pregunta original.
+        Si los resultados están resumidos, usa el número de filas y los agregados para las cifras
+        totales; la muestra de filas solo sirve de ejemplo.
 
         Respuesta en Lenguaje Natural:
         """
 
-        prompt = PromptTemplate(
-            template=prompt_template,
-            input_variables=["query_structure", "sql_result"]
-        )
-        chain = LLMChain(llm=self.llm, prompt=prompt)
+    def __init__(self, llm, token_budget=800):
+        """
+        :param token_budget: Tokens máximos del resumen de resultados en el prompt
+        """
+        self.llm = llm
+        self.digester = ResultDigester(token_budget=token_budget)
+        self.chain = compile_chain(llm, self.PROMPT_TEMPLATE)
 
-        natural_response = chain.run(
-            query_structure=json.dumps(query_structure),
-            sql_result=str(sql_result)
-        ).strip()
+    def generate_response(self, query_structure, sql_result):
+        """
+        Genera una respuesta en lenguaje natural basada en los resultados de la consulta.
+        """
+        natural_response = self.chain.run(**self._inputs(query_structure, sql_result)).strip()
 
         return natural_response
 
+    def stream_response(self, query_structure, sql_result):
+        """Variante de generate_response que entrega la respuesta por trozos a medida que llega."""
+        yield from stream_chain(self.chain, self._inputs(query_structure, sql_result))
+
+    def _inputs(self, query_structure, sql_result):
+        with span("result_digest"):
+            digest = self.digester.summarize(sql_result)
+            annotate(digest_tokens=estimate_tokens(digest))
+        return {"query_structure": json.dumps(query_structure, default=str), "sql_result": digest}
+
 class QueryOrchestrator:
     """
     Orquestador que coordina los tres agentes para procesar consultas de usuario.
@@ -139,7 +350,9 @@ class QueryOrchestrator:
     def __init__(self, llm, schema_agent):
         self.user_query_agent = UserQueryAgent(llm, schema_agent)
         self.sql_query_agent = SQLQueryGenerationAgent(llm, schema_agent)
-        self.natural_language_agent = NaturalLanguageResponseAgent(llm)
+        self.natural_language_agent = NaturalLanguageResponseAgent(
+            llm, token_budget=int(os.getenv("RESPONSE_DIGEST_TOKENS", "800"))
+        )
 
     def process_query(self, question):
         """
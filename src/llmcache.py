@@ -0,0 +1,240 @@
+import os
+import re
+import json
+import time
+import sqlite3
+import hashlib
+import logging
+import threading
+import unicodedata
+from collections import OrderedDict
+
+
+def normalize_question(text):
+    """Normaliza una pregunta para el caché: minúsculas, espacios simples, sin signos al borde."""
+    text = unicodedata.normalize("NFKC", str(text)).lower()
+    text = re.sub(r"\s+", " ", text)
+    return text.strip(" ¿?¡!.,;")
+
+
+def llm_params(llm):
+    """Parámetros del modelo que afectan la respuesta (modelo, temperatura, etc.)."""
+    params = getattr(llm, "_identifying_params", None)
+    if params is None:
+        params = {"class": type(llm).__name__}
+    return json.dumps(params, sort_keys=True, default=str)
+
+
+class LLMResponseCache:
+    """
+    Caché de respuestas del LLM en dos niveles:
+    - LRU en memoria del proceso (acceso inmediato).
+    - Almacén SQLite en disco (sobrevive reinicios y se comparte entre procesos).
+    La huella del esquema forma parte de la clave, así que una respuesta nunca
+    se reutiliza con otro esquema; además, cuando el esquema de una base de
+    datos cambia, se borran las entradas de su huella anterior. Cada base de
+    datos (`db_key`) se invalida por separado: cambiar de BD en una sesión no
+    borra lo guardado para las demás, ni lo de otras sesiones que comparten
+    el archivo. Los agentes usan la vista de scoped(db_key).
+    """
+    def __init__(self, path=None, max_memory_entries=512, max_disk_entries=10000, max_age=7 * 24 * 3600):
+        """
+        :param path: Ruta del archivo SQLite (None = solo memoria)
+        :param max_memory_entries: Tamaño máximo del LRU en memoria
+        :param max_disk_entries: Número máximo de entradas en disco
+        :param max_age: Segundos de vida de una entrada
+        """
+        self.path = path
+        self.max_memory_entries = max_memory_entries
+        self.max_disk_entries = max_disk_entries
+        self.max_age = max_age
+
+        self._memory = OrderedDict()  # clave -> (valor, huella de esquema, creado, db_key)
+        self._schema_fingerprints = {}  # db_key -> última huella vista
+        self._lock = threading.Lock()
+        self._db = None
+        self.metrics = {"hits": 0, "memory_hits": 0, "disk_hits": 0, "misses": 0, "evictions": 0}
+        self.logger = logging.getLogger("LLMResponseCache")
+
+        if path:
+            directory = os.path.dirname(path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self._db = sqlite3.connect(path, check_same_thread=False)
+            self._db.execute("""
+                CREATE TABLE IF NOT EXISTS llm_cache (
+                    key TEXT PRIMARY KEY,
+                    value TEXT NOT NULL,
+                    schema_fingerprint TEXT,
+                    created REAL NOT NULL,
+                    accessed REAL NOT NULL,
+                    db_key TEXT
+                )
+            """)
+            columns = [row[1] for row in self._db.execute("PRAGMA table_info(llm_cache)")]
+            if "db_key" not in columns:
+                # Archivo de una versión anterior: sus entradas quedan sin BD y caducan solas
+                self._db.execute("ALTER TABLE llm_cache ADD COLUMN db_key TEXT")
+            self._db.execute("CREATE INDEX IF NOT EXISTS idx_llm_cache_accessed ON llm_cache (accessed)")
+            self._db.commit()
+
+    def scoped(self, db_key):
+        """Vista del caché para una base de datos (misma interfaz que usan los agentes)."""
+        return ScopedLLMCache(self, db_key)
+
+    @staticmethod
+    def make_key(kind, text, template, llm, schema_fingerprint, db_key=None, normalize=True):
+        """
+        Clave del caché: tipo de llamada, texto normalizado, hash de la
+        plantilla del prompt, parámetros del modelo, huella del esquema y BD.
+        Con normalize=False el texto entra tal cual: es para datos (ej. el JSON
+        de filtros), donde "Lima" y "LIMA" pueden dar resultados distintos.
+        """
+        parts = [
+            kind,
+            normalize_question(text) if normalize else text,
+            hashlib.sha1(template.encode("utf-8")).hexdigest(),
+            llm_params(llm),
+            str(schema_fingerprint),
+        ]
+        if db_key is not None:
+            parts.append(str(db_key))
+        return hashlib.sha256("\x1f".join(parts).encode("utf-8")).hexdigest()
+
+    # --------------------------------------------
+    # Lectura y escritura
+    # --------------------------------------------
+    def get(self, key, schema_fingerprint=None, db_key=None):
+        """Retorna el valor guardado o None si no existe o expiró."""
+        now = time.time()
+        with self._lock:
+            self._check_schema(db_key, schema_fingerprint)
+
+            entry = self._memory.get(key)
+            if entry is not None and now - entry[2] <= self.max_age:
+                self._memory.move_to_end(key)
+                self.metrics["hits"] += 1
+                self.metrics["memory_hits"] += 1
+                return json.loads(entry[0])
+            if entry is not None:
+                del self._memory[key]
+
+            if self._db is not None:
+                row = self._db.execute(
+                    "SELECT value, schema_fingerprint, created, db_key FROM llm_cache WHERE key = ?", (key,)
+                ).fetchone()
+                if row is not None and now - row[2] <= self.max_age:
+                    self._db.execute("UPDATE llm_cache SET accessed = ? WHERE key = ?", (now, key))
+                    self._db.commit()
+                    self._remember(key, row[0], row[1], row[2], row[3])
+                    self.metrics["hits"] += 1
+                    self.metrics["disk_hits"] += 1
+                    return json.loads(row[0])
+
+            self.metrics["misses"] += 1
+            return None
+
+    def set(self, key, value, schema_fingerprint=None, db_key=None):
+        """Guarda un valor serializable a JSON en ambos niveles."""
+        now = time.time()
+        raw = json.dumps(value, ensure_ascii=False)
+        with self._lock:
+            self._check_schema(db_key, schema_fingerprint)
+            self._remember(key, raw, schema_fingerprint, now, db_key)
+            if self._db is not None:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO llm_cache (key, value, schema_fingerprint, created, accessed, db_key) "
+                    "VALUES (?, ?, ?, ?, ?, ?)",
+                    (key, raw, schema_fingerprint, now, now, db_key)
+                )
+                self._evict_disk(now)
+                self._db.commit()
+
+    def clear(self):
+        with self._lock:
+            self._memory.clear()
+            if self._db is not None:
+                self._db.execute("DELETE FROM llm_cache")
+                self._db.commit()
+
+    def stats(self):
+        with self._lock:
+            total = self.metrics["hits"] + self.metrics["misses"]
+            stats = {
+                **self.metrics,
+                "memory_entries": len(self._memory),
+                "hit_ratio": self.metrics["hits"] / total if total else 0.0,
+            }
+            if self._db is not None:
+                stats["disk_entries"] = self._db.execute("SELECT COUNT(*) FROM llm_cache").fetchone()[0]
+            return stats
+
+    # --------------------------------------------
+    # Mantenimiento (se llaman con el lock tomado)
+    # --------------------------------------------
+    def _remember(self, key, raw, schema_fingerprint, created, db_key=None):
+        self._memory[key] = (raw, schema_fingerprint, created, db_key)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_memory_entries:
+            self._memory.popitem(last=False)
+            self.metrics["evictions"] += 1
+
+    def _evict_disk(self, now):
+        self._db.execute("DELETE FROM llm_cache WHERE created < ?", (now - self.max_age,))
+        excess = self._db.execute("SELECT COUNT(*) FROM llm_cache").fetchone()[0] - self.max_disk_entries
+        if excess > 0:
+            self._db.execute(
+                "DELETE FROM llm_cache WHERE key IN "
+                "(SELECT key FROM llm_cache ORDER BY accessed LIMIT ?)", (excess,)
+            )
+            self.metrics["evictions"] += excess
+
+    def _check_schema(self, db_key, schema_fingerprint):
+        # Un cambio de huella de una BD invalida lo generado con su esquema anterior
+        previous = self._schema_fingerprints.get(db_key)
+        if schema_fingerprint is None or schema_fingerprint == previous:
+            return
+        self._schema_fingerprints[db_key] = schema_fingerprint
+        if previous is None:
+            return
+        self.logger.info("El esquema cambió: se invalidan las respuestas en caché de esa base de datos.")
+        stale = [k for k, entry in self._memory.items() if entry[3] == db_key and entry[1] == previous]
+        for key in stale:
+            del self._memory[key]
+        if self._db is not None:
+            if db_key is None:
+                self._db.execute(
+                    "DELETE FROM llm_cache WHERE db_key IS NULL AND schema_fingerprint = ?", (previous,)
+                )
+            else:
+                self._db.execute(
+                    "DELETE FROM llm_cache WHERE db_key = ? AND schema_fingerprint = ?", (db_key, previous)
+                )
+            self._db.commit()
+
+
+class ScopedLLMCache:
+    """
+    Vista de LLMResponseCache para una base de datos: las claves y la
+    invalidación por cambio de esquema quedan separadas por `db_key`.
+    """
+    def __init__(self, cache, db_key):
+        self.cache = cache
+        self.db_key = db_key
+
+    def make_key(self, kind, text, template, llm, schema_fingerprint, normalize=True):
+        return self.cache.make_key(
+            kind, text, template, llm, schema_fingerprint, db_key=self.db_key, normalize=normalize
+        )
+
+    def get(self, key, schema_fingerprint=None):
+        return self.cache.get(key, schema_fingerprint, db_key=self.db_key)
+
+    def set(self, key, value, schema_fingerprint=None):
+        self.cache.set(key, value, schema_fingerprint, db_key=self.db_key)
+
+    def clear(self):
+        self.cache.clear()
+
+    def stats(self):
+        return self.cache.stats()
@@ -0,0 +1,222 @@
+import time
+import logging
+import threading
+from collections import deque
+
+
+class PoolTimeoutError(Exception):
+    """Se lanza cuando no se libera ninguna conexión dentro del tiempo de espera."""
+
+
+class PoolClosedError(Exception):
+    """Se lanza al pedir una conexión a un pool que ya fue cerrado."""
+
+
+class PooledConnection:
+    """
+    Envoltorio de una conexión prestada por el pool.
+    Delega todo en la conexión real, pero `close()` la devuelve al pool
+    en lugar de cerrar el socket. Así los agentes que hacen
+    `conn = get_connection() ... conn.close()` siguen funcionando igual.
+    """
+    def __init__(self, pool, raw_conn):
+        self._pool = pool
+        self._conn = raw_conn
+        self._released = False
+        self._broken = False
+
+    def invalidate(self):
+        """Marca la conexión como inservible: al cerrarla se descarta en vez de reutilizarse."""
+        self._broken = True
+
+    def close(self):
+        if self._released:
+            return
+        self._released = True
+        self._pool._release(self._conn, discard=self._broken)
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
+class ConnectionPool:
+    """
+    Pool de conexiones acotado y seguro entre hilos.
+    - Reutiliza conexiones abiertas (LIFO, para usar las más "calientes").
+    - Recicla las que llevan más de `max_idle` segundos sin usarse.
+    - Hace ping a las que llevan más de `ping_interval` segundos ociosas antes de prestarlas.
+    - Lleva métricas de préstamos, esperas y tamaño.
+    """
+    def __init__(self, connect, max_size=10, max_idle=300, timeout=30, ping_interval=30):
+        """
+        :param connect: Función que abre una conexión nueva a la BD
+        :param max_size: Número máximo de conexiones abiertas a la vez
+        :param max_idle: Segundos que una conexión puede estar ociosa antes de cerrarse
+        :param timeout: Segundos máximos de espera por una conexión libre
+        :param ping_interval: Segundos de inactividad a partir de los cuales se valida con ping
+        """
+        if max_size < 1:
+            raise ValueError("max_size debe ser al menos 1.")
+        self._connect = connect
+        self.max_size = max_size
+        self.max_idle = max_idle
+        self.timeout = timeout
+        self.ping_interval = ping_interval
+
+        self._idle = deque()  # (conexión, último uso)
+        self._size = 0        # conexiones abiertas (ociosas + prestadas)
+        self._in_use = 0
+        self._closed = False
+        self._cond = threading.Condition()
+        self.metrics = {
+            "checkouts": 0,
+            "waits": 0,
+            "timeouts": 0,
+            "created": 0,
+            "recycled": 0,
+            "failed_checks": 0,
+        }
+        self.logger = logging.getLogger("ConnectionPool")
+
+    # --------------------------------------------
+    # Préstamo y devolución
+    # --------------------------------------------
+    def get_connection(self):
+        """
+        Retorna una conexión del pool. Bloquea hasta `timeout` segundos
+        si todas están prestadas; después lanza PoolTimeoutError.
+        """
+        deadline = time.monotonic() + self.timeout
+        waited = False
+        while True:
+            raw_conn, last_used, stale = None, None, []
+            must_create = False
+            with self._cond:
+                if self._closed:
+                    raise PoolClosedError("El pool de conexiones está cerrado.")
+                stale = self._pop_stale()
+                if self._idle:
+                    raw_conn, last_used = self._idle.pop()
+                elif self._size < self.max_size:
+                    self._size += 1  # Reservamos el hueco antes de conectar
+                    must_create = True
+                else:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self.metrics["timeouts"] += 1
+                        raise PoolTimeoutError(
+                            f"No hay conexiones libres tras {self.timeout}s (máximo {self.max_size})."
+                        )
+                    if not waited:
+                        self.metrics["waits"] += 1
+                        waited = True
+                    self._cond.wait(remaining)
+
+            self._close_quietly(stale)
+
+            if must_create:
+                try:
+                    raw_conn = self._connect()
+                except Exception:
+                    with self._cond:
+                        self._size -= 1
+                        self._cond.notify()
+                    raise
+                with self._cond:
+                    self.metrics["created"] += 1
+            elif raw_conn is None:
+                continue  # Despertamos de la espera: volver a intentar
+            elif time.monotonic() - last_used > self.ping_interval and not self._is_healthy(raw_conn):
+                with self._cond:
+                    self.metrics["failed_checks"] += 1
+                    self._size -= 1
+                self._close_quietly([raw_conn])
+                continue
+
+            with self._cond:
+                self.metrics["checkouts"] += 1
+                self._in_use += 1
+            return PooledConnection(self, raw_conn)
+
+    def _release(self, raw_conn, discard=False):
+        """Devuelve una conexión al pool (llamado desde PooledConnection.close)."""
+        if not discard:
+            try:
+                # Cerramos la transacción abierta para no arrastrar snapshots ni bloqueos
+                raw_conn.rollback()
+            except Exception:
+                discard = True
+
+        to_close = []
+        with self._cond:
+            self._in_use -= 1
+            if discard or self._closed:
+                self._size -= 1
+                to_close.append(raw_conn)
+            else:
+                self._idle.append((raw_conn, time.monotonic()))
+            self._cond.notify()
+        self._close_quietly(to_close)
+
+    # --------------------------------------------
+    # Mantenimiento
+    # --------------------------------------------
+    def close(self):
+        """
+        Cierra el pool: descarta las conexiones ociosas de inmediato y
+        las prestadas cuando se devuelvan.
+        """
+        with self._cond:
+            self._closed = True
+            to_close = [conn for conn, _ in self._idle]
+            self._idle.clear()
+            self._size -= len(to_close)
+            self._cond.notify_all()
+        self._close_quietly(to_close)
+        self.logger.info(f"Pool cerrado ({len(to_close)} conexiones ociosas liberadas).")
+
+    def stats(self):
+        """Retorna un dict con las métricas y el tamaño actual del pool."""
+        with self._cond:
+            return {
+                **self.metrics,
+                "size": self._size,
+                "idle": len(self._idle),
+                "in_use": self._in_use,
+                "max_size": self.max_size,
+                "closed": self._closed,
+            }
+
+    def _pop_stale(self):
+        # Las más antiguas quedan a la izquierda; se llama con el lock tomado
+        stale = []
+        now = time.monotonic()
+        while self._idle and now - self._idle[0][1] > self.max_idle:
+            conn, _ = self._idle.popleft()
+            stale.append(conn)
+        if stale:
+            self._size -= len(stale)
+            self.metrics["recycled"] += len(stale)
+            self._cond.notify(len(stale))
+        return stale
+
+    def _is_healthy(self, raw_conn):
+        try:
+            raw_conn.ping(reconnect=False)
+            return True
+        except Exception as e:
+            self.logger.warning(f"Conexión descartada por fallo en ping: {e}")
+            return False
+
+    def _close_quietly(self, connections):
+        for conn in connections:
+            try:
+                conn.close()
+            except Exception:
+                pass
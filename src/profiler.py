@@ -0,0 +1,258 @@
+import os
+import json
+import time
+import sqlite3
+import logging
+import threading
+import pandas as pd
+from concurrent.futures import ThreadPoolExecutor
+from tokens import estimate_tokens
+from digest import numeric_decimals
+
+
+class ColumnProfiler:
+    """
+    Perfil estadístico de las columnas de cada tabla: proporción de nulos,
+    número aproximado de valores distintos, mínimo/máximo y valores más frecuentes.
+    Se calcula con pandas sobre una muestra acotada (`sample_rows` filas) y se
+    guarda por tabla (memoria + SQLite opcional). Solo se recalcula una tabla
+    cuando cambia su huella (DDL + UPDATE_TIME). En disco se guardan por
+    servidor y base de datos (`db_key`), para que dos servidores con una BD del
+    mismo nombre no se pisen.
+    El texto resultante sustituye a las filas de ejemplo en el prompt, con
+    mucha más información por token.
+    """
+    def __init__(self, schema_agent, get_connection, path=None, sample_rows=1000, top_k=3, max_workers=4,
+                 db_key=None):
+        """
+        :param schema_agent: Instancia de DatabaseSchemaAgent
+        :param get_connection: Función que retorna una conexión a la BD
+        :param path: Ruta del archivo SQLite donde persistir los perfiles (None = solo memoria)
+        :param sample_rows: Filas leídas por tabla para calcular el perfil
+        :param top_k: Valores frecuentes que se guardan por columna de texto
+        :param max_workers: Tablas que se perfilan a la vez
+        :param db_key: Identidad de la BD en disco (ej. "host:puerto/bd"); por defecto, el nombre de la BD
+        """
+        self.schema_agent = schema_agent
+        self.get_connection = get_connection
+        self.path = path
+        self.sample_rows = sample_rows
+        self.top_k = top_k
+        self.max_workers = max_workers
+        self.db_key = db_key
+
+        self._profiles = {}  # tabla -> (huella, perfil)
+        self._lock = threading.Lock()
+        self._db = None
+        self.metrics = {"computed": 0, "memory_hits": 0, "disk_hits": 0}
+        self.logger = logging.getLogger("ColumnProfiler")
+
+        if path:
+            directory = os.path.dirname(path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self._db = sqlite3.connect(path, check_same_thread=False)
+            columns = [row[1] for row in self._db.execute("PRAGMA table_info(column_profiles)")]
+            if columns and "db_key" not in columns:
+                # Formato anterior, con clave solo por nombre de BD: se recalcula
+                self._db.execute("DROP TABLE column_profiles")
+            self._db.execute("""
+                CREATE TABLE IF NOT EXISTS column_profiles (
+                    db_key TEXT NOT NULL,
+                    table_name TEXT NOT NULL,
+                    fingerprint TEXT NOT NULL,
+                    profile TEXT NOT NULL,
+                    created REAL NOT NULL,
+                    PRIMARY KEY (db_key, table_name)
+                )
+            """)
+            self._db.commit()
+
+    # --------------------------------------------
+    # Perfiles
+    # --------------------------------------------
+    def get_profiles(self, tables=None):
+        """
+        Retorna {tabla: perfil} para las tablas indicadas (todas por defecto).
+        Las que no están al día se recalculan en paralelo.
+        """
+        schema_dict = self.schema_agent.get_schema_dict()
+        names = [t for t in (tables if tables is not None else schema_dict) if t in schema_dict]
+        fingerprints = {t: self._fingerprint(t) for t in names}
+
+        profiles, missing = {}, []
+        for table in names:
+            profile = self._lookup(table, fingerprints[table])
+            if profile is None:
+                missing.append(table)
+            else:
+                profiles[table] = profile
+
+        if missing:
+            workers = max(1, min(self.max_workers, len(missing)))
+            with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="profiler") as executor:
+                computed = list(executor.map(self._profile_table, missing))
+            for table, profile in zip(missing, computed):
+                if profile is None:
+                    continue
+                profiles[table] = profile
+                self._store(table, fingerprints[table], profile)
+        return profiles
+
+    def get_profile_text(self, tables=None, token_budget=800):
+        """
+        Texto compacto del perfil, una línea por tabla, sin pasar de `token_budget`.
+        Ejemplo:
+            clientes (~1200 filas): id único 1..1200; ciudad 8 valores: Lima, Cusco, Arequipa; edad 18..90, nulos 4%
+        """
+        profiles = self.get_profiles(tables)
+        lines, used = [], 0
+        for table, profile in profiles.items():
+            line = self._render_table(table, profile)
+            cost = estimate_tokens(line)
+            if lines and used + cost > token_budget:
+                break
+            lines.append(line)
+            used += cost
+        return "\n".join(lines)
+
+    def clear(self):
+        with self._lock:
+            self._profiles.clear()
+            if self._db is not None:
+                self._db.execute("DELETE FROM column_profiles WHERE db_key = ?", (self._db_key(),))
+                self._db.commit()
+
+    def stats(self):
+        with self._lock:
+            return {**self.metrics, "tables": len(self._profiles)}
+
+    # --------------------------------------------
+    # Cálculo
+    # --------------------------------------------
+    def _profile_table(self, table_name):
+        conn = None
+        try:
+            conn = self.get_connection()
+            df = pd.read_sql(f"SELECT * FROM `{table_name}` LIMIT {int(self.sample_rows)};", conn)
+            # DECIMAL llega como objetos Decimal: se perfila como número (mín/máx), no como texto
+            df = numeric_decimals(df)
+        except Exception as e:
+            self.logger.error(f"No se pudo perfilar {table_name}: {e}")
+            return None
+        finally:
+            if conn:
+                conn.close()
+
+        with self._lock:
+            self.metrics["computed"] += 1
+        rows = len(df)
+        return {
+            "rows_sampled": rows,
+            # Si la muestra llegó al límite, los conteos de distintos son aproximados
+            "complete": rows < self.sample_rows,
+            "columns": {col: self._profile_column(df[col], rows) for col in df.columns},
+        }
+
+    def _profile_column(self, series, rows):
+        non_null = series.dropna()
+        distinct = int(non_null.nunique())
+        profile = {
+            "null_ratio": round(1 - len(non_null) / rows, 4) if rows else 0.0,
+            "distinct": distinct,
+            "unique": bool(len(non_null)) and distinct == len(non_null),
+        }
+        if non_null.empty:
+            return profile
+
+        if pd.api.types.is_numeric_dtype(non_null) and not pd.api.types.is_bool_dtype(non_null):
+            profile["min"], profile["max"] = _plain(non_null.min()), _plain(non_null.max())
+        elif pd.api.types.is_datetime64_any_dtype(non_null):
+            profile["min"], profile["max"] = str(non_null.min()), str(non_null.max())
+        elif distinct * 2 <= len(non_null):
+            # Columna de texto de baja cardinalidad: valores más frecuentes
+            top = non_null.astype(str).value_counts().head(self.top_k)
+            profile["top"] = [[value, int(count)] for value, count in top.items()]
+        return profile
+
+    # --------------------------------------------
+    # Texto para el prompt
+    # --------------------------------------------
+    def _render_table(self, table, profile):
+        details = self.schema_agent.get_schema_dict().get(table, {})
+        rows = details.get("row_estimate") or profile["rows_sampled"]
+        approx = "" if profile["complete"] else "~"
+        parts = []
+        for col, stats in profile["columns"].items():
+            text = col
+            if stats["unique"]:
+                text += " único"
+            elif "top" in stats:
+                text += f" {approx}{stats['distinct']} valores: " + ", ".join(str(v) for v, _ in stats["top"])
+            elif "min" not in stats:
+                text += f" {approx}{stats['distinct']} distintos"
+            if "min" in stats:
+                text += f" {stats['min']}..{stats['max']}"
+            if stats["null_ratio"] >= 0.01:
+                text += f", nulos {stats['null_ratio']:.0%}"
+            parts.append(text)
+        return f"{table} (~{rows} filas): " + "; ".join(parts)
+
+    # --------------------------------------------
+    # Almacenamiento
+    # --------------------------------------------
+    def _fingerprint(self, table_name):
+        return json.dumps([
+            self.schema_agent.table_fingerprints.get(table_name),
+            self.schema_agent.table_update_times.get(table_name),
+            self.sample_rows,
+            self.top_k,
+        ], default=str)
+
+    def _db_key(self):
+        return str(self.db_key or getattr(self.schema_agent, "db_name", ""))
+
+    def _lookup(self, table, fingerprint):
+        with self._lock:
+            cached = self._profiles.get(table)
+            if cached is not None and cached[0] == fingerprint:
+                self.metrics["memory_hits"] += 1
+                return cached[1]
+            if self._db is None:
+                return None
+            row = self._db.execute(
+                "SELECT profile FROM column_profiles WHERE db_key = ? AND table_name = ? AND fingerprint = ?",
+                (self._db_key(), table, fingerprint)
+            ).fetchone()
+            if row is None:
+                return None
+            profile = json.loads(row[0])
+            self._profiles[table] = (fingerprint, profile)
+            self.metrics["disk_hits"] += 1
+            return profile
+
+    def _store(self, table, fingerprint, profile):
+        with self._lock:
+            self._profiles[table] = (fingerprint, profile)
+            if self._db is None:
+                return
+            try:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO column_profiles (db_key, table_name, fingerprint, profile, created) "
+                    "VALUES (?, ?, ?, ?, ?)",
+                    (self._db_key(), table, fingerprint, json.dumps(profile, default=str), time.time())
+                )
+                self._db.commit()
+            except sqlite3.Error as e:
+                self.logger.warning(f"No se pudo guardar el perfil de {table}: {e}")
+
+
+def _plain(value):
+    """Convierte escalares de numpy/Decimal a tipos serializables en JSON."""
+    if hasattr(value, "item"):
+        value = value.item()
+    if isinstance(value, float) and value.is_integer():
+        return int(value)
+    if isinstance(value, (int, float)):
+        return value
+    return str(value)
@@ -0,0 +1,296 @@
+import re
+import json
+import time
+import logging
+import threading
+from collections import OrderedDict
+
+# Literales entre comillas: se conservan tal cual al normalizar
+_QUOTED = re.compile(r"""('(?:[^'\\]|\\.)*'|"(?:[^"\\]|\\.)*")""")
+# Comentarios: no cuentan como texto de la consulta al buscar tablas
+_COMMENTS = re.compile(r"--[^\n]*|#[^\n]*|/\*.*?\*/", re.S)
+_TOKEN = re.compile(r"`[^`]*`|\w+|\S")
+
+# Palabras tras las que viene una lista de tablas
+_TABLE_LIST_START = {"FROM", "UPDATE", "JOIN", "STRAIGHT_JOIN"}
+# Palabras de unión entre tablas de una lista
+_JOIN_WORDS = {"JOIN", "STRAIGHT_JOIN", "INNER", "CROSS", "LEFT", "RIGHT", "OUTER", "NATURAL", "FULL"}
+# Palabras que terminan una lista de tablas
+_TABLE_LIST_END = {
+    "WHERE", "SET", "GROUP", "ORDER", "LIMIT", "HAVING", "UNION", "WINDOW", "FOR", "LOCK", "INTO",
+    "PROCEDURE", "VALUES", "SELECT", "RETURNING", "EXCEPT", "INTERSECT", "OFFSET",
+}
+
+
+def normalize_sql(sql):
+    """Colapsa espacios y pasa a minúsculas todo lo que no está entre comillas."""
+    parts = _QUOTED.split(sql.strip().rstrip(";").strip())
+    for i in range(0, len(parts), 2):
+        parts[i] = re.sub(r"\s+", " ", parts[i]).lower()
+    return "".join(parts)
+
+
+def referenced_tables(sql):
+    """
+    Tablas que lee o escribe la consulta (sin el prefijo de esquema): todas las
+    de las listas tras FROM/UPDATE (con comas, JOIN, tablas derivadas y JOIN
+    entre paréntesis), tras INTO y tras TABLE.
+    Retorna None si la consulta tiene una forma que no se sabe leer con
+    certeza (ej. particiones o índices forzados): quien la use debe suponer
+    que puede tocar cualquier tabla.
+    """
+    unquoted = _COMMENTS.sub(" ", " ".join(_QUOTED.split(sql)[::2]))
+    try:
+        return _TableScanner(_TOKEN.findall(unquoted)).scan()
+    except _Uncertain:
+        return None
+
+
+class _Uncertain(Exception):
+    pass
+
+
+class _TableScanner:
+    def __init__(self, tokens):
+        self.tokens = tokens
+        self.tables = set()
+        self.depth = 0
+        self.resume = []  # Niveles de paréntesis tras cuyo cierre sigue una lista de tablas
+
+    def scan(self):
+        tokens, i, previous = self.tokens, 0, None
+        while i < len(tokens):
+            token, word = tokens[i], tokens[i].upper()
+            if token == "(":
+                self.depth += 1
+                i += 1
+            elif token == ")":
+                self.depth -= 1
+                i += 1
+                if self.resume and self.resume[-1] == self.depth:
+                    # Fin de una tabla derivada o de un JOIN entre paréntesis: sigue la lista
+                    self.resume.pop()
+                    i = self._table_list(i, expect_table=False)
+            elif word in ("INSERT", "REPLACE") and i + 1 < len(tokens) and tokens[i + 1] != "(":
+                # INSERT/REPLACE [modificadores] [INTO] t
+                i += 1
+                while i < len(tokens) and tokens[i].upper() in ("LOW_PRIORITY", "DELAYED", "HIGH_PRIORITY", "IGNORE"):
+                    i += 1
+                if i < len(tokens) and tokens[i].upper() != "INTO":
+                    i = self._add_name(i)
+            elif word == "INTO":
+                if i + 1 < len(tokens) and tokens[i + 1].upper() in ("OUTFILE", "DUMPFILE") or \
+                        (i + 1 < len(tokens) and tokens[i + 1] == "@"):
+                    i += 2
+                else:
+                    i = self._add_name(i + 1)
+            elif word == "TABLE":
+                # CREATE/DROP/ALTER/TRUNCATE TABLE [IF [NOT] EXISTS] t[, t2]
+                i += 1
+                if i < len(tokens) and tokens[i].upper() == "IF":
+                    i += 2 if i + 1 < len(tokens) and tokens[i + 1].upper() == "EXISTS" else 3
+                i = self._add_name(i)
+                while i < len(tokens) and tokens[i] == ",":
+                    i = self._add_name(i + 1)
+            elif word in _TABLE_LIST_START and not (word == "UPDATE" and previous in ("KEY", "FOR")):
+                # (ON DUPLICATE KEY UPDATE y FOR UPDATE no abren una lista de tablas)
+                i = self._table_list(i + 1, expect_table=True)
+            else:
+                i += 1
+            previous = word
+        return self.tables
+
+    def _add_name(self, i):
+        # `t`, `db`.`t` o db.t
+        tokens = self.tokens
+        if i >= len(tokens) or not _is_identifier(tokens[i]):
+            raise _Uncertain()
+        name, i = tokens[i], i + 1
+        if i + 1 < len(tokens) and tokens[i] == "." and _is_identifier(tokens[i + 1]):
+            name, i = tokens[i + 1], i + 2
+        self.tables.add(name.strip("`").lower())
+        return i
+
+    def _table_list(self, i, expect_table):
+        """
+        Recorre tabla [AS alias] {, | JOIN} tabla [ON ... | USING (...)] ...
+        Retorna la posición donde termina la lista, o la del "(" de una tabla
+        derivada (la lista sigue cuando scan() llega a su cierre).
+        """
+        tokens = self.tokens
+        n = len(tokens)
+        while True:
+            if expect_table:
+                if i < n and tokens[i] == "(":
+                    self.resume.append(self.depth)
+                    if i + 1 < n and tokens[i + 1].upper() in ("SELECT", "WITH", "("):
+                        return i  # Tabla derivada: scan() recorre la subconsulta
+                    # JOIN entre paréntesis: sus tablas son una lista más
+                    self.depth += 1
+                    i += 1
+                    continue
+                i = self._add_name(i)
+                expect_table = False
+
+            # Alias opcional
+            if i < n and tokens[i].upper() == "AS":
+                i += 1
+            if i < n and _is_identifier(tokens[i]) and tokens[i].upper() not in \
+                    _TABLE_LIST_END | _JOIN_WORDS | {"ON", "USING"}:
+                i += 1
+            # Condición del JOIN: hasta la siguiente coma o JOIN del mismo nivel de paréntesis
+            if i < n and tokens[i].upper() in ("ON", "USING"):
+                depth = 0
+                i += 1
+                while i < n:
+                    word = tokens[i].upper()
+                    if word == "(":
+                        depth += 1
+                    elif word == ")":
+                        if depth == 0:
+                            break
+                        depth -= 1
+                    elif depth == 0 and (word == "," or word in _JOIN_WORDS or word in _TABLE_LIST_END):
+                        break
+                    i += 1
+
+            if i >= n or tokens[i] in (")", ";"):
+                return i
+            word = tokens[i].upper()
+            if word == ",":
+                i += 1
+                expect_table = True
+            elif word in _JOIN_WORDS:
+                while i < n and tokens[i].upper() in _JOIN_WORDS - {"JOIN", "STRAIGHT_JOIN"}:
+                    i += 1
+                if i >= n or tokens[i].upper() not in ("JOIN", "STRAIGHT_JOIN"):
+                    raise _Uncertain()
+                i += 1
+                expect_table = True
+            elif word in _TABLE_LIST_END:
+                return i
+            else:
+                # PARTITION, USE/FORCE/IGNORE INDEX, un alias de más...: forma no reconocida
+                raise _Uncertain()
+
+
+def _is_identifier(token):
+    return token.startswith("`") or re.match(r"^\w+$", token) is not None
+
+
+class QueryResultCache:
+    """
+    Caché de resultados de SELECT, con clave el SQL normalizado y sus parámetros.
+    - LRU acotado por número de entradas y por bytes de los DataFrames.
+    - Cada entrada expira tras `ttl` segundos.
+    - Se invalida por tabla: al ejecutar escrituras sobre ella o cuando su
+      UPDATE_TIME en information_schema cambia respecto al de la entrada.
+    """
+    def __init__(self, max_entries=256, max_bytes=64 * 1024 * 1024, ttl=300):
+        """
+        :param max_entries: Número máximo de resultados guardados
+        :param max_bytes: Bytes máximos sumando todos los resultados
+        :param ttl: Segundos de vida de cada entrada (0 desactiva el caché)
+        """
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+
+        self._entries = OrderedDict()  # clave -> dict(result, tables, update_times, expires, bytes)
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.metrics = {"hits": 0, "misses": 0, "evictions": 0, "invalidations": 0}
+        self.logger = logging.getLogger("QueryResultCache")
+
+    @staticmethod
+    def make_key(sql, params=None):
+        return normalize_sql(sql) + "\x1f" + json.dumps(params, default=str)
+
+    def get(self, sql, params=None):
+        """
+        Retorna el resultado guardado (dict de execute_query) o None.
+        El DataFrame es una copia: cambiarlo no altera lo que reciben los demás.
+        """
+        key = self.make_key(sql, params)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry["expires"] < time.monotonic():
+                if entry is not None:
+                    self._drop(key)
+                self.metrics["misses"] += 1
+                return None
+            self._entries.move_to_end(key)
+            self.metrics["hits"] += 1
+            result = entry["result"]
+        return _copy_result(result)
+
+    def set(self, sql, params, result, update_times=None):
+        """
+        Guarda una copia del resultado de un SELECT (el llamador puede seguir usando el suyo).
+        :param update_times: UPDATE_TIME conocido de cada tabla antes de ejecutar la consulta
+        """
+        if self.ttl <= 0:
+            return
+        size = int(result.get("bytes") or 0)
+        if size > self.max_bytes:
+            return
+        tables = referenced_tables(sql)
+        if tables is None:
+            # No se sabe qué tablas lee: no habría cómo invalidarla
+            return
+        key = self.make_key(sql, params)
+        with self._lock:
+            if key in self._entries:
+                self._drop(key)
+            self._entries[key] = {
+                "result": _copy_result(result),
+                "tables": tables,
+                "update_times": {t: (update_times or {}).get(t) for t in tables},
+                "expires": time.monotonic() + self.ttl,
+                "bytes": size,
+            }
+            self._bytes += size
+            while self._entries and (len(self._entries) > self.max_entries or self._bytes > self.max_bytes):
+                self._drop(next(iter(self._entries)))
+                self.metrics["evictions"] += 1
+
+    def invalidate_tables(self, tables):
+        """Descarta las entradas que leen alguna de las tablas indicadas."""
+        tables = {t.lower() for t in tables}
+        with self._lock:
+            stale = [k for k, e in self._entries.items() if e["tables"] & tables]
+            for key in stale:
+                self._drop(key)
+            self.metrics["invalidations"] += len(stale)
+
+    def check_update_times(self, update_times):
+        """Descarta las entradas cuyas tablas tienen un UPDATE_TIME distinto al guardado."""
+        with self._lock:
+            stale = [
+                k for k, e in self._entries.items()
+                if any(update_times.get(t) != ut for t, ut in e["update_times"].items())
+            ]
+            for key in stale:
+                self._drop(key)
+            self.metrics["invalidations"] += len(stale)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self):
+        with self._lock:
+            return {**self.metrics, "entries": len(self._entries), "bytes": self._bytes}
+
+    def _drop(self, key):
+        # Se llama con el lock tomado
+        entry = self._entries.pop(key)
+        self._bytes -= entry["bytes"]
+
+
+def _copy_result(result):
+    data = result.get("data")
+    if hasattr(data, "copy"):
+        return {**result, "data": data.copy()}
+    return dict(result)
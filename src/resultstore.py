@@ -0,0 +1,170 @@
+import os
+import uuid
+import shutil
+import logging
+import tempfile
+import threading
+import weakref
+from collections import OrderedDict
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+
+class ResultStore:
+    """
+    Historial de resultados de una sesión del chat sin DataFrames completos en memoria.
+    Cada resultado se guarda como un "handle" pequeño (filas, columnas y una vista
+    previa de las primeras filas); si es más grande que la vista previa, el DataFrame
+    se vuelca a un archivo Parquet en el directorio de la sesión, con un row group
+    por página, y solo se lee la página que se pide.
+    Los archivos más antiguos se borran al pasar de `max_files` o de `max_disk_bytes`,
+    y el directorio se elimina con clear() o cuando el store se libera.
+    """
+    def __init__(self, directory=None, preview_rows=10, page_rows=100, max_files=200,
+                 max_disk_bytes=512 * 1024 * 1024):
+        """
+        :param directory: Directorio base (por defecto el temporal del sistema); la sesión usa un subdirectorio propio
+        :param preview_rows: Filas que se guardan en memoria como vista previa
+        :param page_rows: Filas por página al ver el resultado completo
+        :param max_files: Resultados volcados a disco como máximo
+        :param max_disk_bytes: Bytes en disco como máximo para la sesión
+        """
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.directory = tempfile.mkdtemp(prefix="sqlbot-results-", dir=directory or None)
+        self.preview_rows = preview_rows
+        self.page_rows = page_rows
+        self.max_files = max_files
+        self.max_disk_bytes = max_disk_bytes
+
+        self._files = OrderedDict()  # id -> (ruta, bytes)
+        self._lock = threading.Lock()
+        self.metrics = {"stored": 0, "spilled": 0, "pages_read": 0, "evicted": 0}
+        self.logger = logging.getLogger("ResultStore")
+        # Si la sesión desaparece sin llamar a clear(), el directorio se borra igual
+        self._finalizer = weakref.finalize(self, shutil.rmtree, self.directory, True)
+
+    # --------------------------------------------
+    # Escritura
+    # --------------------------------------------
+    def put(self, data):
+        """
+        Guarda un DataFrame y retorna su handle:
+        {"id", "rows", "columns", "preview", "pages", "spilled"}.
+        """
+        handle = {
+            "id": uuid.uuid4().hex,
+            "rows": len(data),
+            "columns": list(map(str, data.columns)),
+            "preview": data.head(self.preview_rows).copy(),
+            "pages": max(1, -(-len(data) // self.page_rows)),
+            "spilled": False,
+        }
+        with self._lock:
+            self.metrics["stored"] += 1
+        if len(data) <= self.preview_rows:
+            return handle
+
+        path = os.path.join(self.directory, f"{handle['id']}.parquet")
+        try:
+            self._write(data, path)
+        except Exception as e:
+            # Sin archivo, el historial se queda solo con la vista previa
+            self.logger.warning(f"No se pudo guardar el resultado en disco: {e}")
+            handle["pages"] = 1
+            return handle
+
+        size = os.path.getsize(path)
+        handle["spilled"] = True
+        with self._lock:
+            self._files[handle["id"]] = (path, size)
+            self.metrics["spilled"] += 1
+            self._evict()
+        return handle
+
+    def _write(self, data, path):
+        frame = data.reset_index(drop=True)
+        frame.columns = list(map(str, frame.columns))
+        try:
+            table = pa.Table.from_pandas(frame, preserve_index=False)
+        except (pa.ArrowInvalid, pa.ArrowTypeError, pa.ArrowNotImplementedError):
+            # Columnas con tipos mezclados (ej. Decimal y texto): se guardan como texto
+            mixed = {c: frame[c].map(lambda v: None if v is None else str(v)) for c in frame.columns
+                     if frame[c].dtype == object}
+            table = pa.Table.from_pandas(frame.assign(**mixed), preserve_index=False)
+        pq.write_table(table, path, row_group_size=self.page_rows)
+
+    # --------------------------------------------
+    # Lectura
+    # --------------------------------------------
+    def load_page(self, handle, page=0):
+        """
+        Retorna la página `page` (desde 0) del resultado como DataFrame, o None si
+        el archivo ya se borró. Si el resultado no se volcó, retorna la vista previa.
+        """
+        if not handle.get("spilled"):
+            return handle["preview"]
+        with self._lock:
+            entry = self._files.get(handle["id"])
+        if entry is None or not os.path.exists(entry[0]):
+            return None
+        parquet = pq.ParquetFile(entry[0])
+        page = min(max(0, int(page)), parquet.num_row_groups - 1)
+        with self._lock:
+            self.metrics["pages_read"] += 1
+        return parquet.read_row_group(page).to_pandas()
+
+    def load(self, handle):
+        """Resultado completo (para descargarlo); None si el archivo ya se borró."""
+        if not handle.get("spilled"):
+            return handle["preview"]
+        with self._lock:
+            entry = self._files.get(handle["id"])
+        if entry is None or not os.path.exists(entry[0]):
+            return None
+        return pd.read_parquet(entry[0])
+
+    def is_available(self, handle):
+        if not handle.get("spilled"):
+            return True
+        with self._lock:
+            return handle["id"] in self._files
+
+    # --------------------------------------------
+    # Limpieza
+    # --------------------------------------------
+    def clear(self):
+        """Borra todos los resultados volcados de la sesión."""
+        with self._lock:
+            for path, _ in self._files.values():
+                _remove(path)
+            self._files.clear()
+
+    def close(self):
+        self.clear()
+        self._finalizer()
+
+    def stats(self):
+        with self._lock:
+            return {
+                **self.metrics,
+                "files": len(self._files),
+                "disk_bytes": sum(size for _, size in self._files.values()),
+            }
+
+    def _evict(self):
+        # Se llama con el lock tomado
+        total = sum(size for _, size in self._files.values())
+        while self._files and (len(self._files) > self.max_files or total > self.max_disk_bytes):
+            _, (path, size) = self._files.popitem(last=False)
+            _remove(path)
+            total -= size
+            self.metrics["evicted"] += 1
+
+
+def _remove(path):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
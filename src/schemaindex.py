@@ -0,0 +1,177 @@
+import re
+import math
+import logging
+import threading
+import unicodedata
+from functools import lru_cache
+from collections import Counter
+
+
+def tokenize(text):
+    """
+    Normaliza un texto a términos de búsqueda: minúsculas, sin tildes,
+    separando por '_' y signos, y recortando plurales simples del español
+    ('clientes' -> 'client', 'cliente' -> 'client').
+    """
+    return list(_tokenize(str(text)))
+
+
+@lru_cache(maxsize=65536)
+def _tokenize(text):
+    # Los nombres de columna se repiten mucho entre tablas (id, nombre, fecha...)
+    text = unicodedata.normalize("NFKD", text).encode("ascii", "ignore").decode("ascii")
+    terms = []
+    for word in re.split(r"[^a-z0-9]+", text.lower()):
+        if len(word) < 2:
+            continue
+        if len(word) > 4 and word.endswith("es"):
+            word = word[:-2]
+        elif len(word) > 3 and word.endswith("s"):
+            word = word[:-1]
+        if len(word) > 4 and word.endswith("e"):
+            word = word[:-1]
+        terms.append(word)
+    return tuple(terms)
+
+
+class SchemaRetriever:
+    """
+    Índice léxico BM25 sobre el esquema, para enviar al LLM solo las tablas
+    relevantes a cada pregunta (más sus vecinas por FK) en lugar del esquema completo.
+    Cada tabla es un documento con su nombre, columnas, nombres humanizados y comentarios.
+    """
+    def __init__(self, schema_agent, semantic_agent=None, top_k=8, token_budget=2000, k1=1.5, b=0.75):
+        """
+        :param schema_agent: Instancia de DatabaseSchemaAgent
+        :param semantic_agent: SemanticMappingAgent opcional para añadir nombres humanizados
+        :param top_k: Número máximo de tablas seleccionadas por relevancia
+        :param token_budget: Tokens máximos del contexto de esquema
+        """
+        self.schema_agent = schema_agent
+        self.semantic_agent = semantic_agent
+        self.top_k = top_k
+        self.token_budget = token_budget
+        self.k1 = k1
+        self.b = b
+
+        self.index_version = None
+        self._docs = {}  # tabla -> Counter de términos
+        self._doc_freq = Counter()
+        self._postings = {}  # término -> [(tabla, frecuencia)]
+        self._doc_len = {}
+        self._order = {}  # tabla -> posición en el esquema (desempate)
+        self._avg_len = 0.0
+        self._table_tokens = {}  # tabla -> tokens estimados de su descripción
+        self._referenced_by = {}  # tabla -> tablas con FK hacia ella
+        self._lock = threading.Lock()
+        self.logger = logging.getLogger("SchemaRetriever")
+
+    # --------------------------------------------
+    # Construcción del índice
+    # --------------------------------------------
+    def _ensure_index(self):
+        schema_dict = self.schema_agent.get_schema_dict()
+        version = getattr(self.schema_agent, "schema_version", None)
+        with self._lock:
+            if self.index_version == version and self._docs:
+                return schema_dict
+            self._build(schema_dict)
+            self.index_version = version
+        return schema_dict
+
+    def _build(self, schema_dict):
+        semantic_map = self.semantic_agent.build_semantic_map() if self.semantic_agent else {}
+        docs, doc_freq, table_tokens, referenced_by = {}, Counter(), {}, {}
+
+        for table, details in schema_dict.items():
+            # El nombre de la tabla pesa más que el de sus columnas
+            terms = tokenize(table) * 3
+            terms += tokenize(details.get("comment", ""))
+            human = semantic_map.get(table, {})
+            terms += tokenize(human.get("human_name", ""))
+            for col, info in details["columns"].items():
+                terms += tokenize(col)
+                terms += tokenize(info.get("comment", ""))
+                terms += tokenize(human.get("columns", {}).get(col, ""))
+
+            for rel in details["relations"]:
+                referenced_by.setdefault(rel["referenced_table"], []).append(table)
+
+            docs[table] = Counter(terms)
+            doc_freq.update(docs[table].keys())
+            table_tokens[table] = self.schema_agent.prompt_tokens(table)
+
+        # Índice invertido: cada búsqueda solo recorre las tablas que contienen algún término
+        postings = {}
+        for table, counts in docs.items():
+            for term, tf in counts.items():
+                postings.setdefault(term, []).append((table, tf))
+
+        self._docs = docs
+        self._postings = postings
+        self._doc_len = {table: sum(counts.values()) for table, counts in docs.items()}
+        self._order = {table: i for i, table in enumerate(docs)}
+        self._doc_freq = doc_freq
+        self._table_tokens = table_tokens
+        self._referenced_by = referenced_by
+        self._avg_len = sum(sum(c.values()) for c in docs.values()) / len(docs) if docs else 0.0
+        self.logger.info(f"Índice de esquema construido ({len(docs)} tablas).")
+
+    # --------------------------------------------
+    # Búsqueda
+    # --------------------------------------------
+    def score(self, question):
+        """Retorna una lista [(tabla, puntuación)] ordenada de mayor a menor relevancia."""
+        self._ensure_index()
+        query_terms = set(tokenize(question))
+        n_docs = len(self._docs)
+        totals = {}
+        for term in query_terms:
+            postings = self._postings.get(term)
+            if not postings:
+                continue
+            df = self._doc_freq[term]
+            idf = math.log(1 + (n_docs - df + 0.5) / (df + 0.5))
+            for table, tf in postings:
+                norm = self.k1 * (1 - self.b + self.b * self._doc_len[table] / (self._avg_len or 1))
+                totals[table] = totals.get(table, 0.0) + idf * tf * (self.k1 + 1) / (tf + norm)
+        # Empates en el orden original del esquema, como al recorrer todas las tablas
+        scores = sorted(totals.items(), key=lambda item: (-item[1], self._order[item[0]]))
+        return scores
+
+    def select_tables(self, question, required=None):
+        """
+        Elige las tablas para el contexto: las obligatorias, las top-k por BM25
+        y luego sus vecinas por FK, sin pasar del presupuesto de tokens.
+        Si nada coincide, usa el esquema en su orden original hasta el presupuesto.
+        """
+        schema_dict = self._ensure_index()
+        hits = [t for t, _ in self.score(question)[:self.top_k]]
+
+        candidates = [t for t in (required or []) if t in schema_dict] + hits
+        for table in list(hits):
+            candidates += self._neighbours(schema_dict, table)
+        if not hits:
+            candidates += list(schema_dict.keys())
+
+        selected, used = [], 0
+        for table in candidates:
+            if table in selected:
+                continue
+            cost = self._table_tokens.get(table, 0)
+            if selected and used + cost > self.token_budget:
+                continue
+            selected.append(table)
+            used += cost
+        return selected
+
+    def get_schema_context(self, question, required=None):
+        """Texto de esquema reducido a las tablas relevantes para la pregunta."""
+        tables = self.select_tables(question, required=required)
+        return self.schema_agent.get_prompt_schema(tables=tables)
+
+    def _neighbours(self, schema_dict, table):
+        # Tablas referenciadas por `table` y tablas que referencian a `table`
+        neighbours = [rel["referenced_table"] for rel in schema_dict[table]["relations"]]
+        neighbours += self._referenced_by.get(table, [])
+        return [t for t in neighbours if t in schema_dict]
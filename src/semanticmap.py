@@ -14,6 +14,7 @@ class SemanticMappingAgent:
         
         self.schema_agent = schema_agent
         self.map_cache = None
+        self.map_version = None  # Versión del esquema con la que se construyó el mapa
 
         # Configurar logging
         self.logger = logging.getLogger("SemanticMappingAgent")
@@ -24,13 +25,15 @@ class SemanticMappingAgent:
         Crea un diccionario con equivalencias semánticas.
         Por ejemplo, 'car_color' -> ['color del carro', 'color'].
         """
-        if self.map_cache:
+        schema_dict = self.schema_agent.get_schema_dict()
+        # Si el esquema cambió de versión, el mapa en caché ya no es válido
+        version = getattr(self.schema_agent, "schema_version", None)
+        if self.map_cache is not None and self.map_version == version:
             self.logger.info("Usando mapa semántico desde el caché.")
             return self.map_cache
 
         self.logger.info("Construyendo el mapa semántico.")
         try:
-            schema_dict = self.schema_agent.get_schema_dict()
             semantic_map = {}
 
             for table, details in schema_dict.items():
@@ -43,6 +46,7 @@ class SemanticMappingAgent:
                     semantic_map[table]["columns"][col] = self.humanize(col)
 
             self.map_cache = semantic_map
+            self.map_version = version
             self.logger.info("Mapa semántico construido exitosamente.")
             return semantic_map
 
@@ -50,6 +54,12 @@ class SemanticMappingAgent:
             self.logger.error(f"Error al construir el mapa semántico: {e}")
             raise
 
+    def restore(self, semantic_map):
+        """Usa un mapa ya construido (ej. de la instantánea) para la versión actual del esquema."""
+        if semantic_map:
+            self.map_cache = semantic_map
+            self.map_version = getattr(self.schema_agent, "schema_version", None)
+
     def humanize(self, name):
         """
         Convierte un nombre_de_tabla o nombre_de_columna en formato legible.
@@ -0,0 +1,80 @@
+import os
+import json
+import time
+import sqlite3
+import logging
+import threading
+
+# Sube cuando cambia la estructura guardada: las instantáneas de otro formato se ignoran
+SNAPSHOT_FORMAT = 2
+
+
+class SchemaSnapshotStore:
+    """
+    Instantáneas en disco de lo que cuesta reconstruir al arrancar: el esquema
+    introspectado (con sus huellas por tabla) y el mapa semántico; nunca filas de
+    datos. Un proceso nuevo las carga en milisegundos y las revalida después
+    en segundo plano; se guarda una por base de datos, con el formato y la huella
+    del esquema con que se generó.
+    """
+    def __init__(self, path):
+        """
+        :param path: Ruta del archivo SQLite
+        """
+        self.path = path
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("""
+            CREATE TABLE IF NOT EXISTS schema_snapshots (
+                db_key TEXT PRIMARY KEY,
+                format INTEGER NOT NULL,
+                schema_fingerprint TEXT,
+                created REAL NOT NULL,
+                payload TEXT NOT NULL
+            )
+        """)
+        self._db.commit()
+        self._lock = threading.Lock()
+        self.logger = logging.getLogger("SchemaSnapshotStore")
+
+    def load(self, db_key):
+        """Retorna el contenido guardado para `db_key` o None si no hay uno de este formato."""
+        with self._lock:
+            row = self._db.execute(
+                "SELECT format, payload, created FROM schema_snapshots WHERE db_key = ?", (db_key,)
+            ).fetchone()
+        if row is None:
+            return None
+        if row[0] != SNAPSHOT_FORMAT:
+            self.logger.info(f"Instantánea de {db_key} en un formato anterior ({row[0]}): se ignora.")
+            return None
+        try:
+            payload = json.loads(row[1])
+        except json.JSONDecodeError as e:
+            self.logger.warning(f"Instantánea de {db_key} dañada: {e}")
+            return None
+        payload["created"] = row[2]
+        return payload
+
+    def save(self, db_key, payload):
+        schema = payload.get("schema") or {}
+        try:
+            raw = json.dumps(payload, ensure_ascii=False, default=str)
+            with self._lock:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO schema_snapshots (db_key, format, schema_fingerprint, created, payload) "
+                    "VALUES (?, ?, ?, ?, ?)",
+                    (db_key, SNAPSHOT_FORMAT, schema.get("schema_fingerprint"), time.time(), raw)
+                )
+                self._db.commit()
+        except (sqlite3.Error, TypeError, ValueError) as e:
+            self.logger.warning(f"No se pudo guardar la instantánea de {db_key}: {e}")
+            return False
+        return True
+
+    def delete(self, db_key):
+        with self._lock:
+            self._db.execute("DELETE FROM schema_snapshots WHERE db_key = ?", (db_key,))
+            self._db.commit()
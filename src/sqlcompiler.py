@@ -0,0 +1,218 @@
+import re
+import logging
+import threading
+import unicodedata
+from pymysql.converters import escape_item
+
+
+# Intenciones soportadas -> forma de la consulta
+INTENT_SHAPES = {
+    "contar": "count",
+    "cuantos": "count",
+    "cantidad": "count",
+    "listar": "list",
+    "lista": "list",
+    "mostrar": "list",
+    "obtener": "list",
+    "ver": "list",
+    "buscar": "list",
+    "consultar": "list",
+    "detallar": "list",
+    "detalle": "list",
+    "describir": "list",
+}
+
+# Operadores aceptados en filtros del tipo {"edad": {">": 30}}
+OPERATORS = {
+    "=": "=", "==": "=", "eq": "=",
+    "!=": "!=", "<>": "!=", "ne": "!=",
+    ">": ">", "gt": ">",
+    ">=": ">=", "gte": ">=",
+    "<": "<", "lt": "<",
+    "<=": "<=", "lte": "<=",
+}
+
+SCALAR_TYPES = (str, int, float, bool)
+
+# Un texto con estas palabras o símbolos no es un valor sino una condición
+# ("> 30", "mayor a 30", "entre 20 y 30", "Lim%"): se deja al LLM
+CONDITION_WORDS = {
+    "mayor", "mayores", "menor", "menores", "mas", "menos", "entre", "desde", "hasta",
+    "superior", "inferior", "minimo", "maximo", "distinto", "diferente", "excepto",
+    "contiene", "empieza", "termina", "like",
+}
+CONDITION_SYMBOLS = re.compile(r"[<>=!%*]")
+
+NUMERIC_TYPES = {
+    "tinyint", "smallint", "mediumint", "int", "integer", "bigint",
+    "decimal", "numeric", "float", "double", "real", "bit", "year",
+}
+DATE_TYPES = {"date", "datetime", "timestamp", "time"}
+NUMBER_TEXT = re.compile(r"^[+-]?\d+(\.\d+)?$")
+DATE_TEXT = re.compile(r"^\d{4}-\d{2}-\d{2}([ T]\d{2}:\d{2}(:\d{2})?)?$|^\d{2}:\d{2}(:\d{2})?$")
+
+
+def _normalize_word(text):
+    text = unicodedata.normalize("NFKD", str(text)).encode("ascii", "ignore").decode("ascii")
+    return text.strip().lower()
+
+
+class DeterministicSQLCompiler:
+    """
+    Compilador de reglas para las intenciones simples (contar/listar/detallar
+    con filtros columna = valor). Valida tabla y columnas contra el esquema y
+    genera SQL parametrizado sin llamar al LLM. Si la estructura no encaja en
+    ninguna forma soportada, retorna None y el pipeline usa el LLM.
+    Con un ValueIndex, los filtros de texto se corrigen con los valores reales:
+    se usa la grafía guardada y, si el valor solo existe en otra columna de la
+    tabla, el filtro pasa a esa columna.
+    """
+    def __init__(self, schema_agent, default_limit=25, value_index=None, enabled=True):
+        """
+        :param schema_agent: Instancia de DatabaseSchemaAgent
+        :param default_limit: LIMIT para las consultas de listado
+        :param value_index: ValueIndex opcional para validar los literales de los filtros
+        :param enabled: False para que todo vaya al LLM (ej. para medir el pipeline de dos llamadas)
+        """
+        self.schema_agent = schema_agent
+        self.enabled = enabled
+        self.default_limit = default_limit
+        self.value_index = value_index
+        self.metrics = {"fast_path": 0, "fallback": 0, "value_fixes": 0}
+        self._lock = threading.Lock()
+        self.logger = logging.getLogger("DeterministicSQLCompiler")
+
+    def compile(self, query_structure):
+        """
+        Retorna {"sql": str, "params": list} o None si hay que recurrir al LLM.
+        """
+        compiled = self._compile(query_structure) if self.enabled else None
+        with self._lock:
+            self.metrics["fast_path" if compiled else "fallback"] += 1
+        return compiled
+
+    def _compile(self, query_structure):
+        if not isinstance(query_structure, dict):
+            return None
+        shape = INTENT_SHAPES.get(_normalize_word(query_structure.get("intencion") or ""))
+        table = self._resolve_table(query_structure.get("tabla"))
+        if not shape or not table:
+            return None
+
+        filters = query_structure.get("filtros") or {}
+        if not isinstance(filters, dict):
+            return None
+
+        columns = self.schema_agent.get_schema_dict()[table]["columns"]
+        if self.value_index and any(isinstance(v, str) for v in filters.values()):
+            self.value_index.refresh([table])
+        conditions, params = [], []
+        for raw_column, value in filters.items():
+            column = self._resolve_column(columns, raw_column)
+            if self.value_index and isinstance(value, str):
+                column, value = self._resolve_literal(table, column, value)
+            if not column:
+                return None
+            condition = self._condition(column, columns[column].get("type"), value, params)
+            if condition is None:
+                return None
+            conditions.append(condition)
+
+        where = " WHERE " + " AND ".join(conditions) if conditions else ""
+        if shape == "count":
+            sql = f"SELECT COUNT(*) AS total FROM `{table}`{where};"
+        else:
+            sql = f"SELECT * FROM `{table}`{where} LIMIT {int(self.default_limit)};"
+        return {"sql": sql, "params": params}
+
+    def render(self, compiled):
+        """SQL con los parámetros escapados en línea, para mostrarlo o ejecutarlo sin parámetros."""
+        if not compiled["params"]:
+            return compiled["sql"]
+        return compiled["sql"] % tuple(escape_item(p, "utf8mb4") for p in compiled["params"])
+
+    def stats(self):
+        with self._lock:
+            total = self.metrics["fast_path"] + self.metrics["fallback"]
+            return {
+                **self.metrics,
+                "fast_path_ratio": self.metrics["fast_path"] / total if total else 0.0,
+            }
+
+    # --------------------------------------------
+    # Validación contra el esquema
+    # --------------------------------------------
+    def _resolve_table(self, name):
+        if not name or not isinstance(name, str):
+            return None
+        schema_dict = self.schema_agent.get_schema_dict()
+        if name in schema_dict:
+            return name
+        lowered = name.strip().strip("`").lower()
+        return next((t for t in schema_dict if t.lower() == lowered), None)
+
+    @staticmethod
+    def _resolve_column(columns, name):
+        if not isinstance(name, str):
+            return None
+        if name in columns:
+            return name
+        lowered = name.strip().strip("`").lower()
+        return next((c for c in columns if c.lower() == lowered), None)
+
+    def _resolve_literal(self, table, column, value):
+        """Retorna (columna, valor) corregidos con el índice de valores."""
+        found = self.value_index.columns_with_value(table, value)
+        if column in found:
+            return column, found[column]
+        # Columna desconocida, o indexada sin ese valor: si otra única columna lo tiene, usarla
+        if len(found) == 1 and (column is None or self.value_index.is_indexed(table, column)):
+            (new_column, new_value), = found.items()
+            with self._lock:
+                self.metrics["value_fixes"] += 1
+            return new_column, new_value
+        return column, value
+
+    @staticmethod
+    def _condition(column, column_type, value, params):
+        if value is None:
+            return f"`{column}` IS NULL"
+        if isinstance(value, SCALAR_TYPES):
+            if not _literal_fits(value, column_type):
+                return None
+            params.append(value)
+            return f"`{column}` = %s"
+        if isinstance(value, list):
+            if not value or not all(isinstance(v, SCALAR_TYPES) and _literal_fits(v, column_type) for v in value):
+                return None
+            params.extend(value)
+            return f"`{column}` IN ({', '.join(['%s'] * len(value))})"
+        if isinstance(value, dict) and len(value) == 1:
+            op, operand = next(iter(value.items()))
+            op = OPERATORS.get(str(op).strip().lower())
+            if op is None or not isinstance(operand, SCALAR_TYPES) or not _literal_fits(operand, column_type):
+                return None
+            params.append(operand)
+            return f"`{column}` {op} %s"
+        return None
+
+
+def _literal_fits(value, column_type):
+    """
+    True si `value` se puede comparar tal cual con una columna de `column_type`.
+    Un texto que describe una condición, o que no es un número o una fecha en
+    una columna de ese tipo, haría que MySQL lo convierta (ej. "> 30" a 0) y
+    devuelva filas equivocadas sin error.
+    """
+    if not isinstance(value, str):
+        return True
+    if CONDITION_SYMBOLS.search(value):
+        return False
+    if CONDITION_WORDS & set(re.findall(r"\w+", _normalize_word(value))):
+        return False
+    column_type = (column_type or "").lower()
+    if column_type in NUMERIC_TYPES:
+        return bool(NUMBER_TEXT.match(value.strip()))
+    if column_type in DATE_TYPES:
+        return bool(DATE_TEXT.match(value.strip()))
+    return True
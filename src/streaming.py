@@ -0,0 +1,150 @@
+import re
+
+
+def stream_chain(chain, inputs):
+    """
+    Trozos de texto de la respuesta del LLM de una cadena (LLMChain) a medida
+    que llegan, con el mismo prompt que usaría chain.run(**inputs).
+    Los callbacks del LLM (ej. el de tokens) se llaman igual que sin streaming.
+    """
+    prompt = chain.prompt.format(**inputs)
+    for chunk in chain.llm.stream(prompt):
+        # Los LLM de texto entregan str; los de chat, mensajes con .content
+        text = chunk if isinstance(chunk, str) else getattr(chunk, "content", "")
+        if text:
+            yield text
+
+
+# Inicio del valor de "sql" en la respuesta JSON del modo de una sola llamada
+_JSON_SQL_KEY = re.compile(r'"sql"\s*:\s*"')
+_JSON_ESCAPES = {'"': '"', "\\": "\\", "/": "/", "b": "\b", "f": "\f", "n": "\n", "r": "\r", "t": "\t"}
+
+
+class SQLStatementDetector:
+    """
+    Detecta, sobre texto que llega por trozos, el momento en que la primera
+    sentencia SQL está completa: el primer ';' fuera de textos entre comillas,
+    identificadores `...` y comentarios. Con ella se puede validar y ejecutar
+    la consulta sin esperar al resto de la respuesta del LLM.
+    Con json_key=True la sentencia se busca dentro del valor "sql" de una
+    respuesta JSON (modo de una sola llamada), que se decodifica al vuelo;
+    si ese texto se cierra sin ';', la sentencia es el texto completo.
+    """
+    def __init__(self, json_key=False):
+        self.json_key = json_key
+        self.statement = None
+
+        self._raw = ""         # Texto recibido tal cual
+        self._raw_pos = 0      # Posición ya decodificada de _raw (modo JSON)
+        self._in_value = False
+        self._sql = ""         # Texto SQL recibido (decodificado en modo JSON)
+        self._pos = 0          # Posición ya analizada de _sql
+        self._start = None     # Inicio de la sentencia en _sql (tras un ```sql opcional)
+        self._state = None     # None, "'", '"', "`", "--" o "/*"
+
+    def feed(self, text):
+        """Añade un trozo; retorna la sentencia (con ';') la primera vez que queda completa."""
+        if self.statement is not None:
+            return None
+        if self.json_key:
+            closed = self._feed_json(text)
+        else:
+            self._sql += text
+            closed = False
+        self._scan()
+        if self.statement is None and closed and self._start is not None:
+            # El valor JSON terminó sin ';': la sentencia es todo el valor
+            statement = self._sql[self._start:].strip()
+            if statement:
+                self.statement = statement.rstrip(";") + ";"
+        return self.statement
+
+    def _feed_json(self, text):
+        # Retorna True cuando se cerró el valor de "sql"
+        self._raw += text
+        if not self._in_value:
+            match = _JSON_SQL_KEY.search(self._raw)
+            if not match:
+                return False
+            self._in_value = True
+            self._raw_pos = match.end()
+        raw, i = self._raw, self._raw_pos
+        decoded = []
+        while i < len(raw):
+            char = raw[i]
+            if char == '"':
+                self._raw_pos = i + 1
+                self._sql += "".join(decoded)
+                return True
+            if char == "\\":
+                if i + 1 >= len(raw):
+                    break
+                escape = raw[i + 1]
+                if escape == "u":
+                    if i + 6 > len(raw):
+                        break
+                    decoded.append(chr(int(raw[i + 2:i + 6], 16)))
+                    i += 6
+                    continue
+                decoded.append(_JSON_ESCAPES.get(escape, escape))
+                i += 2
+                continue
+            decoded.append(char)
+            i += 1
+        self._raw_pos = i
+        self._sql += "".join(decoded)
+        return False
+
+    def _scan(self):
+        sql = self._sql
+        if self._start is None:
+            stripped = sql.lstrip()
+            if not stripped:
+                return
+            offset = len(sql) - len(stripped)
+            if stripped.startswith("`"):
+                # Posible bloque ```sql: la sentencia empieza en la línea siguiente
+                if len(stripped) < 3:
+                    return
+                if stripped.startswith("```"):
+                    newline = sql.find("\n", offset)
+                    if newline < 0:
+                        return
+                    offset = newline + 1
+            self._start = self._pos = offset
+
+        i = self._pos
+        while i < len(sql):
+            char = sql[i]
+            state = self._state
+            # Los símbolos de dos caracteres esperan al siguiente trozo
+            if char in "-/*\\" and i + 1 >= len(sql):
+                break
+            if state is None:
+                if char == ";":
+                    self.statement = sql[self._start:i + 1].strip()
+                    break
+                if char in "'\"`":
+                    self._state = char
+                elif char == "#" or (char == "-" and sql[i + 1] == "-"):
+                    self._state = "--"
+                elif char == "/" and sql[i + 1] == "*":
+                    self._state = "/*"
+                    i += 1
+            elif state in "'\"":
+                if char == "\\":
+                    i += 1
+                elif char == state:
+                    self._state = None
+            elif state == "`":
+                if char == "`":
+                    self._state = None
+            elif state == "--":
+                if char == "\n":
+                    self._state = None
+            elif state == "/*":
+                if char == "*" and sql[i + 1] == "/":
+                    self._state = None
+                    i += 1
+            i += 1
+        self._pos = i
@@ -0,0 +1,300 @@
+import re
+import time
+import logging
+import threading
+from collections import OrderedDict
+from llmcache import normalize_question
+from valueindex import normalize_value
+
+# Literales de la pregunta, en orden de prioridad (los primeros tapan a los siguientes)
+_QUOTED = re.compile(r"""["'«“]([^"'«»“”]{1,80})["'»”]""")
+_DATE_ISO = re.compile(r"(?<![\w-])(\d{4})-(\d{1,2})-(\d{1,2})(?![\w-])")
+_DATE_DMY = re.compile(r"(?<![\w/])(\d{1,2})/(\d{1,2})/(\d{4})(?![\w/])")
+_NUMBER = re.compile(r"(?<![\w.,])-?\d+(?:[.,]\d+)?(?![\w]|[.,]\d)")
+
+# Piezas del SQL que pueden convertirse en parámetros
+_SQL_TOKEN = re.compile(r"""
+    (?P<ident>`[^`]*`)
+  | (?P<string>'(?:[^'\\]|\\.|'')*'|"(?:[^"\\]|\\.|"")*")
+  | (?P<placeholder>%s)
+  | (?P<percent>%%|%)
+  | (?P<number>(?<![\w.])-?\d+(?:\.\d+)?(?![\w.]))
+""", re.X)
+
+# Tipos de literal que pueden ir dentro de un texto más largo (ej. LIKE '%Lima%')
+_WRAPPABLE = ("texto", "valor", "fecha")
+
+
+class QueryTemplateCache:
+    """
+    Caché de plantillas para preguntas casi iguales: "usuarios mayores de 30" y
+    "usuarios mayores de 45" comparten plantilla. La pregunta se normaliza
+    sustituyendo sus literales (textos entre comillas, fechas, números y valores
+    conocidos del ValueIndex) por su tipo, y el SQL generado se guarda con un
+    parámetro en el lugar de cada literal. Otra pregunta con la misma forma
+    reutiliza el SQL con sus propios valores, sin llamar al LLM.
+    Solo se guardan plantillas en las que cada literal aparece exactamente una
+    vez en el SQL, y cada una queda ligada a la huella del esquema con el que se generó.
+    """
+    def __init__(self, schema_agent, value_index=None, max_entries=512):
+        """
+        :param schema_agent: Instancia de DatabaseSchemaAgent
+        :param value_index: ValueIndex opcional para reconocer valores conocidos ("Lima")
+        :param max_entries: Plantillas guardadas como máximo (LRU)
+        """
+        self.schema_agent = schema_agent
+        self.value_index = value_index
+        self.max_entries = max_entries
+
+        self._entries = OrderedDict()  # forma de la pregunta -> plantilla
+        self._schema_fingerprint = None
+        self._lock = threading.Lock()
+        self.metrics = {"hits": 0, "misses": 0, "stored": 0, "unbound": 0, "invalidated": 0}
+        self.logger = logging.getLogger("QueryTemplateCache")
+
+    # --------------------------------------------
+    # Búsqueda y registro
+    # --------------------------------------------
+    def lookup(self, question):
+        """
+        Retorna {"shape", "literals", "sql", "params"}. "sql" es None si no hay
+        plantilla para la forma de la pregunta; el resultado se pasa luego a store().
+        """
+        shape, literals = self.extract(question)
+        match = {"shape": shape, "literals": literals, "sql": None, "params": None}
+        if not literals:
+            return match
+
+        fingerprint = self._current_fingerprint()
+        with self._lock:
+            self._check_schema(fingerprint)
+            entry = self._entries.get(shape)
+            if entry is None or entry["fingerprint"] != fingerprint:
+                self.metrics["misses"] += 1
+                return match
+            self._entries.move_to_end(shape)
+            entry["hits"] += 1
+            self.metrics["hits"] += 1
+        match["sql"] = entry["sql"]
+        match["params"] = [self._bind(spec, literals) for spec in entry["params"]]
+        return match
+
+    def store(self, match, sql, params=None):
+        """
+        Guarda el SQL generado para la pregunta de `match` como plantilla.
+        Retorna False si algún literal no se pudo ubicar sin ambigüedad en el SQL.
+        """
+        if not match["literals"] or match["sql"] is not None:
+            return False
+        template = self.templatize(sql, params, match["literals"])
+        if template is None:
+            with self._lock:
+                self.metrics["unbound"] += 1
+            return False
+
+        fingerprint = self._current_fingerprint()
+        with self._lock:
+            self._check_schema(fingerprint)
+            self._entries[match["shape"]] = {
+                **template,
+                "fingerprint": fingerprint,
+                "hits": 0,
+                "created": time.time(),
+            }
+            self._entries.move_to_end(match["shape"])
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+            self.metrics["stored"] += 1
+        return True
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            total = self.metrics["hits"] + self.metrics["misses"]
+            return {
+                **self.metrics,
+                "entries": len(self._entries),
+                "hit_ratio": self.metrics["hits"] / total if total else 0.0,
+            }
+
+    # --------------------------------------------
+    # Literales de la pregunta
+    # --------------------------------------------
+    def extract(self, question):
+        """
+        Retorna (forma, literales): la pregunta normalizada con cada literal
+        sustituido por <tipo>, y la lista [{"kind", "value"}] en orden de aparición.
+        """
+        text = re.sub(r"\s+", " ", str(question)).strip()
+        spans = []
+
+        def add(start, end, kind, value):
+            if any(start < s_end and s_start < end for s_start, s_end, _, _ in spans):
+                return
+            spans.append((start, end, kind, value))
+
+        for m in _QUOTED.finditer(text):
+            add(m.start(), m.end(), "texto", m.group(1))
+        for m in _DATE_ISO.finditer(text):
+            add(m.start(), m.end(), "fecha", f"{int(m.group(1)):04d}-{int(m.group(2)):02d}-{int(m.group(3)):02d}")
+        for m in _DATE_DMY.finditer(text):
+            add(m.start(), m.end(), "fecha", f"{int(m.group(3)):04d}-{int(m.group(2)):02d}-{int(m.group(1)):02d}")
+        for m in _NUMBER.finditer(text):
+            raw = m.group(0).replace(",", ".")
+            add(m.start(), m.end(), "numero", float(raw) if "." in raw else int(raw))
+
+        if self.value_index is not None:
+            # Los literales ya encontrados no se vuelven a buscar en el índice
+            masked = list(text)
+            for start, end, _, _ in spans:
+                masked[start:end] = " " * (end - start)
+            masked = "".join(masked)
+            # Sin refresh: solo los valores ya indexados, para no recorrer todas las tablas
+            for hint in self.value_index.resolve(masked, refresh=False):
+                exact = [c for c in hint["candidates"] if c["match"] == "exact"]
+                if not exact:
+                    continue
+                words = [re.escape(w) for w in hint["literal"].split()]
+                found = re.search(r"(?<!\w)" + r"\s+".join(words) + r"(?!\w)", masked, re.I)
+                if found:
+                    # El tipo es la columna (no la tabla): "Lima" y "Cusco" son ambos una ciudad
+                    columns = sorted({c["column"] for c in exact})
+                    add(found.start(), found.end(), "valor:" + ",".join(columns), exact[0]["value"])
+
+        spans.sort()
+        parts, literals, position = [], [], 0
+        for start, end, kind, value in spans:
+            parts.append(text[position:start])
+            parts.append(f"<{kind}>")
+            literals.append({"kind": kind, "value": value})
+            position = end
+        parts.append(text[position:])
+        return normalize_question("".join(parts)), literals
+
+    # --------------------------------------------
+    # SQL con parámetros en lugar de literales
+    # --------------------------------------------
+    def templatize(self, sql, params, literals):
+        """
+        Retorna {"sql", "params"} con un %s en el lugar de cada literal de la
+        pregunta ("params" describe cada parámetro: {"slot", "prefix", "suffix"}
+        o {"value"} si es fijo), o None si algún literal no aparece exactamente una vez.
+        """
+        pending = list(params or [])
+        parameterized = params is not None
+        out, specs, bound = [], [], [0] * len(literals)
+        position = 0
+        for m in _SQL_TOKEN.finditer(sql):
+            out.append(self._escape(sql[position:m.start()], parameterized))
+            position = m.end()
+            token, kind = m.group(0), m.lastgroup
+
+            if kind == "placeholder" and parameterized:
+                if not pending:
+                    return None
+                value = pending.pop(0)
+                spec = self._match(value, literals)
+                if spec is None:
+                    return None
+                specs.append(spec or {"value": value})
+                out.append("%s")
+            elif kind == "placeholder" or kind == "percent":
+                out.append(token if parameterized else token.replace("%", "%%"))
+                continue
+            elif kind in ("string", "number"):
+                value = _unquote(token) if kind == "string" else token
+                spec = self._match(value, literals, number=kind == "number")
+                if spec is None:
+                    return None
+                if not spec:
+                    out.append(self._escape(token, parameterized))
+                    continue
+                specs.append(spec)
+                out.append("%s")
+            else:
+                out.append(self._escape(token, parameterized))
+                continue
+
+            if "slot" in specs[-1]:
+                bound[specs[-1]["slot"]] += 1
+        out.append(self._escape(sql[position:], parameterized))
+
+        if pending or any(count != 1 for count in bound):
+            return None
+        return {"sql": "".join(out), "params": specs}
+
+    @staticmethod
+    def _match(value, literals, number=False):
+        """
+        Busca el literal de la pregunta que corresponde a un valor del SQL.
+        Retorna el parámetro ({"slot", ...}), {} si no corresponde a ninguno
+        o None si corresponde a más de uno (ambiguo).
+        """
+        candidates = []
+        if number or (isinstance(value, (int, float)) and not isinstance(value, bool)):
+            try:
+                numeric = float(value)
+            except (TypeError, ValueError):
+                return {}
+            for i, literal in enumerate(literals):
+                if literal["kind"] == "numero" and float(literal["value"]) == numeric:
+                    candidates.append({"slot": i})
+        elif isinstance(value, str):
+            key = normalize_value(value)
+            lowered = value.lower()
+            for i, literal in enumerate(literals):
+                target = normalize_value(literal["value"])
+                if key == target:
+                    candidates.append({"slot": i})
+                elif literal["kind"].split(":")[0] in _WRAPPABLE and target and target in key:
+                    start = lowered.find(str(literal["value"]).lower())
+                    if start < 0:
+                        return None
+                    end = start + len(str(literal["value"]))
+                    candidates.append({"slot": i, "prefix": value[:start], "suffix": value[end:]})
+        if len(candidates) > 1:
+            return None
+        return candidates[0] if candidates else {}
+
+    @staticmethod
+    def _bind(spec, literals):
+        if "value" in spec:
+            return spec["value"]
+        value = literals[spec["slot"]]["value"]
+        if "prefix" in spec:
+            return f"{spec['prefix']}{value}{spec['suffix']}"
+        return value
+
+    @staticmethod
+    def _escape(text, parameterized):
+        # Con parámetros, un % suelto del SQL original se tiene que escribir %%
+        return text if parameterized else text.replace("%", "%%")
+
+    # --------------------------------------------
+    # Validez frente al esquema
+    # --------------------------------------------
+    def _current_fingerprint(self):
+        self.schema_agent.get_schema_dict()
+        return getattr(self.schema_agent, "schema_fingerprint", None)
+
+    def _check_schema(self, fingerprint):
+        # Se llama con el lock tomado: un cambio de esquema invalida las plantillas anteriores
+        previous = self._schema_fingerprint
+        if fingerprint is None or fingerprint == previous:
+            return
+        self._schema_fingerprint = fingerprint
+        stale = [shape for shape, entry in self._entries.items() if entry["fingerprint"] != fingerprint]
+        for shape in stale:
+            del self._entries[shape]
+        if stale:
+            self.metrics["invalidated"] += len(stale)
+            self.logger.info(f"El esquema cambió: se descartan {len(stale)} plantillas.")
+
+
+def _unquote(token):
+    quote, body = token[0], token[1:-1]
+    body = body.replace(quote * 2, quote)
+    return re.sub(r"\\(.)", r"\1", body)
@@ -1,19 +1,25 @@
+import os
 import json
 import pymysql
+from dotenv import load_dotenv
 from conection import DatabaseSchemaAgent  # Asegúrate de que el archivo se llame así
 
+load_dotenv()
+
 # Función para obtener la conexión a la base de datos con pymysql
+# (mismas variables de entorno que SQLBot: DB_HOST, DB_PORT, DB_USER, DB_PASSWORD, DB_NAME)
 def get_connection():
     return pymysql.connect(
-        host="10.23.63.53",      # Cambia por tu host
-        user="root",           # Cambia por tu usuario
-        password="rootpassword",   # Cambia por tu contraseña
-        database="dev",  # Cambia por tu base de datos
-        cursorclass=pymysql.cursors.DictCursor  # Para obtener resultados en formato diccionario
+        host=os.getenv("DB_HOST", "localhost"),
+        port=int(os.getenv("DB_PORT", "3306")),
+        user=os.getenv("DB_USER"),
+        password=os.getenv("DB_PASSWORD"),
+        database=os.getenv("DB_NAME"),
+        cursorclass=pymysql.cursors.Cursor  # DatabaseSchemaAgent lee las filas como tuplas
     )
 
 def main():
-    db_name = "dev"  # Cambia por el nombre de tu BD
+    db_name = os.getenv("DB_NAME")
     agent = DatabaseSchemaAgent(get_connection, db_name)
     
     print("\n📌 **Esquema en Texto**:")
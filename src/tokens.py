@@ -0,0 +1,11 @@
+import math
+
+# Aproximación habitual para modelos de OpenAI: ~4 caracteres por token
+CHARS_PER_TOKEN = 4
+
+
+def estimate_tokens(text):
+    """Estimación rápida del número de tokens de un texto (sin tokenizador)."""
+    if not text:
+        return 0
+    return math.ceil(len(text) / CHARS_PER_TOKEN)
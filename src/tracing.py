@@ -0,0 +1,251 @@
+import json
+import time
+import math
+import logging
+import threading
+import contextvars
+from collections import deque
+from contextlib import contextmanager
+from langchain_core.callbacks import BaseCallbackHandler
+from tokens import estimate_tokens
+
+# Span activo en el contexto actual (hilo o tarea asyncio)
+_current_span = contextvars.ContextVar("sqlbot_current_span", default=None)
+
+# Atributos numéricos que se acumulan como contadores por etapa
+COUNTERS = ("prompt_tokens", "completion_tokens", "rows", "bytes")
+QUANTILES = (0.5, 0.95, 0.99)
+
+
+class Span:
+    """
+    Una etapa medida del pipeline: nombre, duración y atributos
+    (tokens, filas, bytes, aciertos de caché...). Los spans hijos se
+    anidan dentro del span activo cuando se crean.
+    """
+    __slots__ = ("tracer", "name", "attrs", "children", "start", "duration")
+
+    def __init__(self, tracer, name, attrs=None):
+        self.tracer = tracer
+        self.name = name
+        self.attrs = dict(attrs or {})
+        self.children = []
+        self.start = time.perf_counter()
+        self.duration = None
+
+    def set(self, **attrs):
+        self.attrs.update(attrs)
+
+    def add(self, **values):
+        """Suma valores numéricos a los atributos (ej. varias llamadas al LLM en una etapa)."""
+        for key, value in values.items():
+            self.attrs[key] = self.attrs.get(key, 0) + value
+
+    def to_dict(self):
+        return {
+            "name": self.name,
+            "duration": self.duration,
+            **({"attrs": self.attrs} if self.attrs else {}),
+            **({"children": [c.to_dict() for c in self.children]} if self.children else {}),
+        }
+
+
+def current_span():
+    return _current_span.get()
+
+
+def annotate(**attrs):
+    """Añade atributos al span activo (no hace nada fuera de una traza)."""
+    active = _current_span.get()
+    if active is not None:
+        active.set(**attrs)
+
+
+def accumulate(**values):
+    """Suma valores al span activo (no hace nada fuera de una traza)."""
+    active = _current_span.get()
+    if active is not None:
+        active.add(**values)
+
+
+@contextmanager
+def span(name, **attrs):
+    """
+    Span hijo del span activo, registrado en el mismo Tracer.
+    Fuera de una traza no mide nada, así que se puede usar en código de bajo nivel.
+    """
+    parent = _current_span.get()
+    if parent is None:
+        yield None
+        return
+    with parent.tracer.span(name, **attrs) as child:
+        yield child
+
+
+class Tracer:
+    """
+    Recoge los spans del pipeline y mantiene, por etapa:
+    - una ventana móvil con las últimas `window` duraciones (para p50/p95/p99),
+    - contadores acumulados de duración, tokens, filas, bytes y aciertos/fallos de caché.
+    Exporta en formato de texto de Prometheus y en JSON.
+    """
+    def __init__(self, window=1000, recent=50, prefix="sqlbot"):
+        """
+        :param window: Duraciones que se guardan por etapa para calcular percentiles
+        :param recent: Trazas completas recientes que se conservan
+        :param prefix: Prefijo de las métricas de Prometheus
+        """
+        self.window = window
+        self.prefix = prefix
+        self._stages = {}  # etapa -> {"durations": deque, "count", "sum", contadores...}
+        self._recent = deque(maxlen=recent)
+        self._lock = threading.Lock()
+        self.logger = logging.getLogger("Tracer")
+
+    @contextmanager
+    def span(self, name, **attrs):
+        """Mide un bloque como etapa `name`; si no hay span activo, inicia una traza nueva."""
+        parent = _current_span.get()
+        current = Span(self, name, attrs)
+        if parent is not None:
+            parent.children.append(current)
+        token = _current_span.set(current)
+        try:
+            yield current
+        except Exception as e:
+            current.set(error=type(e).__name__)
+            raise
+        finally:
+            _current_span.reset(token)
+            current.duration = time.perf_counter() - current.start
+            self._record(current)
+            if parent is None:
+                trace = current.to_dict()
+                with self._lock:
+                    self._recent.append(trace)
+                if self.logger.isEnabledFor(logging.DEBUG):
+                    self.logger.debug(json.dumps(trace, default=str))
+
+    def record(self, name, seconds, **attrs):
+        """
+        Registra como etapa `name` una latencia medida fuera de un bloque
+        (ej. tiempo hasta la primera salida visible), dentro de la traza activa si la hay.
+        """
+        current = Span(self, name, attrs)
+        current.duration = seconds
+        parent = _current_span.get()
+        if parent is not None:
+            parent.children.append(current)
+        self._record(current)
+
+    def recent_traces(self):
+        with self._lock:
+            return list(self._recent)
+
+    def reset(self):
+        with self._lock:
+            self._stages.clear()
+            self._recent.clear()
+
+    # --------------------------------------------
+    # Agregación
+    # --------------------------------------------
+    def _record(self, current):
+        with self._lock:
+            stage = self._stages.get(current.name)
+            if stage is None:
+                stage = self._stages[current.name] = {
+                    "durations": deque(maxlen=self.window), "count": 0, "sum": 0.0,
+                    "cache_hits": 0, "cache_misses": 0, "errors": 0,
+                    **{key: 0 for key in COUNTERS},
+                }
+            stage["durations"].append(current.duration)
+            stage["count"] += 1
+            stage["sum"] += current.duration
+            for key in COUNTERS:
+                value = current.attrs.get(key)
+                if isinstance(value, (int, float)):
+                    stage[key] += value
+            if "cache_hit" in current.attrs:
+                stage["cache_hits" if current.attrs["cache_hit"] else "cache_misses"] += 1
+            if "error" in current.attrs:
+                stage["errors"] += 1
+
+    def snapshot(self):
+        """
+        Retorna {etapa: {"count", "p50", "p95", "p99", "mean", "max", contadores...}};
+        los percentiles salen de la ventana móvil y los contadores son acumulados.
+        """
+        with self._lock:
+            stages = {name: (sorted(s["durations"]), dict(s)) for name, s in self._stages.items()}
+        result = {}
+        for name, (durations, stage) in stages.items():
+            stage.pop("durations")
+            result[name] = {
+                **stage,
+                **{f"p{int(q * 100)}": _quantile(durations, q) for q in QUANTILES},
+                "mean": sum(durations) / len(durations) if durations else 0.0,
+                "max": durations[-1] if durations else 0.0,
+                "window": len(durations),
+            }
+        return result
+
+    def export_json(self):
+        return json.dumps(self.snapshot(), indent=2)
+
+    def export_prometheus(self):
+        """Métricas en formato de texto de Prometheus (un summary por etapa más contadores)."""
+        snapshot = self.snapshot()
+        name = f"{self.prefix}_stage_duration_seconds"
+        lines = [
+            f"# HELP {name} Duración de cada etapa del pipeline (cuantiles sobre una ventana móvil).",
+            f"# TYPE {name} summary",
+        ]
+        for stage, data in snapshot.items():
+            for q in QUANTILES:
+                lines.append(f'{name}{{stage="{stage}",quantile="{q}"}} {data[f"p{int(q * 100)}"]:.6f}')
+            lines.append(f'{name}_sum{{stage="{stage}"}} {data["sum"]:.6f}')
+            lines.append(f'{name}_count{{stage="{stage}"}} {data["count"]}')
+
+        for key in COUNTERS + ("cache_hits", "cache_misses", "errors"):
+            metric = f"{self.prefix}_stage_{key}_total"
+            lines.append(f"# TYPE {metric} counter")
+            for stage, data in snapshot.items():
+                lines.append(f'{metric}{{stage="{stage}"}} {data[key]}')
+        return "\n".join(lines) + "\n"
+
+
+def _quantile(sorted_values, q):
+    if not sorted_values:
+        return 0.0
+    index = max(0, math.ceil(q * len(sorted_values)) - 1)
+    return sorted_values[index]
+
+
+class TokenUsageHandler(BaseCallbackHandler):
+    """
+    Callback de LangChain que suma los tokens de cada llamada al LLM en el span activo.
+    Usa el `token_usage` que reporta el proveedor y, si no hay, una estimación por caracteres.
+    """
+    def on_llm_start(self, serialized, prompts, **kwargs):
+        active = _current_span.get()
+        if active is not None:
+            active.add(llm_calls=1, estimated_prompt_tokens=sum(estimate_tokens(p) for p in prompts))
+
+    def on_llm_end(self, response, **kwargs):
+        active = _current_span.get()
+        if active is None:
+            return
+        usage = (response.llm_output or {}).get("token_usage") or {}
+        if usage:
+            active.add(
+                prompt_tokens=usage.get("prompt_tokens", 0),
+                completion_tokens=usage.get("completion_tokens", 0)
+            )
+            active.attrs.pop("estimated_prompt_tokens", None)
+            return
+        completion = sum(estimate_tokens(g.text) for gens in response.generations for g in gens)
+        active.add(
+            prompt_tokens=active.attrs.pop("estimated_prompt_tokens", 0),
+            completion_tokens=completion
+        )
@@ -0,0 +1,425 @@
+import os
+import re
+import json
+import time
+import bisect
+import sqlite3
+import difflib
+import logging
+import threading
+import unicodedata
+from concurrent.futures import ThreadPoolExecutor
+
+# Tipos de columna cuyos valores se indexan
+TEXT_TYPES = {"varchar", "char", "enum", "set", "tinytext"}
+
+# Palabras de la pregunta que nunca son literales de filtro
+STOPWORDS = {
+    "de", "del", "la", "las", "el", "los", "en", "y", "o", "a", "al", "con", "por", "para", "que",
+    "cuantos", "cuantas", "cuanto", "hay", "lista", "listar", "muestra", "mostrar", "dame", "todos",
+    "todas", "registros", "un", "una", "unos", "unas", "es", "son", "se", "sus", "su", "mas", "menos",
+}
+
+
+def normalize_value(text):
+    """Minúsculas, sin tildes y con espacios simples (clave del índice)."""
+    text = unicodedata.normalize("NFKD", str(text)).encode("ascii", "ignore").decode("ascii")
+    return re.sub(r"\s+", " ", text).strip().lower()
+
+
+class ValueIndex:
+    """
+    Índice invertido local de los valores distintos de las columnas de texto de
+    baja cardinalidad (ciudades, estados, categorías...). Permite resolver los
+    literales de una pregunta ("clientes de Arequipa") a pares `tabla.columna`
+    antes de llamar al LLM, con búsqueda exacta, por prefijo y aproximada.
+    Se construye por tabla (una consulta por tabla). Una tabla sin índice se lee
+    al momento; si cambia su DDL, o sus datos (UPDATE_TIME) y pasó
+    `refresh_interval` desde la última lectura, se reconstruye en segundo plano
+    mientras se sigue sirviendo el índice actual.
+    """
+    def __init__(self, schema_agent, get_connection, path=None, max_distinct=200,
+                 max_value_length=64, max_table_rows=5_000_000, max_workers=4, refresh_interval=300,
+                 db_key=None):
+        """
+        :param schema_agent: Instancia de DatabaseSchemaAgent
+        :param get_connection: Función que retorna una conexión a la BD
+        :param path: Ruta del archivo SQLite donde persistir el índice (None = solo memoria)
+        :param max_distinct: Columnas con más valores distintos no se indexan
+        :param max_value_length: Valores más largos no se indexan
+        :param max_table_rows: Tablas con más filas estimadas no se recorren
+        :param max_workers: Tablas que se indexan a la vez
+        :param refresh_interval: Segundos mínimos entre relecturas de una tabla cuyos datos cambiaron
+        :param db_key: Identidad de la BD en el archivo compartido (servidor + BD; por defecto, el nombre de la BD)
+        """
+        self.schema_agent = schema_agent
+        self.get_connection = get_connection
+        self.path = path
+        self.max_distinct = max_distinct
+        self.max_value_length = max_value_length
+        self.max_table_rows = max_table_rows
+        self.max_workers = max_workers
+        self.refresh_interval = refresh_interval
+        self.db_key = db_key
+
+        self._tables = {}  # tabla -> (huella, {columna: [valores]})
+        self._data_versions = {}  # tabla -> (UPDATE_TIME leído, instante de la lectura)
+        self._pending = set()  # tablas a reconstruir en segundo plano
+        self._worker = None
+        self._postings = {}  # valor normalizado -> [(tabla, columna, valor original)]
+        self._keys = []  # claves ordenadas para la búsqueda por prefijo
+        self._by_initial = {}  # (primera letra, longitud) -> claves (candidatas de la búsqueda aproximada)
+        self._dirty = False
+        self._lock = threading.RLock()
+        self._db = None
+        self._terms = (None, frozenset())  # (versión del esquema, nombres de tablas y columnas)
+        self.metrics = {"built": 0, "disk_hits": 0, "lookups": 0, "resolved": 0, "background_refreshes": 0}
+        self.logger = logging.getLogger("ValueIndex")
+
+        if path:
+            directory = os.path.dirname(path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self._db = sqlite3.connect(path, check_same_thread=False)
+            columns = {row[1] for row in self._db.execute("PRAGMA table_info(value_index)")}
+            if columns and "db_key" not in columns:
+                # Formato anterior, indexado solo por nombre de BD: se descarta
+                self._db.execute("DROP TABLE value_index")
+            self._db.execute("""
+                CREATE TABLE IF NOT EXISTS value_index (
+                    db_key TEXT NOT NULL,
+                    table_name TEXT NOT NULL,
+                    fingerprint TEXT NOT NULL,
+                    update_time TEXT,
+                    columns TEXT NOT NULL,
+                    created REAL NOT NULL,
+                    PRIMARY KEY (db_key, table_name)
+                )
+            """)
+            self._db.commit()
+
+    # --------------------------------------------
+    # Construcción
+    # --------------------------------------------
+    def refresh(self, tables=None):
+        """
+        Pone al día el índice de las tablas indicadas (todas por defecto). Solo
+        se leen al momento las tablas sin índice; las que cambiaron se
+        reconstruyen en segundo plano (ver la clase).
+        """
+        schema_dict = self.schema_agent.get_schema_dict()
+        names = [t for t in (tables if tables is not None else schema_dict) if t in schema_dict]
+        fingerprints = {t: self._fingerprint(t) for t in names}
+        update_times = self._update_times(names)
+        now = time.time()
+
+        missing, stale = [], []
+        with self._lock:
+            for table in list(self._tables):
+                if table not in schema_dict:
+                    del self._tables[table]
+                    self._data_versions.pop(table, None)
+                    self._dirty = True
+            for table in names:
+                cached = self._tables.get(table)
+                if cached is None:
+                    stored = self._load(table, fingerprints[table])
+                    if stored is None:
+                        missing.append(table)
+                        continue
+                    columns, update_time, created = stored
+                    self._tables[table] = (fingerprints[table], columns)
+                    self._data_versions[table] = (update_time, created)
+                    self._dirty = True
+                    cached = self._tables[table]
+                if cached[0] != fingerprints[table]:
+                    stale.append(table)
+                    continue
+                update_time, read_at = self._data_versions.get(table, (None, now))
+                if update_time != update_times[table] and now - read_at >= self.refresh_interval:
+                    stale.append(table)
+
+        if missing:
+            self._build(missing, schema_dict)
+        if stale:
+            self._schedule(stale)
+
+        with self._lock:
+            if self._dirty:
+                self._rebuild_postings()
+
+    def wait(self, timeout=None):
+        """Espera a que termine la reconstrucción en segundo plano (si hay una)."""
+        worker = self._worker
+        if worker is not None:
+            worker.join(timeout)
+
+    def _build(self, names, schema_dict):
+        # Lee las tablas en paralelo y las reemplaza en el índice al terminar
+        fingerprints = {t: self._fingerprint(t) for t in names}
+        update_times = self._update_times(names)
+        workers = max(1, min(self.max_workers, len(names)))
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="valueindex") as executor:
+            built = list(executor.map(lambda t: self._index_table(t, schema_dict[t]), names))
+        now = time.time()
+        with self._lock:
+            for table, columns in zip(names, built):
+                if columns is None:
+                    continue
+                self._tables[table] = (fingerprints[table], columns)
+                self._data_versions[table] = (update_times[table], now)
+                self._store(table, fingerprints[table], update_times[table], columns, now)
+                self._dirty = True
+
+    def _schedule(self, tables):
+        # Un solo hilo de reconstrucción; las tablas que llegan mientras trabaja se suman a la cola
+        with self._lock:
+            self._pending.update(tables)
+            if self._worker is not None:
+                return
+            self._worker = threading.Thread(target=self._run_pending, name="valueindex-refresh", daemon=True)
+            self._worker.start()
+
+    def _run_pending(self):
+        while True:
+            with self._lock:
+                tables = sorted(self._pending)
+                self._pending.clear()
+                if not tables:
+                    self._worker = None
+                    return
+            try:
+                schema_dict = self.schema_agent.get_schema_dict()
+                self._build([t for t in tables if t in schema_dict], schema_dict)
+                with self._lock:
+                    self.metrics["background_refreshes"] += 1
+                    if self._dirty:
+                        self._rebuild_postings()
+            except Exception as e:
+                self.logger.error(f"No se pudo reconstruir el índice de valores: {e}")
+
+    def _index_table(self, table, details):
+        """Lee los valores distintos de las columnas candidatas en una sola consulta."""
+        candidates = [
+            col for col, info in details["columns"].items()
+            if str(info["type"]).lower() in TEXT_TYPES and info["key"] != "PRI"
+        ]
+        if not candidates or int(details.get("row_estimate") or 0) > self.max_table_rows:
+            return {}
+
+        # Un DISTINCT acotado por columna, unidos: basta con max_distinct + 1 para descartar las de alta cardinalidad
+        parts = [
+            f"SELECT %s, v FROM (SELECT DISTINCT `{col}` AS v FROM `{table}` "
+            f"WHERE `{col}` IS NOT NULL LIMIT {int(self.max_distinct) + 1}) AS d{i}"
+            for i, col in enumerate(candidates)
+        ]
+        conn = None
+        try:
+            conn = self.get_connection()
+            cursor = conn.cursor()
+            try:
+                cursor.execute(" UNION ALL ".join(parts), tuple(candidates))
+                rows = cursor.fetchall()
+            finally:
+                cursor.close()
+        except Exception as e:
+            self.logger.error(f"No se pudieron indexar los valores de {table}: {e}")
+            return None
+        finally:
+            if conn:
+                conn.close()
+
+        values = {}
+        for column, value in rows:
+            values.setdefault(column, []).append(str(value))
+        with self._lock:
+            self.metrics["built"] += 1
+        return {
+            col: [v for v in vals if len(v) <= self.max_value_length]
+            for col, vals in values.items()
+            if len(vals) <= self.max_distinct
+        }
+
+    def _rebuild_postings(self):
+        # Se llama con el lock tomado
+        postings = {}
+        for table, (_, columns) in self._tables.items():
+            for column, values in columns.items():
+                for value in values:
+                    key = normalize_value(value)
+                    if key:
+                        postings.setdefault(key, []).append((table, column, value))
+        self._postings = postings
+        self._keys = sorted(postings)
+        self._by_initial = {}
+        for key in self._keys:
+            self._by_initial.setdefault((key[0], len(key)), []).append(key)
+        self._dirty = False
+
+    # --------------------------------------------
+    # Búsqueda
+    # --------------------------------------------
+    def lookup(self, term, tables=None, fuzzy_cutoff=0.85, limit=10):
+        """
+        Retorna [{"table", "column", "value", "match", "score"}] para un literal:
+        primero coincidencias exactas, luego por prefijo y por último aproximadas.
+        """
+        key = normalize_value(term)
+        if not key:
+            return []
+        allowed = set(tables) if tables is not None else None
+        with self._lock:
+            self.metrics["lookups"] += 1
+            matches = [(key, "exact", 1.0)]
+            if len(key) >= 3:
+                start = bisect.bisect_left(self._keys, key)
+                for candidate in self._keys[start:start + limit * 4]:
+                    if not candidate.startswith(key):
+                        break
+                    if candidate != key:
+                        matches.append((candidate, "prefix", len(key) / len(candidate)))
+            if len(key) >= 4:
+                pool = [
+                    k for size in range(len(key) - 2, len(key) + 3)
+                    for k in self._by_initial.get((key[0], size), ())
+                ]
+                for candidate in difflib.get_close_matches(key, pool, n=limit, cutoff=fuzzy_cutoff):
+                    if candidate != key:
+                        matches.append((candidate, "fuzzy", difflib.SequenceMatcher(None, key, candidate).ratio()))
+
+            results, seen = [], set()
+            for candidate, kind, score in matches:
+                for table, column, value in self._postings.get(candidate, []):
+                    if allowed is not None and table not in allowed:
+                        continue
+                    if (table, column, value) in seen:
+                        continue
+                    seen.add((table, column, value))
+                    results.append({"table": table, "column": column, "value": value, "match": kind, "score": round(score, 3)})
+        results.sort(key=lambda r: -r["score"])
+        return results[:limit]
+
+    def resolve(self, question, tables=None, limit=5, refresh=True):
+        """
+        Busca en la pregunta literales que aparecen en el índice (n-gramas de
+        hasta 3 palabras, los más largos primero) y retorna una pista por literal:
+        [{"literal", "candidates": [{"table", "column", "value", "match"}]}].
+        Con `tables`, solo se consideran esas tablas; con `refresh=False` se usa
+        el índice tal como está, sin leer tablas nuevas.
+        """
+        if refresh:
+            self.refresh(tables)
+        words = re.findall(r"[\w'-]+", question, re.UNICODE)
+        schema_terms = self._schema_terms()
+        hints, used = [], set()
+        for size in (3, 2, 1):
+            for start in range(len(words) - size + 1):
+                span = range(start, start + size)
+                if used.intersection(span):
+                    continue
+                literal = " ".join(words[start:start + size])
+                key = normalize_value(literal)
+                if size == 1 and (key in STOPWORDS or key in schema_terms or key.isdigit() or len(key) < 3):
+                    continue
+                candidates = self.lookup(literal, tables=tables, limit=limit)
+                # Para frases de varias palabras solo valen coincidencias exactas
+                if size > 1:
+                    candidates = [c for c in candidates if c["match"] == "exact"]
+                if not candidates:
+                    continue
+                used.update(span)
+                best = candidates[0]["match"]
+                hints.append({
+                    "literal": literal,
+                    "candidates": [
+                        {k: c[k] for k in ("table", "column", "value", "match")}
+                        for c in candidates if c["match"] == best
+                    ][:limit]
+                })
+        if hints:
+            with self._lock:
+                self.metrics["resolved"] += 1
+        return hints
+
+    def format_hints(self, hints, max_candidates=3):
+        """Texto de las pistas para el prompt."""
+        lines = []
+        for hint in hints:
+            places = ", ".join(
+                f"{c['table']}.{c['column']} = '{c['value']}'" for c in hint["candidates"][:max_candidates]
+            )
+            extra = len(hint["candidates"]) - max_candidates
+            if extra > 0:
+                places += f" (+{extra} más)"
+            lines.append(f"- \"{hint['literal']}\" -> {places}")
+        return "\n".join(lines)
+
+    def columns_with_value(self, table, value):
+        """Columnas de `table` que contienen `value` (sin distinguir mayúsculas ni tildes) -> {columna: valor original}."""
+        key = normalize_value(value)
+        with self._lock:
+            return {c: v for t, c, v in self._postings.get(key, []) if t == table}
+
+    def is_indexed(self, table, column):
+        with self._lock:
+            cached = self._tables.get(table)
+            return cached is not None and column in cached[1]
+
+    def stats(self):
+        with self._lock:
+            return {**self.metrics, "tables": len(self._tables), "values": len(self._keys)}
+
+    def _schema_terms(self):
+        # Nombres de tablas y columnas: no son literales de filtro (memoizados por versión)
+        schema_dict = self.schema_agent.get_schema_dict()
+        version = getattr(self.schema_agent, "schema_version", None)
+        if self._terms[0] == version and version is not None:
+            return self._terms[1]
+        terms = set()
+        for table, details in schema_dict.items():
+            terms.add(normalize_value(table))
+            terms.update(normalize_value(c) for c in details["columns"])
+        self._terms = (version, frozenset(terms))
+        return self._terms[1]
+
+    # --------------------------------------------
+    # Almacenamiento
+    # --------------------------------------------
+    def _fingerprint(self, table_name):
+        # Solo el DDL: un cambio de datos no invalida el índice (ver refresh_interval)
+        return json.dumps([
+            self.schema_agent.table_fingerprints.get(table_name),
+            self.max_distinct,
+        ], default=str)
+
+    def _update_times(self, names):
+        times = self.schema_agent.table_update_times
+        return {t: None if times.get(t) is None else str(times.get(t)) for t in names}
+
+    def _db_key(self):
+        return str(self.db_key or self.schema_agent.db_name)
+
+    def _load(self, table, fingerprint):
+        if self._db is None:
+            return None
+        row = self._db.execute(
+            "SELECT columns, update_time, created FROM value_index WHERE db_key = ? AND table_name = ? AND fingerprint = ?",
+            (self._db_key(), table, fingerprint)
+        ).fetchone()
+        if row is None:
+            return None
+        self.metrics["disk_hits"] += 1
+        return json.loads(row[0]), row[1], row[2]
+
+    def _store(self, table, fingerprint, update_time, columns, created):
+        if self._db is None:
+            return
+        try:
+            self._db.execute(
+                "INSERT OR REPLACE INTO value_index (db_key, table_name, fingerprint, update_time, columns, created) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (self._db_key(), table, fingerprint, update_time, json.dumps(columns, ensure_ascii=False), created)
+            )
+            self._db.commit()
+        except sqlite3.Error as e:
+            self.logger.warning(f"No se pudo guardar el índice de valores de {table}: {e}")
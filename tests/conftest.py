@@ -0,0 +1,10 @@
+import os
+import sys
+
+# Los módulos de la aplicación viven planos en src/ y se importan por nombre
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src"))
+
+# Sin cachés en disco ni calentamiento en segundo plano durante las pruebas
+for _key in ("LLM_CACHE_PATH", "COLUMN_PROFILE_PATH", "VALUE_INDEX_PATH", "SCHEMA_SNAPSHOT_PATH"):
+    os.environ.setdefault(_key, "")
+os.environ.setdefault("SQLBOT_WARMUP", "false")
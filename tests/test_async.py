@@ -0,0 +1,109 @@
+import asyncio
+import time
+
+import pytest
+
+from backend5 import SQLBot
+from fakedb import FakeDatabase
+from fakellm import FakeLLM
+
+LATENCY = 0.1
+
+
+@pytest.fixture
+def make_bot(monkeypatch):
+    # Sin plantillas ni caché de resultados: cada pregunta recorre el pipeline completo
+    monkeypatch.setenv("TEMPLATE_CACHE_MAX_ENTRIES", "0")
+    monkeypatch.setenv("RESULT_CACHE_TTL", "0")
+
+    def make(latency=0.0, **env):
+        for key, value in env.items():
+            monkeypatch.setenv(key, value)
+        llm = FakeLLM(latency=latency)
+        bot = SQLBot(llm=llm, connect=FakeDatabase(n_tables=6, rows_per_table=20).connect)
+        bot.update_credentials(db_name="fake")
+        return bot, llm
+    return make
+
+
+def questions(n):
+    return [f"¿Cuántos registros hay en la tabla tabla_{i:04d}?" for i in range(n)]
+
+
+def test_async_pipeline_matches_the_sync_one(make_bot):
+    bot, _ = make_bot()
+    question = "Lista los registros de Lima en tabla_0002"
+    sync = bot.process_query(question)
+    result = asyncio.run(bot.aprocess_query(question))
+    assert result["success"] and result["sql_query"] == sync["sql_query"]
+    assert result["data"].equals(sync["data"])
+
+
+def test_independent_questions_overlap(make_bot):
+    bot, llm = make_bot(latency=LATENCY)
+
+    async def run():
+        return await asyncio.gather(*(bot.aprocess_query(q) for q in questions(5)))
+
+    start = time.perf_counter()
+    results = asyncio.run(run())
+    elapsed = time.perf_counter() - start
+    assert all(r["success"] for r in results)
+    assert llm.calls == 5
+    assert elapsed < 5 * LATENCY * 0.6
+
+
+def test_llm_concurrency_is_bounded(make_bot):
+    bot, llm = make_bot(latency=LATENCY, SQLBOT_LLM_CONCURRENCY="1")
+
+    async def run():
+        return await asyncio.gather(*(bot.aprocess_query(q) for q in questions(3)))
+
+    start = time.perf_counter()
+    asyncio.run(run())
+    assert time.perf_counter() - start >= 3 * LATENCY
+
+
+def test_batch_keeps_input_order_and_deduplicates(make_bot):
+    bot, llm = make_bot()
+    batch = questions(3) + ["  ¿CUÁNTOS registros hay en la tabla tabla_0000? "]
+    outcome = bot.process_batch(batch)
+    results = outcome["results"]
+    assert [r["question"] for r in results] == batch
+    assert [r["deduplicated"] for r in results] == [False, False, False, True]
+    assert results[3]["result"] is results[0]["result"]
+    assert llm.calls == 3
+    assert outcome["timing"]["questions"] == 4
+
+
+def test_batch_executes_identical_sql_once(make_bot):
+    bot, _ = make_bot()
+    executed = []
+    original = bot.execution_agent.execute_query
+    bot.execution_agent.execute_query = lambda sql, params=None, **kw: executed.append(sql) or original(sql, params, **kw)
+
+    results = bot.process_batch([
+        "¿Cuántos registros hay en la tabla tabla_0001?",
+        "cuantos registros tiene tabla_0001",
+    ])["results"]
+    assert results[0]["result"]["sql_query"] == results[1]["result"]["sql_query"]
+    assert len(executed) == 1
+
+
+def test_batch_parallelism_is_bounded(make_bot):
+    bot, _ = make_bot(latency=LATENCY)
+    start = time.perf_counter()
+    bot.process_batch(questions(4), parallelism=2)
+    elapsed = time.perf_counter() - start
+    assert 2 * LATENCY <= elapsed < 4 * LATENCY
+
+
+def test_batch_reports_failures_per_question(make_bot):
+    bot, _ = make_bot()
+
+    async def broken(question):
+        raise RuntimeError("LLM caído")
+
+    bot.user_query_agent.ainterpret = broken
+    result = bot.process_batch(questions(2))["results"][0]["result"]
+    assert result == {"success": False, "error": "LLM caído"}
@@ -0,0 +1,47 @@
+import json
+import sys
+
+import pytest
+
+import bench
+from fakedb import FakeDatabase
+from fakellm import FakeLLM
+
+
+def test_compare_flags_only_regressions_beyond_tolerance():
+    baseline = {"10": {"pipeline": {"throughput": 100.0, "p95": 0.2}, "schema": {"round_trips": 5}}}
+    results = {10: {"pipeline": {"throughput": 80.0, "p95": 0.22}, "schema": {"round_trips": 5}}}
+    assert bench.compare(results, baseline, tolerance=0.25) == []
+    results[10]["pipeline"]["p95"] = 0.3
+    regressions = bench.compare(results, baseline, tolerance=0.25)
+    assert len(regressions) == 1 and "pipeline.p95" in regressions[0]
+
+
+def test_pipeline_scenario_reports_questions_and_llm_calls():
+    db = FakeDatabase(n_tables=3, rows_per_table=5)
+    result = bench.bench_pipeline(db, FakeLLM(), bench.make_questions(3, 4), fused=False)
+    assert result["questions"] == 4 and result["failures"] == 0
+    assert result["llm_calls"] > 0 and result["round_trips_per_question"] > 0
+    assert "execute" in result["stages"]
+
+
+def run_main(monkeypatch, *args):
+    monkeypatch.setattr(sys, "argv", [
+        "bench.py", "--tables", "3", "--rows", "5", "--questions", "2", "--summary-tables", "2",
+        "--llm-latency", "0", "--llm-token-interval", "0", "--db-latency", "0", *args
+    ])
+    bench.main()
+
+
+def test_main_writes_results_and_checks_the_baseline(tmp_path, monkeypatch, capsys):
+    output = tmp_path / "base.json"
+    run_main(monkeypatch, "--json", str(output))
+    results = json.loads(output.read_text())
+    assert set(results["3"]) == {"schema", "summary", "pipeline", "cold_start", "streaming"}
+
+    results["3"]["schema"]["round_trips"] = 1
+    output.write_text(json.dumps(results))
+    with pytest.raises(SystemExit) as exit_info:
+        run_main(monkeypatch, "--baseline", str(output))
+    assert exit_info.value.code == 1
+    assert "schema.round_trips" in capsys.readouterr().out
@@ -0,0 +1,98 @@
+import threading
+import weakref
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from backend5 import SQLBot
+from context import ContextRegistry
+from fakedb import FakeDatabase
+from fakellm import FakeLLM
+
+
+class Context:
+    """Contexto mínimo para el registro."""
+    def __init__(self, key):
+        self.key = key
+        self.users = weakref.WeakSet()
+        self.closed = False
+
+    def memory_bytes(self):
+        return 0
+
+    def describe(self):
+        return {"database": str(self.key), "bytes": 0}
+
+    def close(self):
+        self.closed = True
+
+
+def test_building_one_database_does_not_block_the_others():
+    registry = ContextRegistry()
+    started, release = threading.Event(), threading.Event()
+
+    def slow_factory(key):
+        started.set()
+        release.wait(5)
+        return Context(key)
+
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        slow = executor.submit(registry.acquire, "lenta", slow_factory)
+        assert started.wait(5)
+        assert registry.acquire("rapida", Context).key == "rapida"
+        assert not slow.done()
+        release.set()
+        assert slow.result(5).key == "lenta"
+
+
+def test_same_database_is_built_once():
+    registry = ContextRegistry()
+    calls, release = [], threading.Event()
+
+    def factory(key):
+        calls.append(key)
+        release.wait(5)
+        return Context(key)
+
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        futures = [executor.submit(registry.acquire, "db", factory) for _ in range(8)]
+        release.set()
+        contexts = {id(f.result(5)) for f in futures}
+    assert calls == ["db"] and len(contexts) == 1
+    assert registry.stats()["misses"] == 1
+
+
+def test_failed_build_is_retried_by_the_next_acquire():
+    registry = ContextRegistry()
+
+    def broken(key):
+        raise ConnectionError("sin red")
+
+    with pytest.raises(ConnectionError):
+        registry.acquire("db", broken)
+    assert registry.acquire("db", Context).key == "db"
+
+
+def test_least_used_idle_context_is_evicted():
+    registry = ContextRegistry(max_entries=2)
+    a = registry.acquire("a", Context)
+    registry.acquire("b", Context)
+    registry.acquire("c", Context)
+    assert a.closed and registry.stats()["evicted"] == 1
+
+
+def test_sessions_share_the_tracer_and_the_llm_cache():
+    db = FakeDatabase(n_tables=3, rows_per_table=5, db_name="demo")
+    registry, tracer, llm_cache = SQLBot.create_registry(), SQLBot.create_tracer(), SQLBot.create_llm_cache()
+    llm = FakeLLM()
+    bots = [SQLBot(llm=llm, connect=db.connect, registry=registry, tracer=tracer, llm_cache=llm_cache) for _ in range(2)]
+    for bot in bots:
+        bot.update_credentials(db_name="demo")
+
+    question = "¿Cuántos registros hay en la tabla tabla_0001?"
+    bots[0].process_query(question)
+    calls = llm.calls
+    bots[1].process_query(question)
+    assert llm.calls == calls
+    assert bots[0].get_stage_stats() == bots[1].get_stage_stats()
+    assert bots[0].get_stage_stats()["process_query"]["count"] == 2
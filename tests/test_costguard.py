@@ -0,0 +1,73 @@
+import pytest
+
+from costguard import QueryCostGuard
+
+
+class PlanConnection:
+    """Conexión mínima que responde a EXPLAIN con un plan de `rows` filas."""
+    def __init__(self, rows):
+        self.rows = rows
+
+    def cursor(self):
+        return self
+
+    def execute(self, sql, params=None):
+        self.description = [("table",), ("type",), ("key",), ("rows",), ("filtered",)]
+
+    def fetchall(self):
+        return [("clientes", "ALL", None, self.rows, 100.0)]
+
+    def close(self):
+        pass
+
+
+def make_guard(rows=5_000_000, **kwargs):
+    return QueryCostGuard(lambda: PlanConnection(rows), max_rows_examined=1_000_000, default_limit=1000, **kwargs)
+
+
+@pytest.mark.parametrize("sql, expected", [
+    ("SELECT * FROM clientes", "SELECT * FROM clientes LIMIT 1000;"),
+    ("SELECT * FROM clientes LIMIT 5000;", "SELECT * FROM clientes LIMIT 1000;"),
+    ("SELECT * FROM clientes LIMIT 5000 OFFSET 10;", "SELECT * FROM clientes LIMIT 1000 OFFSET 10;"),
+    # Forma de MySQL "LIMIT desplazamiento, cantidad"
+    ("SELECT * FROM clientes LIMIT 10, 5000;", "SELECT * FROM clientes LIMIT 1000 OFFSET 10;"),
+])
+def test_limit_policy_caps_count_and_keeps_offset(sql, expected):
+    check = make_guard().check(sql)
+    assert check["allowed"]
+    assert check["action"] == "limited"
+    assert check["sql"] == expected
+
+
+@pytest.mark.parametrize("sql", [
+    "SELECT * FROM clientes LIMIT 5000, 10;",
+    "SELECT * FROM clientes LIMIT 10 OFFSET 5000;",
+    "SELECT * FROM clientes LIMIT 25;",
+])
+def test_small_limits_pass_unchanged(sql):
+    check = make_guard().check(sql)
+    assert check["allowed"]
+    assert check["action"] == "ok"
+    assert check["sql"] == sql
+
+
+@pytest.mark.parametrize("sql", [
+    "SELECT COUNT(*) AS total FROM `clientes`;",
+    "SELECT ciudad, SUM(monto) FROM clientes GROUP BY ciudad;",
+    "SELECT DISTINCT ciudad FROM clientes;",
+])
+def test_limit_policy_runs_aggregates_with_a_warning(sql):
+    check = make_guard().check(sql)
+    assert check["allowed"]
+    assert check["action"] == "over_budget"
+    assert check["sql"] == sql
+    assert check["message"]
+
+
+def test_reject_policy_still_rejects():
+    assert not make_guard(policy="reject").check("SELECT COUNT(*) FROM clientes;")["allowed"]
+
+
+def test_cheap_queries_are_untouched():
+    check = make_guard(rows=10).check("SELECT * FROM clientes")
+    assert check["action"] == "ok" and check["sql"] == "SELECT * FROM clientes"
@@ -0,0 +1,30 @@
+from decimal import Decimal
+
+import pandas as pd
+
+from digest import ResultDigester
+
+
+def test_decimal_column_with_leading_nulls_is_numeric():
+    frame = pd.DataFrame({
+        "id": range(5000),
+        "monto": [None] * 150 + [Decimal("10.50")] * 4850,
+    })
+    digest = ResultDigester(token_budget=300).summarize(frame)
+    assert "- monto (numérica)" in digest
+    assert "150 nulos" in digest
+
+
+def test_frequent_value_shares_ignore_nulls():
+    frame = pd.DataFrame({
+        "id": range(3000),
+        "ciudad": ["Lima"] * 2900 + [None] * 100,
+    })
+    digest = ResultDigester(token_budget=300).summarize(frame)
+    assert "frecuentes: Lima (100%)" in digest
+    assert "100 nulos" in digest
+
+
+def test_small_results_are_sent_whole():
+    digest = ResultDigester().summarize(pd.DataFrame({"ciudad": ["Lima", "Cusco"], "total": [3, 4]}))
+    assert digest.splitlines() == ["2 filas, 2 columnas.", "ciudad | total", "Lima | 3", "Cusco | 4"]
@@ -0,0 +1,61 @@
+from backend5 import QueryExecutionAgent
+from fakedb import FakeDatabase
+from pool import ConnectionPool
+
+SQL = "SELECT id, nombre, monto FROM tabla_0000 ORDER BY id"
+
+
+def test_select_is_read_in_chunks():
+    db = FakeDatabase(n_tables=1, rows_per_table=35)
+    chunks = []
+    result = QueryExecutionAgent(db.connect, chunk_rows=10).execute_query(SQL, on_chunk=chunks.append)
+    assert result["success"] and not result["truncated"]
+    assert [len(c) for c in chunks] == [10, 10, 10, 5]
+    assert result["row_count"] == 35 and list(result["data"]["id"]) == list(range(1, 36))
+    assert list(result["data"].columns) == ["id", "nombre", "monto"]
+
+
+def test_row_limit_truncates_the_result():
+    db = FakeDatabase(n_tables=1, rows_per_table=35)
+    result = QueryExecutionAgent(db.connect, max_rows=20, chunk_rows=8).execute_query(SQL)
+    assert result["truncated"] and len(result["data"]) == 20
+    assert "20 filas" in result["message"]
+
+
+def test_exact_row_limit_is_not_truncated():
+    db = FakeDatabase(n_tables=1, rows_per_table=20)
+    result = QueryExecutionAgent(db.connect, max_rows=20).execute_query(SQL)
+    assert not result["truncated"] and len(result["data"]) == 20
+
+
+def test_byte_limit_truncates_the_result():
+    db = FakeDatabase(n_tables=1, rows_per_table=500)
+    result = QueryExecutionAgent(db.connect, max_bytes=4096, chunk_rows=100).execute_query(SQL)
+    assert result["truncated"] and 0 < len(result["data"]) < 500
+    assert result["bytes"] <= 4096
+
+
+def test_connection_with_unread_rows_is_not_reused():
+    db = FakeDatabase(n_tables=1, rows_per_table=35)
+    pool = ConnectionPool(db.connect)
+    agent = QueryExecutionAgent(pool.get_connection, max_rows=5)
+    assert agent.execute_query(SQL)["truncated"]
+    assert pool.stats()["size"] == 0
+
+    agent.max_rows = 100
+    assert not agent.execute_query(SQL)["truncated"]
+    assert pool.stats()["size"] == 1 and pool.stats()["idle"] == 1
+
+
+def test_writes_are_committed():
+    db = FakeDatabase(n_tables=1, rows_per_table=3)
+    agent = QueryExecutionAgent(db.connect)
+    result = agent.execute_query("UPDATE tabla_0000 SET ciudad = %s WHERE id = 1", ("Huancayo",))
+    assert result["success"] and result["data"] is None
+    assert agent.execute_query("SELECT ciudad FROM tabla_0000 WHERE id = 1")["data"].iloc[0, 0] == "Huancayo"
+
+
+def test_errors_are_reported():
+    db = FakeDatabase(n_tables=1)
+    result = QueryExecutionAgent(db.connect).execute_query("SELECT * FROM no_existe")
+    assert not result["success"] and result["message"]
@@ -0,0 +1,87 @@
+from fakedb import FakeDatabase
+from fakellm import FakeLLM
+from llmcache import LLMResponseCache
+from backend5 import SQLBot
+
+
+def test_schema_change_only_purges_its_database(tmp_path):
+    cache = LLMResponseCache(path=str(tmp_path / "llm_cache.sqlite"))
+    a, b = cache.scoped("a"), cache.scoped("b")
+    a.set("ka", "respuesta a", "fp-a1")
+    b.set("kb", "respuesta b", "fp-b1")
+
+    # Consultar otra BD no invalida nada
+    assert a.get("ka", "fp-a1") == "respuesta a"
+    assert b.get("kb", "fp-b1") == "respuesta b"
+
+    # El esquema de "a" cambia: solo se borra lo de su huella anterior
+    a.get("otra", "fp-a2")
+    assert cache.stats()["disk_entries"] == 1
+    assert b.get("kb", "fp-b1") == "respuesta b"
+    assert LLMResponseCache(path=str(tmp_path / "llm_cache.sqlite")).scoped("a").get("ka", "fp-a1") is None
+
+
+def test_switching_back_to_a_database_reuses_its_answers(tmp_path, monkeypatch):
+    monkeypatch.setenv("LLM_CACHE_PATH", str(tmp_path / "llm_cache.sqlite"))
+    monkeypatch.setenv("TEMPLATE_CACHE_MAX_ENTRIES", "0")
+    # Esquemas distintos: cada BD tiene su propia huella
+    dbs = {"a": FakeDatabase(n_tables=5, rows_per_table=5, db_name="a"),
+           "b": FakeDatabase(n_tables=6, rows_per_table=5, db_name="b")}
+    current = {"db": "a"}
+    llm = FakeLLM()
+    bot = SQLBot(llm=llm, connect=lambda: dbs[current["db"]].connect())
+
+    def ask(db_name, question):
+        current["db"] = db_name
+        bot.update_credentials(db_name=db_name)
+        return bot.process_query(question)
+
+    ask("a", "¿Cuántos registros hay en la tabla tabla_0001?")
+    ask("b", "¿Cuántos registros hay en la tabla tabla_0002?")
+    calls = llm.calls
+    assert ask("a", "¿Cuántos registros hay en la tabla tabla_0001?")["success"]
+    assert llm.calls == calls
+    assert bot.get_llm_cache_stats()["disk_entries"] == 2
+
+
+def test_question_keys_are_normalized():
+    cache = LLMResponseCache()
+    llm = FakeLLM()
+    assert (cache.make_key("interpret", "¿Cuántos clientes hay en Lima?", "t", llm, "fp")
+            == cache.make_key("interpret", "cuántos   CLIENTES hay en lima", "t", llm, "fp"))
+
+
+def test_filter_values_keep_their_case():
+    from describe import SQLGenerationAgent
+
+    class Schema:
+        schema_fingerprint = "fp"
+
+        def get_schema_dict(self):
+            return {"clientes": {"columns": {"city": {"type": "varchar"}}}}
+
+        def get_prompt_schema(self):
+            return "clientes(city)"
+
+    agent = SQLGenerationAgent(llm=FakeLLM(), schema_agent=Schema(), cache=LLMResponseCache().scoped("db"))
+    lima = agent._prepare({"intencion": "listar", "tabla": "clientes", "filtros": {"city": "Lima"}})[1]
+    upper = agent._prepare({"intencion": "listar", "tabla": "clientes", "filtros": {"city": "LIMA"}})[1]
+    assert lima["cache_key"] != upper["cache_key"]
+
+
+def test_database_users_do_not_share_answers(tmp_path, monkeypatch):
+    monkeypatch.setenv("LLM_CACHE_PATH", str(tmp_path / "llm_cache.sqlite"))
+    monkeypatch.setenv("TEMPLATE_CACHE_MAX_ENTRIES", "0")
+    db = FakeDatabase(n_tables=5, rows_per_table=5, db_name="a")
+    llm = FakeLLM()
+    bot = SQLBot(llm=llm, connect=db.connect)
+    question = "¿Cuántos registros hay en la tabla tabla_0001?"
+
+    bot.update_credentials(db_name="a", db_user="ana", db_password="secreto")
+    bot.process_query(question)
+    calls = llm.calls
+    assert "secreto" not in bot._snapshot_key(bot.context)
+
+    bot.update_credentials(db_name="a", db_user="luis")
+    bot.process_query(question)
+    assert llm.calls > calls
@@ -0,0 +1,102 @@
+import threading
+import time
+
+import pytest
+
+from pool import ConnectionPool, PoolClosedError, PoolTimeoutError
+
+
+class Connection:
+    """Conexión cruda mínima: registra ping, rollback y cierre."""
+    def __init__(self, healthy=True):
+        self.healthy = healthy
+        self.closed = False
+        self.rollbacks = 0
+
+    def ping(self, reconnect=False):
+        if not self.healthy:
+            raise ConnectionError("perdida")
+
+    def rollback(self):
+        self.rollbacks += 1
+
+    def close(self):
+        self.closed = True
+
+
+def make_pool(**kwargs):
+    opened = []
+
+    def connect():
+        opened.append(Connection())
+        return opened[-1]
+
+    return ConnectionPool(connect, **kwargs), opened
+
+
+def test_connections_are_reused():
+    pool, opened = make_pool(max_size=2)
+    for _ in range(5):
+        with pool.get_connection():
+            pass
+    assert len(opened) == 1
+    assert opened[0].rollbacks == 5 and not opened[0].closed
+    assert pool.stats()["checkouts"] == 5
+
+
+def test_timeout_when_max_size_are_checked_out():
+    pool, _ = make_pool(max_size=2, timeout=0.05)
+    held = [pool.get_connection(), pool.get_connection()]
+    with pytest.raises(PoolTimeoutError):
+        pool.get_connection()
+    assert pool.stats()["timeouts"] == 1 and pool.stats()["in_use"] == 2
+    held[0].close()
+    assert pool.get_connection() is not None
+
+
+def test_waiters_get_the_returned_connection():
+    pool, opened = make_pool(max_size=1, timeout=5)
+    conn = pool.get_connection()
+    threading.Timer(0.05, conn.close).start()
+    with pool.get_connection():
+        pass
+    assert len(opened) == 1 and pool.stats()["waits"] == 1
+
+
+def test_idle_connections_are_recycled():
+    pool, opened = make_pool(max_idle=0.01)
+    pool.get_connection().close()
+    time.sleep(0.02)
+    pool.get_connection().close()
+    assert len(opened) == 2 and opened[0].closed
+    assert pool.stats()["recycled"] == 1
+
+
+def test_failed_ping_discards_the_connection():
+    pool, opened = make_pool(ping_interval=0)
+    pool.get_connection().close()
+    opened[0].healthy = False
+    pool.get_connection().close()
+    assert len(opened) == 2 and opened[0].closed
+    assert pool.stats()["failed_checks"] == 1 and pool.stats()["size"] == 1
+
+
+def test_invalidated_connections_are_discarded():
+    pool, opened = make_pool()
+    conn = pool.get_connection()
+    conn.invalidate()
+    conn.close()
+    assert opened[0].closed and pool.stats()["size"] == 0
+    pool.get_connection()
+    assert len(opened) == 2
+
+
+def test_closed_pool_rejects_checkouts():
+    pool, opened = make_pool()
+    held = pool.get_connection()
+    pool.get_connection().close()
+    pool.close()
+    with pytest.raises(PoolClosedError):
+        pool.get_connection()
+    held.close()
+    assert all(conn.closed for conn in opened)
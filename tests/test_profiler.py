@@ -0,0 +1,76 @@
+from decimal import Decimal
+
+from profiler import ColumnProfiler
+
+
+class Connection:
+    """Conexión DB-API mínima: toda consulta devuelve las mismas filas."""
+    def __init__(self, columns, rows, log):
+        self.columns, self.rows, self.log = columns, rows, log
+
+    def cursor(self):
+        return self
+
+    def execute(self, sql, params=None):
+        self.log.append(sql)
+        self.description = [(c, None, None, None, None, None, None) for c in self.columns]
+
+    def fetchall(self):
+        return list(self.rows)
+
+    def close(self):
+        pass
+
+    def commit(self):
+        pass
+
+
+class Schema:
+    db_name = "tienda"
+
+    def __init__(self):
+        self.table_fingerprints = {"ventas": "v1"}
+        self.table_update_times = {"ventas": None}
+
+    def get_schema_dict(self):
+        return {"ventas": {"columns": {}, "row_estimate": 4}}
+
+
+ROWS = [(1, None, "Lima"), (2, Decimal("10.50"), "Lima"), (3, Decimal("2.25"), "Cusco"), (4, Decimal("7"), "Lima")]
+
+
+def make_profiler(log, path=None, db_key=None, rows=ROWS, schema=None):
+    return ColumnProfiler(
+        schema or Schema(), lambda: Connection(["id", "monto", "ciudad"], rows, log), path=path, db_key=db_key
+    )
+
+
+def test_decimal_columns_get_numeric_stats():
+    profile = make_profiler([]).get_profiles()["ventas"]["columns"]["monto"]
+    assert profile["min"] == 2.25 and profile["max"] == 10.5
+    assert "top" not in profile
+    assert profile["null_ratio"] == 0.25
+
+
+def test_profiles_are_recomputed_only_when_the_table_changes():
+    log, schema = [], Schema()
+    profiler = make_profiler(log, schema=schema)
+    profiler.get_profiles()
+    profiler.get_profiles()
+    assert len(log) == 1
+    schema.table_fingerprints["ventas"] = "v2"
+    profiler.get_profiles()
+    assert len(log) == 2
+
+
+def test_same_database_name_on_two_servers_does_not_collide(tmp_path):
+    path = str(tmp_path / "profiles.sqlite")
+    a_rows = [(1, Decimal("1"), "Lima")]
+    b_rows = [(1, Decimal("99"), "Cusco")]
+    make_profiler([], path, "a:3306/tienda", a_rows).get_profiles()
+    make_profiler([], path, "b:3306/tienda", b_rows).get_profiles()
+
+    log = []
+    profile = make_profiler(log, path, "a:3306/tienda", a_rows).get_profiles()["ventas"]
+    assert log == []  # Desde disco
+    assert profile["columns"]["monto"]["max"] == 1
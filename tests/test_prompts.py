@@ -0,0 +1,69 @@
+import os
+from typing import Any
+
+from conection import DatabaseSchemaAgent
+from describe import SQLGenerationAgent
+from fakedb import FakeDatabase
+from fakellm import FakeLLM
+from interpretation import UserQueryAgent
+from valueindex import ValueIndex
+
+
+class RecordingLLM(FakeLLM):
+    """Guarda cada prompt recibido."""
+    prompts: Any = None
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.prompts = []
+
+    def _start(self, prompt):
+        self.prompts.append(prompt)
+        return super()._start(prompt)
+
+
+def common_prefix(a, b):
+    return os.path.commonprefix([a, b])
+
+
+def make_schema():
+    db = FakeDatabase(n_tables=4, rows_per_table=10)
+    return db, DatabaseSchemaAgent(db.connect, db.db_name, cache_ttl=60)
+
+
+def test_chains_are_compiled_once_per_agent():
+    _, schema_agent = make_schema()
+    agent = UserQueryAgent(RecordingLLM(), schema_agent)
+    chain = agent.chain
+    agent.interpret("Lista los registros de tabla_0001")
+    agent.interpret("Lista los registros de tabla_0002")
+    assert agent.chain is chain and agent._prepare("otra")[1]["chain"] is chain
+
+
+def test_schema_text_is_memoized_per_version():
+    _, schema_agent = make_schema()
+    assert schema_agent.get_prompt_schema() is schema_agent.get_prompt_schema()
+
+
+def test_interpretation_prompts_share_the_schema_prefix():
+    db, schema_agent = make_schema()
+    llm = RecordingLLM()
+    agent = UserQueryAgent(llm, schema_agent, value_index=ValueIndex(schema_agent, db.connect))
+    agent.interpret("Lista los registros de tabla_0001")
+    agent.interpret("¿Cuántos registros de Arequipa hay en tabla_0003?")
+
+    first, second = llm.prompts
+    prefix = common_prefix(first, second)
+    assert schema_agent.get_prompt_schema() in prefix
+    # Lo que depende de la pregunta va después del esquema
+    assert second.index("Valores de la pregunta") >= len(prefix)
+    assert second.rstrip().endswith("Pregunta: ¿Cuántos registros de Arequipa hay en tabla_0003?")
+
+
+def test_sql_prompts_share_the_schema_prefix():
+    _, schema_agent = make_schema()
+    llm = RecordingLLM()
+    agent = SQLGenerationAgent(llm, schema_agent)
+    agent.generate_sql({"intencion": "listar", "tabla": "tabla_0001", "filtros": {}})
+    agent.generate_sql({"intencion": "contar", "tabla": "tabla_0002", "filtros": {"ciudad": "Lima"}})
+    assert schema_agent.get_prompt_schema() in common_prefix(*llm.prompts)
@@ -0,0 +1,94 @@
+import pandas as pd
+import pytest
+
+from resultcache import QueryResultCache, referenced_tables
+
+
+@pytest.mark.parametrize("sql", [
+    "DROP TABLE IF EXISTS clientes",
+    "CREATE TABLE IF NOT EXISTS clientes (id INT)",
+    "TRUNCATE TABLE clientes",
+    "ALTER TABLE `ventas`.`clientes` ADD COLUMN x INT",
+])
+def test_ddl_references_its_table(sql):
+    assert referenced_tables(sql) == {"clientes"}
+
+
+def test_select_tables():
+    sql = "SELECT * FROM clientes c JOIN pedidos p ON p.cliente_id = c.id WHERE c.nombre = 'FROM x'"
+    assert referenced_tables(sql) == {"clientes", "pedidos"}
+
+
+def test_cached_frames_are_not_shared():
+    cache = QueryResultCache()
+    data = pd.DataFrame({"id": [1, 2]})
+    cache.set("SELECT * FROM clientes", None, {"success": True, "data": data, "bytes": 16})
+
+    data.loc[0, "id"] = 99
+    first = cache.get("select *  from clientes")
+    first["data"].loc[1, "id"] = 42
+
+    assert cache.get("SELECT * FROM clientes")["data"]["id"].tolist() == [1, 2]
+
+
+def test_ddl_invalidates_cached_results():
+    cache = QueryResultCache()
+    cache.set("SELECT * FROM clientes", None, {"success": True, "data": pd.DataFrame({"id": [1]}), "bytes": 8})
+    cache.invalidate_tables(referenced_tables("DROP TABLE IF EXISTS clientes"))
+    assert cache.get("SELECT * FROM clientes") is None
+
+
+@pytest.mark.parametrize("sql, expected", [
+    ("SELECT * FROM a, b WHERE a.id = b.id", {"a", "b"}),
+    ("SELECT * FROM a x, `ventas`.`b` AS y, c WHERE x.id = y.id", {"a", "b", "c"}),
+    ("SELECT * FROM a JOIN b ON a.id = COALESCE(b.id, 0), c WHERE 1", {"a", "b", "c"}),
+    ("SELECT * FROM (SELECT * FROM a) x, b", {"a", "b"}),
+    ("SELECT * FROM (a JOIN b ON a.i = b.i) LEFT JOIN c USING (i)", {"a", "b", "c"}),
+    ("SELECT * FROM a NATURAL LEFT JOIN b", {"a", "b"}),
+])
+def test_comma_joins_and_join_lists(sql, expected):
+    assert referenced_tables(sql) == expected
+
+
+@pytest.mark.parametrize("sql, expected", [
+    ("UPDATE a, b SET b.x = 1 WHERE a.id = b.id", {"a", "b"}),
+    ("UPDATE a JOIN b ON a.id = b.a_id SET b.x = 1", {"a", "b"}),
+    ("DELETE a FROM a JOIN b ON a.i = b.i WHERE b.x = 1", {"a", "b"}),
+    ("INSERT INTO t (a) VALUES (1) ON DUPLICATE KEY UPDATE a = 2", {"t"}),
+    ("DROP TABLE IF EXISTS a, b", {"a", "b"}),
+])
+def test_multi_table_writes(sql, expected):
+    assert referenced_tables(sql) == expected
+
+
+@pytest.mark.parametrize("sql", [
+    "SELECT * FROM t PARTITION (p0)",
+    "SELECT * FROM t USE INDEX (i) WHERE x = 1",
+    "UPDATE a, b c d SET x = 1",
+])
+def test_unrecognized_forms_are_uncertain(sql):
+    assert referenced_tables(sql) is None
+
+
+def test_write_to_comma_joined_table_invalidates():
+    cache = QueryResultCache()
+    sql = "SELECT * FROM a, b WHERE a.id = b.id"
+    cache.set(sql, None, {"success": True, "data": pd.DataFrame({"id": [1]}), "bytes": 8})
+    cache.invalidate_tables(referenced_tables("UPDATE b SET x = 1"))
+    assert cache.get(sql) is None
+
+
+def test_update_time_of_every_joined_table_is_checked():
+    cache = QueryResultCache()
+    sql = "SELECT * FROM a, b WHERE a.id = b.id"
+    cache.set(sql, None, {"success": True, "data": pd.DataFrame({"id": [1]}), "bytes": 8},
+              update_times={"a": "t1", "b": "t1"})
+    cache.check_update_times({"a": "t1", "b": "t2"})
+    assert cache.get(sql) is None
+
+
+def test_uncertain_reads_are_not_cached():
+    cache = QueryResultCache()
+    sql = "SELECT * FROM t PARTITION (p0)"
+    cache.set(sql, None, {"success": True, "data": pd.DataFrame({"id": [1]}), "bytes": 8})
+    assert cache.get(sql) is None
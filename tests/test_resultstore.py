@@ -0,0 +1,64 @@
+import gc
+import os
+from decimal import Decimal
+
+import pandas as pd
+
+from resultstore import ResultStore
+
+
+def frame(rows):
+    return pd.DataFrame({"id": range(rows), "ciudad": ["Lima", "Cusco"] * (rows // 2) + ["Tacna"] * (rows % 2)})
+
+
+def test_small_results_stay_in_memory(tmp_path):
+    store = ResultStore(str(tmp_path), preview_rows=10)
+    handle = store.put(frame(5))
+    assert not handle["spilled"] and handle["pages"] == 1
+    assert store.load_page(handle).equals(frame(5))
+    assert os.listdir(store.directory) == []
+
+
+def test_large_results_spill_and_are_read_by_page(tmp_path):
+    store = ResultStore(str(tmp_path), preview_rows=10, page_rows=100)
+    handle = store.put(frame(250))
+    assert handle["spilled"] and handle["rows"] == 250 and handle["pages"] == 3
+    assert len(handle["preview"]) == 10
+
+    assert list(store.load_page(handle, 1)["id"]) == list(range(100, 200))
+    assert list(store.load_page(handle, 99)["id"]) == list(range(200, 250))
+    assert store.load(handle).equals(frame(250))
+    assert store.stats()["pages_read"] == 2
+
+
+def test_mixed_object_columns_are_stored_as_text(tmp_path):
+    store = ResultStore(str(tmp_path), preview_rows=1)
+    data = pd.DataFrame({"valor": [Decimal("1.50"), "n/a", None]})
+    handle = store.put(data)
+    assert handle["spilled"]
+    assert list(store.load(handle)["valor"]) == ["1.50", "n/a", None]
+
+
+def test_oldest_files_are_evicted(tmp_path):
+    store = ResultStore(str(tmp_path), preview_rows=1, max_files=2)
+    first, second, third = (store.put(frame(20)) for _ in range(3))
+    assert not store.is_available(first) and store.load_page(first) is None
+    assert store.is_available(second) and store.is_available(third)
+    assert store.stats()["evicted"] == 1 and store.stats()["files"] == 2
+
+
+def test_disk_budget_is_respected(tmp_path):
+    store = ResultStore(str(tmp_path), preview_rows=1, max_disk_bytes=1)
+    handle = store.put(frame(20))
+    assert not store.is_available(handle) and store.stats()["disk_bytes"] == 0
+
+
+def test_directory_is_removed_with_the_session(tmp_path):
+    store = ResultStore(str(tmp_path), preview_rows=1)
+    store.put(frame(20))
+    directory = store.directory
+    store.clear()
+    assert os.listdir(directory) == []
+    del store
+    gc.collect()
+    assert not os.path.exists(directory)
@@ -0,0 +1,125 @@
+import json
+
+import pytest
+
+from conection import DatabaseSchemaAgent
+from fakedb import FakeDatabase
+
+
+def make_agent(db, **kwargs):
+    return DatabaseSchemaAgent(db.connect, db.db_name, **kwargs)
+
+
+@pytest.mark.parametrize("n_tables", [1, 10, 100])
+def test_introspection_uses_a_constant_number_of_queries(n_tables):
+    db = FakeDatabase(n_tables=n_tables, rows_per_table=1)
+    schema = make_agent(db).get_schema_dict()
+    assert len(schema) == n_tables
+    # Huellas + tablas, columnas, FKs e índices
+    assert db.round_trips == 5
+
+
+def test_introspection_groups_columns_relations_and_indexes():
+    schema = make_agent(FakeDatabase(n_tables=2, rows_per_table=3)).get_schema_dict()
+    child = schema["tabla_0001"]
+    assert list(child["columns"])[:3] == ["id", "nombre", "ciudad"]
+    assert child["columns"]["id"]["key"] == "PRI" and not child["columns"]["id"]["nullable"]
+    assert child["relations"] == [
+        {"column": "tabla_0000_id", "referenced_table": "tabla_0000", "referenced_column": "id"}
+    ]
+    assert {i["name"]: i["unique"] for i in child["indexes"]} == {"PRIMARY": True, "idx_ciudad": False}
+    assert child["row_estimate"] == 3 and schema["tabla_0000"]["relations"] == []
+
+
+def spy_introspection(agent):
+    calls, original = [], agent._introspect
+    agent._introspect = lambda tables=None: calls.append(tables) or original(tables)
+    return calls
+
+
+def test_cached_schema_is_served_within_the_ttl():
+    db = FakeDatabase(n_tables=3)
+    agent = make_agent(db, cache_ttl=60)
+    agent.get_schema_dict()
+    db.reset_counters()
+    agent.get_schema_dict()
+    assert db.round_trips == 0
+
+
+def test_unchanged_schema_costs_one_query_and_keeps_its_version():
+    db = FakeDatabase(n_tables=3)
+    agent = make_agent(db, cache_ttl=0)
+    agent.get_schema_dict()
+    version = agent.schema_version
+    db.reset_counters()
+    assert agent.refresh() is False
+    assert db.round_trips == 1 and agent.schema_version == version
+
+
+def test_only_changed_tables_are_read_again():
+    db = FakeDatabase(n_tables=5)
+    agent = make_agent(db, cache_ttl=0)
+    agent.get_schema_dict()
+    version, fingerprint = agent.schema_version, agent.schema_fingerprint
+    calls = spy_introspection(agent)
+
+    db.add_column("tabla_0003", "categoria")
+    assert agent.refresh() is True
+    assert calls == [["tabla_0003"]]
+    assert "categoria" in agent.get_schema_dict()["tabla_0003"]["columns"]
+    assert agent.schema_version == version + 1 and agent.schema_fingerprint != fingerprint
+
+
+def test_data_writes_do_not_change_the_schema_version():
+    db = FakeDatabase(n_tables=2)
+    agent = make_agent(db, cache_ttl=0)
+    agent.get_schema_dict()
+    version = agent.schema_version
+    calls = spy_introspection(agent)
+
+    db.touch("tabla_0001")
+    assert agent.refresh() is False
+    assert calls == [] and agent.schema_version == version
+    assert agent.table_update_times["tabla_0001"] is not None
+
+
+def test_compact_schema_is_one_line_per_table():
+    agent = make_agent(FakeDatabase(n_tables=2, rows_per_table=1), schema_format="compact")
+    lines = agent.get_prompt_schema().splitlines()
+    assert lines[0].startswith("Formato: ") and "s=varchar" in lines[0]
+    assert lines[2] == (
+        "tabla_0001(id*:i,nombre:s,ciudad:s,estado:s,edad:i,monto:dec,fecha_registro:dt,tabla_0000_id:i>tabla_0000)"
+    )
+    assert agent.get_prompt_schema(tables=["tabla_0000"]).splitlines()[1:] == [lines[1]]
+
+
+def test_verbose_format_keeps_the_detailed_text():
+    agent = make_agent(FakeDatabase(n_tables=2, rows_per_table=1), schema_format="verbose")
+    assert agent.get_prompt_schema() == agent.get_schema_text()
+    assert "FK en tabla_0001.tabla_0000_id -> tabla_0000.id" in agent.get_prompt_schema(tables=["tabla_0001"])
+
+
+def test_compact_schema_compresses_and_respects_the_budget():
+    agent = make_agent(FakeDatabase(n_tables=20, rows_per_table=1))
+    full = agent.get_compact_schema()
+    assert full["compression_ratio"] > 1.5 and not full["omitted"]
+
+    small = agent.get_compact_schema(token_budget=150)
+    assert small["truncated"] and small["omitted"]
+    assert f"(+{len(small['omitted'])} tablas omitidas)" in small["text"]
+    assert len(small["tables"]) + len(small["omitted"]) == 20
+    # Antes de omitir una tabla se conserva al menos su nombre
+    assert f"{small['truncated'][-1]}(…)" in small["text"].splitlines()
+
+
+def test_first_rows_are_bounded_and_json_ready():
+    agent = make_agent(FakeDatabase(n_tables=5, rows_per_table=10))
+    first = agent.get_first_rows(tables=["tabla_0001", "no_existe"], max_rows=2, max_value_chars=8)
+    entry = first["tables"]["tabla_0001"]
+    assert entry["columns"][:2] == ["id", "nombre"] and len(entry["rows"]) == 2
+    assert entry["rows"][0][1] == "Registr…"
+    json.dumps(first)
+
+    limited = agent.get_first_rows(max_rows=3, token_budget=120)
+    assert limited["tables"] and limited["omitted"]
+    assert len(limited["tables"]) + len(limited["omitted"]) == 5
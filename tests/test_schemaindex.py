@@ -0,0 +1,75 @@
+from schemaindex import SchemaRetriever, tokenize
+
+
+def table(columns, relations=(), comment=""):
+    return {
+        "columns": {c: {"type": "varchar", "comment": ""} for c in columns},
+        "relations": [{"column": c, "referenced_table": t, "referenced_column": "id"} for c, t in relations],
+        "comment": comment,
+    }
+
+
+class Schema:
+    schema_version = 1
+
+    def __init__(self, tokens=10):
+        self.tokens = tokens
+        self.schema = {
+            "clientes": table(["id", "nombre", "ciudad"]),
+            "pedidos": table(["id", "cliente_id", "total"], [("cliente_id", "clientes")]),
+            "productos": table(["id", "descripcion", "precio"]),
+            "empleados": table(["id", "nombre", "cargo"], comment="Personal de la empresa"),
+            "proveedores": table(["id", "razon_social"]),
+        }
+
+    def get_schema_dict(self):
+        return self.schema
+
+    def prompt_tokens(self, name):
+        return self.tokens
+
+    def get_prompt_schema(self, tables=None):
+        return "\n".join(tables)
+
+
+def test_tokenize_folds_accents_plurals_and_separators():
+    assert tokenize("Clientes_Activos") == tokenize("cliente activo")
+    assert tokenize("Categorías") == ["categoria"]
+
+
+def test_relevant_tables_rank_first():
+    retriever = SchemaRetriever(Schema())
+    assert retriever.score("¿Cuál es el precio de los productos?")[0][0] == "productos"
+    assert retriever.score("personal de la empresa")[0][0] == "empleados"
+    assert retriever.score("xyz") == []
+
+
+def test_selection_adds_foreign_key_neighbours():
+    retriever = SchemaRetriever(Schema(), top_k=1)
+    assert retriever.select_tables("total de los pedidos") == ["pedidos", "clientes"]
+    assert retriever.select_tables("ciudad de los clientes") == ["clientes", "pedidos"]
+
+
+def test_required_tables_come_first():
+    retriever = SchemaRetriever(Schema(), top_k=1)
+    assert retriever.select_tables("precio de productos", required=["proveedores"])[:2] == ["proveedores", "productos"]
+
+
+def test_selection_respects_the_token_budget():
+    retriever = SchemaRetriever(Schema(tokens=10), top_k=5, token_budget=25)
+    assert len(retriever.select_tables("id nombre")) == 2
+
+
+def test_without_matches_falls_back_to_schema_order():
+    retriever = SchemaRetriever(Schema(tokens=10), token_budget=30)
+    assert retriever.select_tables("xyz") == ["clientes", "pedidos", "productos"]
+
+
+def test_index_is_rebuilt_only_when_the_schema_version_changes():
+    schema = Schema()
+    retriever = SchemaRetriever(schema)
+    retriever.score("clientes")
+    schema.schema["ventas"] = table(["id", "monto"])
+    assert retriever.score("ventas") == []
+    schema.schema_version = 2
+    assert retriever.score("ventas")[0][0] == "ventas"
@@ -0,0 +1,72 @@
+import sqlite3
+
+from backend5 import SQLBot
+from fakedb import FakeDatabase
+from fakellm import FakeLLM
+from snapshot import SchemaSnapshotStore
+
+
+def make_bot(db, monkeypatch, path):
+    monkeypatch.setenv("SCHEMA_SNAPSHOT_PATH", path)
+    bot = SQLBot(llm=FakeLLM(), connect=db.connect)
+    bot.update_credentials(db_name=db.db_name)
+    return bot
+
+
+def test_warm_up_saves_schema_without_data_rows(tmp_path, monkeypatch):
+    path = str(tmp_path / "snapshot.sqlite")
+    db = FakeDatabase(n_tables=4)
+    bot = make_bot(db, monkeypatch, path)
+    bot.warm_up(background=False)
+
+    payload = bot.snapshot_store.load(bot._snapshot_key(bot.context))
+    assert set(payload) == {"schema", "semantic_map", "created"}
+    assert set(payload["schema"]["schema"]) == {f"tabla_{i:04d}" for i in range(4)}
+    raw = sqlite3.connect(path).execute("SELECT payload FROM schema_snapshots").fetchone()[0]
+    assert "Registro 1 de" not in raw
+    assert bot.context.summarizer.memory_bytes() == 0
+
+
+def test_new_process_restores_the_schema_without_the_database(tmp_path, monkeypatch):
+    path = str(tmp_path / "snapshot.sqlite")
+    db = FakeDatabase(n_tables=4)
+    make_bot(db, monkeypatch, path).warm_up(background=False)
+
+    db.reset_counters()
+    bot = make_bot(db, monkeypatch, path)
+    assert db.round_trips == 0
+    assert set(bot.context.schema_agent.cached_schema) == {f"tabla_{i:04d}" for i in range(4)}
+
+
+def test_snapshots_of_another_format_are_ignored(tmp_path):
+    store = SchemaSnapshotStore(str(tmp_path / "snapshot.sqlite"))
+    store.save("h:3306/db", {"schema": {"schema": {}}})
+    store._db.execute("UPDATE schema_snapshots SET format = format - 1")
+    assert store.load("h:3306/db") is None
+
+
+def test_background_warm_up_prepares_the_first_question(tmp_path, monkeypatch):
+    monkeypatch.setenv("SQLBOT_WARMUP", "true")
+    db = FakeDatabase(n_tables=5, rows_per_table=10)
+    bot = make_bot(db, monkeypatch, str(tmp_path / "snapshot.sqlite"))
+    assert bot.wait_warm_up(timeout=10)
+    assert bot.value_index.stats()["tables"] == 5
+    assert bot.get_stage_stats()["warm_up"]["errors"] == 0
+
+    db.reset_counters()
+    bot.context.schema_agent.get_schema_dict()
+    bot.retriever.score("registros")
+    assert db.round_trips == 0
+
+
+def test_restored_schema_is_revalidated_against_the_database(tmp_path, monkeypatch):
+    path = str(tmp_path / "snapshot.sqlite")
+    db = FakeDatabase(n_tables=3)
+    make_bot(db, monkeypatch, path).warm_up(background=False)
+
+    db.add_column("tabla_0002", "categoria")
+    bot = make_bot(db, monkeypatch, path)
+    assert "categoria" not in bot.context.schema_agent.cached_schema["tabla_0002"]["columns"]
+    bot.warm_up(background=False)
+    assert "categoria" in bot.context.schema_agent.cached_schema["tabla_0002"]["columns"]
+    assert "categoria" in bot.snapshot_store.load(bot._snapshot_key(bot.context))["schema"]["schema"]["tabla_0002"]["columns"]
@@ -0,0 +1,71 @@
+import pytest
+
+from sqlcompiler import DeterministicSQLCompiler
+
+
+class SchemaStub:
+    def get_schema_dict(self):
+        return {
+            "clientes": {
+                "columns": {
+                    "id": {"type": "int"},
+                    "nombre": {"type": "varchar"},
+                    "ciudad": {"type": "varchar"},
+                    "edad": {"type": "int"},
+                    "monto": {"type": "decimal"},
+                    "fecha_registro": {"type": "datetime"},
+                }
+            }
+        }
+
+
+@pytest.fixture
+def compiler():
+    return DeterministicSQLCompiler(SchemaStub())
+
+
+def compile_filters(compiler, filters):
+    return compiler.compile({"intencion": "listar", "tabla": "clientes", "filtros": filters})
+
+
+def test_plain_values_compile_to_equality(compiler):
+    compiled = compile_filters(compiler, {"ciudad": "Lima", "edad": 30})
+    assert compiled["sql"] == "SELECT * FROM `clientes` WHERE `ciudad` = %s AND `edad` = %s LIMIT 25;"
+    assert compiled["params"] == ["Lima", 30]
+
+
+def test_operator_dict_compiles(compiler):
+    compiled = compile_filters(compiler, {"edad": {">": 30}})
+    assert "`edad` > %s" in compiled["sql"]
+    assert compiled["params"] == [30]
+
+
+@pytest.mark.parametrize("value", ["> 30", ">=30", "mayor a 30", "más de 30", "entre 20 y 30", "menos de 5"])
+def test_condition_text_falls_back_to_llm(compiler, value):
+    assert compile_filters(compiler, {"edad": value}) is None
+
+
+@pytest.mark.parametrize("value", ["Lim%", "Lim*", "distinto de Lima"])
+def test_wildcards_and_negations_fall_back_to_llm(compiler, value):
+    assert compile_filters(compiler, {"ciudad": value}) is None
+
+
+def test_text_against_numeric_column_falls_back_to_llm(compiler):
+    assert compile_filters(compiler, {"edad": "treinta"}) is None
+    assert compile_filters(compiler, {"monto": {">": "mucho"}}) is None
+    assert compile_filters(compiler, {"edad": ["30", "cuarenta"]}) is None
+
+
+def test_numeric_text_against_numeric_column_compiles(compiler):
+    assert compile_filters(compiler, {"edad": "30"})["params"] == ["30"]
+
+
+def test_dates_only_accept_date_literals(compiler):
+    assert compile_filters(compiler, {"fecha_registro": "2024-03-01"})["params"] == ["2024-03-01"]
+    assert compile_filters(compiler, {"fecha_registro": "marzo"}) is None
+
+
+def test_disabled_compiler_always_falls_back():
+    compiler = DeterministicSQLCompiler(SchemaStub(), enabled=False)
+    assert compile_filters(compiler, {"ciudad": "Lima"}) is None
+    assert compiler.stats()["fallback"] == 1
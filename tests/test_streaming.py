@@ -0,0 +1,124 @@
+import json
+
+import pytest
+
+from costguard import is_read_only
+from fakedb import FakeDatabase
+from fakellm import FakeLLM
+from streaming import SQLStatementDetector
+from backend5 import SQLBot
+
+
+def detect(text, chunk_size=1, json_key=False):
+    """Alimenta el detector por trozos y retorna (sentencia, trozos consumidos hasta detectarla)."""
+    detector = SQLStatementDetector(json_key=json_key)
+    for i in range(0, len(text), chunk_size):
+        statement = detector.feed(text[i:i + chunk_size])
+        if statement is not None:
+            return statement, i + chunk_size
+    return detector.statement, len(text)
+
+
+@pytest.mark.parametrize("chunk_size", [1, 3, 100])
+@pytest.mark.parametrize("text, expected", [
+    ("SELECT * FROM t; y una explicación", "SELECT * FROM t;"),
+    ("SELECT * FROM t WHERE a = 'x;y'; fin", "SELECT * FROM t WHERE a = 'x;y';"),
+    ('SELECT * FROM t WHERE a = "x;y"; fin', 'SELECT * FROM t WHERE a = "x;y";'),
+    ("SELECT * FROM t WHERE a = 'it\\'s;'; fin", "SELECT * FROM t WHERE a = 'it\\'s;';"),
+    ("SELECT `a;b` FROM t; fin", "SELECT `a;b` FROM t;"),
+    ("SELECT a -- ojo; no termina\nFROM t; fin", "SELECT a -- ojo; no termina\nFROM t;"),
+    ("SELECT a # ojo;\nFROM t; fin", "SELECT a # ojo;\nFROM t;"),
+    ("SELECT a /* ; */ FROM t; fin", "SELECT a /* ; */ FROM t;"),
+    ("```sql\nSELECT * FROM t;\n```", "SELECT * FROM t;"),
+    ("  \n```\nSELECT 1;\n```", "SELECT 1;"),
+])
+def test_detects_first_statement(text, expected, chunk_size):
+    assert detect(text, chunk_size)[0] == expected
+
+
+def test_detects_before_trailing_text():
+    text = "SELECT * FROM t;" + " explicación larga" * 20
+    statement, consumed = detect(text)
+    assert statement == "SELECT * FROM t;"
+    assert consumed == len("SELECT * FROM t;")
+
+
+def test_no_statement_without_terminator():
+    assert detect("SELECT * FROM t WHERE a = ';'")[0] is None
+
+
+@pytest.mark.parametrize("chunk_size", [1, 2, 7, 100])
+def test_json_value_with_escapes(chunk_size):
+    sql = 'SELECT * FROM t WHERE a = "x" AND b = \'\\\\\' AND c = \'é\';'
+    text = json.dumps({"intencion": "listar", "tabla": "t", "sql": sql, "nota": "otra; cosa"})
+    assert detect(text, chunk_size, json_key=True)[0] == sql
+
+
+def test_json_unicode_escape_and_newline():
+    text = '{"sql": "SELECT *\\nFROM t WHERE c = \'\\u00e9\'; ", "tabla": "t"}'
+    assert detect(text, 1, json_key=True)[0] == "SELECT *\nFROM t WHERE c = 'é';"
+
+
+def test_json_value_without_terminator_is_the_whole_value():
+    text = json.dumps({"tabla": "t", "sql": "SELECT COUNT(*) FROM t", "filtros": {}})
+    assert detect(text, 4, json_key=True)[0] == "SELECT COUNT(*) FROM t;"
+
+
+def test_json_text_outside_the_value_is_ignored():
+    text = '{"nota": "SELECT 1;", "sql": "SELECT 2;"}'
+    assert detect(text, 1, json_key=True)[0] == "SELECT 2;"
+
+
+@pytest.mark.parametrize("sql, expected", [
+    ("SELECT * FROM t;", True),
+    ("WITH x AS (SELECT 1) SELECT * FROM x;", True),
+    ("SELECT * FROM t WHERE a = 'delete; update';", True),
+    ("SELECT `update` FROM t;", True),
+    ("WITH x AS (SELECT id FROM t) UPDATE t SET a = 1;", False),
+    ("WITH x AS (SELECT 1) DELETE FROM t;", False),
+    ("SELECT * FROM t FOR UPDATE;", False),
+    ("SELECT * INTO OUTFILE '/tmp/x' FROM t;", False),
+    ("SELECT 1; DROP TABLE t;", False),
+    ("DELETE FROM t;", False),
+])
+def test_is_read_only(sql, expected):
+    assert is_read_only(sql) is expected
+
+
+class TrailingCommentLLM(FakeLLM):
+    """En modo de una sola llamada, el SQL llega con texto tras el ';': la sentencia definitiva es otra."""
+    def _respond(self, prompt):
+        if '"sql"' in prompt and "Pregunta:" in prompt:
+            structure = {"intencion": "listar", "tabla": "tabla_0001", "filtros": {}}
+            return json.dumps({**structure, "sql": "SELECT * FROM tabla_0001; -- fin"})
+        return super()._respond(prompt)
+
+
+def test_discarded_early_statement_resets_the_preview():
+    db = FakeDatabase(n_tables=3, rows_per_table=20, db_name="demo")
+    bot = SQLBot(llm=TrailingCommentLLM(), connect=db.connect)
+    bot.update_credentials(db_name="demo")
+    bot.tracer.reset()
+
+    events = list(bot.stream_query("Lista los registros de tabla_0001", fused=True))
+    kinds = [event["event"] for event in events if event["event"] != "token"]
+
+    assert kinds[:1] == ["sql"] and "reset" in kinds
+    after_reset = kinds[kinds.index("reset") + 1:]
+    # Tras el reset solo llegan eventos de la sentencia definitiva
+    assert after_reset[0] == "sql"
+    assert kinds[-1] == "response"
+    assert bot.get_stage_stats().get("time_to_first_row", {"count": 0})["count"] <= 1
+
+
+def test_streamed_response_matches_process_query():
+    db = FakeDatabase(n_tables=3, rows_per_table=20, db_name="demo")
+    bot = SQLBot(llm=FakeLLM(), connect=db.connect)
+    bot.update_credentials(db_name="demo")
+    question = "¿Cuántos registros hay en la tabla tabla_0002?"
+    events = list(bot.stream_query(question, answer=True))
+    response = events[-1]["response"]
+    assert [e["event"] for e in events if e["event"] != "token"] == ["sql", "rows", "response"]
+    assert response["success"] and response["answer"]
+    assert response["sql_query"] == bot.process_query(question)["sql_query"]
+    assert bot.get_stage_stats()["time_to_first_row"]["count"] == 1
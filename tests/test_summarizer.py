@@ -0,0 +1,46 @@
+import time
+
+from conection import DatabaseSchemaAgent
+from fakedb import FakeDatabase
+from TableDataSummarizer import TableDataSummarizer
+
+
+def make_summarizer(db, **kwargs):
+    schema_agent = DatabaseSchemaAgent(db.connect, db.db_name, cache_ttl=0)
+    schema_agent.get_schema_dict()
+    return schema_agent, TableDataSummarizer(schema_agent, db.connect, **kwargs)
+
+
+def test_summary_lists_columns_and_sample_rows():
+    _, summarizer = make_summarizer(FakeDatabase(n_tables=2, rows_per_table=10), max_rows=3)
+    summary = summarizer.get_all_tables_summary(["tabla_0001"])
+    assert "=== Tabla: tabla_0001 ===" in summary and "=== Tabla: tabla_0000 ===" not in summary
+    assert "Columnas: id (int), nombre (varchar)" in summary
+    assert "Registro 3 de tabla_0001" in summary and "Registro 4 de" not in summary
+
+
+def test_tables_are_sampled_in_parallel():
+    db = FakeDatabase(n_tables=8, rows_per_table=5)
+    _, summarizer = make_summarizer(db, max_workers=8)
+    db.latency = 0.05
+    start = time.perf_counter()
+    samples = summarizer.fetch_samples([f"tabla_{i:04d}" for i in range(8)])
+    assert len(samples) == 8
+    assert time.perf_counter() - start < 8 * 0.05 * 0.6
+
+
+def test_samples_are_cached_until_the_table_changes():
+    db = FakeDatabase(n_tables=3, rows_per_table=5)
+    schema_agent, summarizer = make_summarizer(db)
+    tables = ["tabla_0000", "tabla_0001", "tabla_0002"]
+    summarizer.fetch_samples(tables)
+
+    db.reset_counters()
+    summarizer.fetch_samples(tables)
+    assert db.round_trips == 0
+
+    db.touch("tabla_0001")
+    schema_agent.refresh()
+    db.reset_counters()
+    summarizer.fetch_samples(tables)
+    assert db.round_trips == 1
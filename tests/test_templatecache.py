@@ -0,0 +1,87 @@
+from backend5 import SQLBot
+from fakedb import FakeDatabase
+from fakellm import FakeLLM
+from templatecache import QueryTemplateCache
+
+
+class Schema:
+    schema_fingerprint = "fp1"
+
+    def get_schema_dict(self):
+        return {}
+
+
+def ask(cache, question, sql, params=None):
+    match = cache.lookup(question)
+    assert match["sql"] is None
+    return cache.store(match, sql, params)
+
+
+def test_literals_are_replaced_by_their_kind():
+    cache = QueryTemplateCache(Schema())
+    shape, literals = cache.extract('pedidos de "Ana" desde 05/03/2024 mayores a 1,5')
+    assert shape == "pedidos de <texto> desde <fecha> mayores a <numero>"
+    assert [l["value"] for l in literals] == ["Ana", "2024-03-05", 1.5]
+    assert cache.extract("pedidos desde 2024-3-5")[1][0]["value"] == "2024-03-05"
+
+
+def test_near_duplicate_questions_reuse_the_sql():
+    cache = QueryTemplateCache(Schema())
+    assert ask(cache, "usuarios mayores de 30", "SELECT * FROM usuarios WHERE edad > 30 LIMIT 25;")
+    match = cache.lookup("Usuarios mayores de 45")
+    assert match["sql"] == "SELECT * FROM usuarios WHERE edad > %s LIMIT 25;"
+    assert match["params"] == [45]
+    assert cache.stats()["hits"] == 1
+
+
+def test_literals_inside_like_patterns_keep_their_wildcards():
+    cache = QueryTemplateCache(Schema())
+    assert ask(cache, "clientes llamados 'Ana'", "SELECT * FROM clientes WHERE nombre LIKE '%Ana%' AND id > 0")
+    match = cache.lookup("clientes llamados 'Luis'")
+    assert match["sql"] == "SELECT * FROM clientes WHERE nombre LIKE %s AND id > 0"
+    assert match["params"] == ["%Luis%"]
+
+
+def test_parameterized_sql_keeps_fixed_parameters():
+    cache = QueryTemplateCache(Schema())
+    assert ask(cache, "usuarios mayores de 30", "SELECT * FROM usuarios WHERE edad > %s AND activo = %s", [30, 1])
+    assert cache.lookup("usuarios mayores de 60")["params"] == [60, 1]
+
+
+def test_ambiguous_literals_are_not_stored():
+    cache = QueryTemplateCache(Schema())
+    assert not ask(cache, "usuarios mayores de 30", "SELECT * FROM usuarios WHERE edad > 30 OR puntos > 30")
+    assert not ask(cache, "usuarios mayores de 30", "SELECT * FROM usuarios")
+    assert cache.stats()["unbound"] == 2 and cache.stats()["entries"] == 0
+
+
+def test_schema_change_discards_templates():
+    schema = Schema()
+    cache = QueryTemplateCache(schema)
+    ask(cache, "usuarios mayores de 30", "SELECT * FROM usuarios WHERE edad > 30")
+    schema.schema_fingerprint = "fp2"
+    assert cache.lookup("usuarios mayores de 45")["sql"] is None
+    assert cache.stats()["invalidated"] == 1
+
+
+def test_least_recently_used_templates_are_evicted():
+    cache = QueryTemplateCache(Schema(), max_entries=2)
+    ask(cache, "usuarios mayores de 30", "SELECT * FROM usuarios WHERE edad > 30")
+    ask(cache, "pedidos sobre 100", "SELECT * FROM pedidos WHERE total > 100")
+    cache.lookup("usuarios mayores de 31")
+    ask(cache, "productos bajo 5", "SELECT * FROM productos WHERE precio < 5")
+    assert cache.lookup("pedidos sobre 200")["sql"] is None
+    assert cache.lookup("usuarios mayores de 32")["sql"] is not None
+
+
+def test_bot_answers_a_known_question_shape_without_the_llm():
+    llm = FakeLLM()
+    bot = SQLBot(llm=llm, connect=FakeDatabase(n_tables=3, rows_per_table=30).connect)
+    bot.update_credentials(db_name="fake")
+    bot.warm_up(background=False)  # Índice de valores listo: "Lima" se reconoce como ciudad
+    first = bot.process_query("Lista los registros de Lima en tabla_0001")
+    calls = llm.calls
+    second = bot.process_query("Lista los registros de Cusco en tabla_0001")
+    assert llm.calls == calls
+    assert "'Cusco'" in second["sql_query"] and "'Lima'" in first["sql_query"]
+    assert set(second["data"]["ciudad"]) == {"Cusco"}
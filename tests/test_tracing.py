@@ -0,0 +1,69 @@
+import json
+
+import pytest
+
+from backend5 import SQLBot
+from fakedb import FakeDatabase
+from fakellm import FakeLLM
+from tracing import Tracer, annotate, span
+
+
+def test_nested_spans_form_one_trace():
+    tracer = Tracer()
+    with tracer.span("process_query"):
+        with span("execute") as stage:
+            stage.set(rows=3, cache_hit=False)
+        annotate(fused=False)
+    trace = tracer.recent_traces()[0]
+    assert trace["name"] == "process_query" and trace["attrs"] == {"fused": False}
+    assert [child["name"] for child in trace["children"]] == ["execute"]
+
+
+def test_span_helper_is_a_no_op_outside_a_trace():
+    with span("connect") as stage:
+        assert stage is None
+    annotate(rows=1)
+
+
+def test_percentiles_use_the_moving_window():
+    tracer = Tracer(window=4)
+    for seconds in (9.0, 1.0, 2.0, 3.0, 4.0):
+        tracer.record("execute", seconds)
+    stats = tracer.snapshot()["execute"]
+    assert stats["count"] == 5 and stats["sum"] == 19.0
+    assert (stats["p50"], stats["p99"], stats["max"], stats["window"]) == (2.0, 4.0, 4.0, 4)
+
+
+def test_counters_and_errors_are_accumulated():
+    tracer = Tracer()
+    for hit in (True, False, True):
+        tracer.record("interpret", 0.1, cache_hit=hit, prompt_tokens=10)
+    with pytest.raises(ValueError):
+        with tracer.span("execute"):
+            raise ValueError("fallo")
+    stats = tracer.snapshot()
+    assert (stats["interpret"]["cache_hits"], stats["interpret"]["cache_misses"]) == (2, 1)
+    assert stats["interpret"]["prompt_tokens"] == 30
+    assert stats["execute"]["errors"] == 1
+
+
+def test_exports():
+    tracer = Tracer(prefix="demo")
+    tracer.record("execute", 0.5, rows=7)
+    assert json.loads(tracer.export_json())["execute"]["rows"] == 7
+    text = tracer.export_prometheus()
+    assert '# TYPE demo_stage_duration_seconds summary' in text
+    assert 'demo_stage_duration_seconds{stage="execute",quantile="0.95"} 0.500000' in text
+    assert 'demo_stage_duration_seconds_count{stage="execute"} 1' in text
+    assert 'demo_stage_rows_total{stage="execute"} 7' in text
+
+
+def test_pipeline_records_stages_and_tokens(monkeypatch):
+    monkeypatch.setenv("TEMPLATE_CACHE_MAX_ENTRIES", "0")
+    bot = SQLBot(llm=FakeLLM(), connect=FakeDatabase(n_tables=3, rows_per_table=5).connect)
+    bot.update_credentials(db_name="fake")
+    bot.process_query("Lista los registros de Lima en tabla_0001")
+    stats = bot.get_stage_stats()
+    assert {"process_query", "interpret", "compile", "cost_guard", "execute"} <= set(stats)
+    assert stats["interpret"]["prompt_tokens"] > 0 and stats["interpret"]["completion_tokens"] > 0
+    assert stats["execute"]["rows"] > 0
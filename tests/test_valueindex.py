@@ -0,0 +1,87 @@
+import threading
+
+from conection import DatabaseSchemaAgent
+from fakedb import FakeDatabase
+from valueindex import ValueIndex
+
+
+def make_index(db, **kwargs):
+    schema_agent = DatabaseSchemaAgent(db.connect, db.db_name, cache_ttl=0)
+    return schema_agent, ValueIndex(schema_agent, db.connect, **kwargs)
+
+
+def add_city(db, table, city):
+    db._master.execute(f"UPDATE {table} SET ciudad = ? WHERE id = 1", (city,))
+    db._master.commit()
+    db.touch(table)
+
+
+def test_literals_resolve_to_table_and_column():
+    _, index = make_index(FakeDatabase(n_tables=2))
+    hints = index.resolve("clientes de arequipa")
+    assert hints[0]["literal"] == "arequipa"
+    assert {(c["table"], c["column"], c["value"]) for c in hints[0]["candidates"]} == {
+        ("tabla_0000", "ciudad", "Arequipa"), ("tabla_0001", "ciudad", "Arequipa")
+    }
+
+
+def test_data_writes_within_the_interval_do_not_rebuild():
+    db = FakeDatabase(n_tables=2)
+    _, index = make_index(db, refresh_interval=3600)
+    index.refresh()
+    built = index.metrics["built"]
+
+    add_city(db, "tabla_0000", "Huancayo")
+    index.refresh()
+    index.wait()
+    assert index.metrics["built"] == built
+    assert index.lookup("Huancayo") == []
+
+
+def test_stale_tables_rebuild_in_background_while_the_index_keeps_serving():
+    db = FakeDatabase(n_tables=2)
+    _, index = make_index(db, refresh_interval=0)
+    index.refresh()
+
+    add_city(db, "tabla_0000", "Huancayo")
+    release = threading.Event()
+    original = index._index_table
+
+    def slow_index_table(table, details):
+        release.wait(5)
+        return original(table, details)
+
+    index._index_table = slow_index_table
+    index.refresh()  # No espera la reconstrucción
+    assert index.lookup("Lima")
+    assert index.lookup("Huancayo") == []
+
+    release.set()
+    index.wait()
+    assert index.lookup("Huancayo")[0]["table"] == "tabla_0000"
+    assert index.metrics["background_refreshes"] == 1
+
+
+def test_ddl_changes_rebuild_only_that_table():
+    db = FakeDatabase(n_tables=3)
+    _, index = make_index(db, refresh_interval=3600)
+    index.refresh()
+    built = index.metrics["built"]
+
+    db.add_column("tabla_0001", "categoria")
+    index.refresh()
+    index.wait()
+    assert index.metrics["built"] == built + 1
+
+
+def test_same_database_name_on_two_servers_does_not_collide(tmp_path):
+    path = str(tmp_path / "values.sqlite")
+    a, b = FakeDatabase(n_tables=1, db_name="tienda"), FakeDatabase(n_tables=1, db_name="tienda")
+    add_city(b, "tabla_0000", "Huancayo")
+    make_index(a, path=path, db_key="a:3306/tienda")[1].refresh()
+    make_index(b, path=path, db_key="b:3306/tienda")[1].refresh()
+
+    _, index = make_index(a, path=path, db_key="a:3306/tienda")
+    index.refresh()
+    assert index.metrics["disk_hits"] == 1 and index.metrics["built"] == 0
+    assert index.lookup("Huancayo") == []